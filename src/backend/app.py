@@ -1,16 +1,14 @@
+import time
+STARTUP_BEGAN = time.perf_counter()
+
 from platform import processor
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from flask_caching import Cache
 import pandas as pd
 import numpy as np
-from scipy.cluster.hierarchy import dendrogram, linkage
-from scipy.spatial.distance import pdist
-from scipy import stats
 import json
 import logging
 import datetime
-import time
 import os
 import requests
 from typing import List, Dict, Any
@@ -19,23 +17,45 @@ from werkzeug.utils import secure_filename
 from config import (
     DEFAULT_TOP_N_GENES,
     GENOMIC_TOOLS,
-    TOOL_PATHS
+    TOOL_PATHS,
+    configure_logging,
+    ensure_directories
 )
 from utils import (
     create_response,
     get_cached_results,
     save_tool_results,
+    tool_cache,
     validate_genes,
 )
 
-from config import DEFAULT_TOP_N_GENES
-from data_processor import DataProcessor
-
-# Enhanced logging setup
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from config import (
+    DEFAULT_DE_ENGINE,
+    DEFAULT_TOP_N_GENES,
+    RESPONSE_CACHE_BACKEND,
+    VOLCANO_BINS,
+    VOLCANO_MAX_BINS,
+    VOLCANO_POINT_BUDGET
 )
+from data_processor import DataProcessor
+from differential_expression import validate_engine
+from enrichr import EnrichrClient, EnrichrError
+from local_enrichment import LocalEnrichment
+from heatmap_tiles import bin_labels
+from http_cache import body_cache, compress_response, conditional
+from clustering import validate_params as validate_clustering_params
+import gene_symbols
+from jobs import SUCCEEDED
+from serialization import json_response, matrix_response, negotiate_matrix_format
+from startup import StartupTimer
+
+# Cost of each startup phase, logged once and served by /api/health
+startup = StartupTimer(STARTUP_BEGAN)
+startup.mark('imports')
+
+ensure_directories()
+configure_logging()
+startup.mark('directories and logging')
 
 GENOMIC_TOOL_URLS = {
     'string': 'https://string-db.org/',
@@ -62,7 +82,10 @@ CORS(app, resources={
     }
 })
 
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
+@app.after_request
+def compress_body(response):
+    # Views under @conditional are compressed before their body is cached
+    return compress_response(response)
 
 @app.errorhandler(400)
 def bad_request(e):
@@ -79,12 +102,14 @@ def handle_exception(e):
 
 # Initialize DataProcessor
 data_processor = DataProcessor()
+startup.mark('data processor')
 
-# Constants
-MAX_RETRIES = 3
-DELAY_BETWEEN_RETRIES = 5
-ENRICHR_ADD_LIST_URL = 'https://maayanlab.cloud/Enrichr/addList'
-ENRICHR_ENRICH_URL = 'https://maayanlab.cloud/Enrichr/enrich'
+# Pooled Enrichr client; gene lists are uploaded once per gene set
+enrichr_client = EnrichrClient(cache=tool_cache)
+# Offline over-representation analysis against GMT libraries in GENE_SET_DIR
+local_enrichment = LocalEnrichment()
+ENRICHMENT_SOURCES = ('enrichr', 'local')
+startup.mark('enrichment clients')
 
 def get_data_path(filename):
     """Helper function to get the correct data file path"""
@@ -92,31 +117,70 @@ def get_data_path(filename):
     logging.debug(f"Accessing file: {path}")
     return path
 
-def extract_significant_genes():
+def requested_engine():
+    """Differential expression engine from ?engine= or the JSON body"""
+    engine = request.args.get('engine')
+    if engine is None and request.is_json:
+        engine = (request.get_json(silent=True) or {}).get('engine')
+    engine = engine or DEFAULT_DE_ENGINE
+    validate_engine(engine)
+    return engine
+
+def requested_contrast():
+    """Contrast name ('<numerator>_vs_<denominator>') from ?contrast= or the JSON body"""
+    contrast = request.args.get('contrast')
+    if contrast is None and request.is_json:
+        contrast = (request.get_json(silent=True) or {}).get('contrast')
+    return contrast or None
+
+def numeric_arg(name, cast=float, default=None):
+    """Query parameter parsed with cast; malformed values raise instead of being dropped"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+def requested_contrasts():
+    """Contrasts for a new run: 'all', a comma-separated query list or a JSON list"""
+    contrasts = request.args.get('contrasts')
+    if contrasts is not None:
+        return contrasts if contrasts == 'all' else [name for name in contrasts.split(',') if name]
+    if request.is_json:
+        return (request.get_json(silent=True) or {}).get('contrasts')
+    return None
+
+def requested_enrichment_source():
+    """'enrichr' (remote, default) or 'local' from ?source= or the JSON body"""
+    source = request.args.get('source')
+    if source is None and request.is_json:
+        source = (request.get_json(silent=True) or {}).get('source')
+    source = source or 'enrichr'
+    if source not in ENRICHMENT_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(ENRICHMENT_SOURCES)}")
+    return source
+
+def contrast_not_found(engine, contrast):
+    manifest = data_processor.list_contrasts(engine)
+    available = [manifest.get('default')] + list(manifest['contrasts'])
+    return jsonify({
+        "error": f"No {engine} results for contrast '{contrast}'",
+        "available_contrasts": [name for name in available if name]
+    }), 404
+
+def extract_significant_genes(engine=DEFAULT_DE_ENGINE, contrast=None):
     """Extract significant genes with improved filtering"""
     try:
-        deseq2_file = get_data_path("deseq2_results.json")
+        deseq2_file = str(data_processor.results_path(engine, contrast))
         if not os.path.exists(deseq2_file):
             raise FileNotFoundError("DESeq2 results file not found")
 
-        with open(deseq2_file, 'r') as f:
-            deseq2_results = json.load(f)
-
-        # Add validation of DESeq2 results
-        if not isinstance(deseq2_results, list):
-            raise ValueError("Invalid DESeq2 results format")
-
-        # More stringent filtering
-        significant_genes = []
-        for gene in deseq2_results:
-            if not all(k in gene for k in ['gene', 'adjusted_p_value', 'log2_fold_change']):
-                continue
-                
-            if (gene['adjusted_p_value'] is not None and 
-                gene['log2_fold_change'] is not None and
-                gene['adjusted_p_value'] < 0.05 and 
-                abs(gene['log2_fold_change']) > 1):
-                significant_genes.append(str(gene['gene']))
+        # More stringent filtering, answered from the padj/|log2FC| indexes
+        table = data_processor.results_store.get(deseq2_file)
+        rows, _ = table.query(padj_max=0.05, lfc_min=1)
+        significant_genes = table.genes[np.sort(rows)].tolist()
 
         logging.info(f"Found {len(significant_genes)} significant genes")
         return significant_genes
@@ -125,21 +189,6 @@ def extract_significant_genes():
         logging.error(f"Error extracting significant genes: {str(e)}", exc_info=True)
         return []
 
-def submit_to_enrichr(payload):
-    retries = 0
-    while retries < MAX_RETRIES:
-        try:
-            response = requests.post(ENRICHR_ADD_LIST_URL, files=payload, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except HTTPError as e:
-            if response.status_code == 429:
-                retries += 1
-                time.sleep(DELAY_BETWEEN_RETRIES)
-                continue
-            raise e
-    raise Exception("Max retries exceeded for Enrichr submission.")
-
 @app.route('/api/debug-paths', methods=['GET'])
 def debug_paths():
     try:
@@ -161,12 +210,13 @@ def debug_paths():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/data')
+@conditional(data_processor.expression_files)
 def get_data():
     try:
-        log_data = pd.read_csv(get_data_path("log_transformed_data.csv"), index_col=0)
+        matrix = data_processor.expression_store.get()
         data_dict = {
-            'genes': log_data.index.tolist(),
-            'samples': log_data.columns.tolist()
+            'genes': matrix.genes.tolist(),
+            'samples': matrix.samples.tolist()
         }
         return jsonify(data_dict)
     except Exception as e:
@@ -174,30 +224,80 @@ def get_data():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/expression_values', methods=['GET'])
+@conditional(data_processor.expression_files)
 def get_expression_values():
+    """Return a window of the expression matrix.
+
+    Query parameters (all optional): offset, limit, gene (substring filter),
+    samples (comma-separated subset), sort_by (sample name) and order
+    (asc/desc). Without parameters the full matrix is returned.
+    """
     try:
-        log_data = pd.read_csv(get_data_path("log_transformed_data.csv"), index_col=0)
-        expression_values = log_data.values.tolist()
-        return jsonify({'expression_values': expression_values})
+        offset = request.args.get('offset', default=0, type=int)
+        limit = request.args.get('limit', default=None, type=int)
+        gene_filter = request.args.get('gene', default='').strip()
+        samples_arg = request.args.get('samples', default='')
+        samples = [s.strip() for s in samples_arg.split(',') if s.strip()]
+        sort_by = request.args.get('sort_by') or None
+        order = request.args.get('order', default='asc').lower()
+        if order not in ('asc', 'desc'):
+            return jsonify({"error": "order must be 'asc' or 'desc'"}), 400
+
+        matrix = data_processor.expression_store.get()
+        try:
+            fmt = negotiate_matrix_format()
+            window, matched_genes = matrix.query(
+                gene_filter=gene_filter,
+                samples=samples,
+                sort_by=sort_by,
+                descending=order == 'desc',
+                offset=offset,
+                limit=limit
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return matrix_response({
+            'expression_values': window.to_numpy(),
+            'genes': window.index,
+            'samples': window.columns,
+            'offset': offset,
+            'limit': limit,
+            'matched_genes': matched_genes,
+            'total_genes': matrix.shape[0],
+            'total_samples': matrix.shape[1]
+        }, matrix_key='expression_values', decimals=request.args.get('decimals', type=int), fmt=fmt)
     except Exception as e:
         logging.error(f"Error in get_expression_values: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/top-expressed', methods=['GET'])
+@conditional(lambda: data_processor.result_files(requested_engine(), requested_contrast()))
 def get_top_expressed():
     try:
         # Get number of genes from query parameter
         top_n = request.args.get('top_n', default=DEFAULT_TOP_N_GENES, type=int)
+        contrast = requested_contrast()
+        try:
+            engine = requested_engine()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Check if DESeq2 results exist, if not run the analysis
-        deseq2_results_path = data_processor.data_dir / "deseq2_results.json"
+        # Check if results exist, if not queue the analysis
+        deseq2_results_path = data_processor.results_path(engine, contrast)
         if not deseq2_results_path.exists():
-            success = data_processor.run_deseq2_analysis()
-            if not success:
-                return jsonify({'error': 'Failed to run DESeq2 analysis'}), 500
+            try:
+                job, deduplicated = data_processor.submit_deseq2_analysis(engine, [contrast] if contrast else None)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({
+                'message': f'{engine} analysis queued; poll the job and retry when it succeeds',
+                'job': job.to_dict(),
+                'deduplicated': deduplicated
+            }), 202
         
         # Get top expressed genes
-        results = data_processor.get_top_expressed_genes(top_n=top_n)
+        results = data_processor.get_top_expressed_genes(top_n=top_n, engine=engine, contrast=contrast)
         
         return jsonify(results)
         
@@ -208,51 +308,99 @@ def get_top_expressed():
         app.logger.error(f"Error in top_expressed endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
     
+@app.route('/api/jobs/deseq2', methods=['POST'])
+def submit_deseq2_job():
+    try:
+        try:
+            engine = requested_engine()
+            job, deduplicated = data_processor.submit_deseq2_analysis(engine, requested_contrasts())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'job': job.to_dict(), 'deduplicated': deduplicated}), 202
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        app.logger.error(f"Error submitting DESeq2 job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': [job.to_dict() for job in data_processor.jobs.list()]})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = data_processor.jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job '{job_id}'"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = data_processor.jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job '{job_id}'"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    try:
+        job = data_processor.jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': f"Unknown job '{job_id}'"}), 404
+        if job.status != SUCCEEDED:
+            return jsonify({'error': f"Job is {job.status}", 'job': job.to_dict()}), 409
+
+        with open(job.result, 'r') as f:
+            results = json.load(f)
+        return json_response({'job': job.to_dict(), 'results': results})
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        app.logger.error(f"Error reading job result: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/clustering', methods=['GET'])
+@conditional(data_processor.expression_files)
 def get_clustering():
     try:
-        # Load expression data
-        log_data = pd.read_csv(get_data_path("log_transformed_data.csv"), index_col=0)
-        logging.info(f"Loaded expression data shape: {log_data.shape}")
+        try:
+            fmt = negotiate_matrix_format()
+            top_n_genes, metric, method, strategy = clustering_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Filter top variable genes
-        top_n_genes = int(request.args.get('top_n_genes', 500))
-        filtered_data = data_processor.filter_top_variable_genes(log_data, top_n=top_n_genes)
-        logging.info(f"Filtered data shape: {filtered_data.shape}")
+        log_data = data_processor.expression_store.get()
+        logging.info(f"Loaded expression data shape: {log_data.shape}")
 
-        # Normalize with Z-scores
-        zscore_data = pd.DataFrame(
-            stats.zscore(filtered_data, axis=1),
-            index=filtered_data.index,
-            columns=filtered_data.columns
+        # Cached per dataset version, top_n_genes, metric and linkage method
+        clustered, cache_hit = data_processor.cluster_top_variable_genes(
+            top_n=top_n_genes,
+            metric=metric,
+            method=method,
+            strategy=strategy
         )
-
-        # Perform hierarchical clustering
-        gene_distances = pdist(zscore_data.values, metric='correlation')
-        sample_distances = pdist(zscore_data.values.T, metric='correlation')
-
-        gene_linkage = linkage(gene_distances, method='average')
-        sample_linkage = linkage(sample_distances, method='average')
-
-        gene_dendrogram = dendrogram(gene_linkage, no_plot=True)
-        sample_dendrogram = dendrogram(sample_linkage, no_plot=True)
-
-        reordered_data = zscore_data.iloc[
-            gene_dendrogram['leaves'],
-            sample_dendrogram['leaves']
-        ]
+        logging.info(f"Clustered data shape: {clustered.zscores.shape} (cache {'hit' if cache_hit else 'miss'})")
 
         result = {
-            'expression_data': reordered_data.values.tolist(),
-            'genes': reordered_data.index.tolist(),
-            'samples': reordered_data.columns.tolist(),
+            'expression_data': clustered.zscores,
+            'genes': clustered.genes,
+            'samples': clustered.samples,
             'metadata': {
-                'total_genes': len(log_data.index),
-                'filtered_shape': [reordered_data.shape[0], reordered_data.shape[1]]
+                'total_genes': len(log_data.genes),
+                'filtered_shape': list(clustered.zscores.shape),
+                'metric': metric,
+                'method': method,
+                'strategy': clustered.strategy,
+                'cache': 'hit' if cache_hit else 'miss'
             }
         }
 
-        return jsonify(result)
+        return matrix_response(
+            result,
+            matrix_key='expression_data',
+            decimals=request.args.get('decimals', type=int),
+            fmt=fmt
+        )
     except Exception as e:
         logging.error(f"Error in clustering: {str(e)}", exc_info=True)
         return jsonify({
@@ -261,7 +409,85 @@ def get_clustering():
             'files_available': os.listdir(DATA_DIR) if os.path.exists(DATA_DIR) else []
         }), 500
 
+def clustering_args():
+    """top_n_genes, metric, method and strategy query parameters, validated"""
+    top_n_genes = numeric_arg('top_n_genes', int, 500)
+    metric = request.args.get('metric', 'correlation')
+    method = request.args.get('method', 'average')
+    strategy = request.args.get('strategy', 'auto')
+    validate_clustering_params(metric, method, strategy)
+    return top_n_genes, metric, method, strategy
+
+@app.route('/api/clustering/tiles', methods=['GET'])
+@conditional(data_processor.expression_files)
+def get_heatmap_tile_levels():
+    """Levels of the tiled heatmap and the leaf-ordered genes and samples"""
+    try:
+        try:
+            top_n_genes, metric, method, strategy = clustering_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        pyramid, clustered = data_processor.heatmap_pyramid(top_n_genes, metric, method, strategy)
+        return json_response({
+            'tile_size': pyramid.tile_size,
+            'levels': pyramid.describe(),
+            'genes': clustered.genes,
+            'samples': clustered.samples,
+            'metadata': {
+                'metric': metric,
+                'method': method,
+                'strategy': clustered.strategy
+            }
+        })
+    except Exception as e:
+        logging.error(f"Error in heatmap tile levels: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/clustering/tiles/<int:level>/<int:row>/<int:col>', methods=['GET'])
+@conditional(data_processor.expression_files)
+def get_heatmap_tile(level, row, col):
+    """One tile of mean-pooled z-scores; row and column count tiles from the top left"""
+    try:
+        try:
+            fmt = negotiate_matrix_format()
+            top_n_genes, metric, method, strategy = clustering_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        pyramid, clustered = data_processor.heatmap_pyramid(top_n_genes, metric, method, strategy)
+        try:
+            values, extent = pyramid.tile(level, row, col)
+        except IndexError as e:
+            return jsonify({"error": str(e)}), 404
+
+        result = {
+            'values': values,
+            'level': level,
+            'row': row,
+            'col': col,
+            **extent
+        }
+        # Pooled rows and columns are labelled with the leaves they cover
+        result['genes'] = bin_labels(
+            clustered.genes, extent['gene_start'], extent['gene_stop'], pyramid.gene_bins[level]
+        )
+        result['samples'] = bin_labels(
+            clustered.samples, extent['sample_start'], extent['sample_stop'], pyramid.sample_bins[level]
+        )
+
+        return matrix_response(
+            result,
+            matrix_key='values',
+            decimals=request.args.get('decimals', type=int),
+            fmt=fmt
+        )
+    except Exception as e:
+        logging.error(f"Error in heatmap tile: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/design_info')
+@conditional(lambda: [get_data_path('experiment_design.csv')])
 def get_design_info():
     try:
         design_file = get_data_path("experiment_design.csv")
@@ -300,20 +526,16 @@ def upload_raw_counts():
         if not file.filename.endswith('.csv'):
             return jsonify({"error": "Invalid file type. Please upload a CSV file"}), 400
 
-        try:
-            df = pd.read_csv(file, index_col=0)
-        except Exception as e:
-            return jsonify({"error": f"Error reading file: {str(e)}"}), 400
-
-        success, message, results = data_processor.process_upload(df)
+        # Streams the file into raw_counts and log_transformed_data; the CSV
+        # copies are kept for the R script, Python readers use the binary ones
+        success, message, results = data_processor.process_upload(file.stream)
         if not success:
             return jsonify({"error": message}), 400
 
-        raw_counts_path = get_data_path('raw_counts.csv')
-        log_data_path = get_data_path('log_transformed_data.csv')
-        
-        results['raw_filtered'].to_csv(raw_counts_path)
-        results['log_transformed'].to_csv(log_data_path)
+        # Swap the new matrix into the shared store
+        data_processor.expression_store.reload()
+        data_processor.clustering_cache.clear()
+        data_processor.tile_cache.clear()
 
         return jsonify({
             "message": "Raw counts file processed successfully",
@@ -345,8 +567,8 @@ def upload_design():
         if df['sample'].duplicated().any():
             return jsonify({"error": "Duplicate sample names found in design file"}), 400
         
-        expression_data = pd.read_csv(get_data_path("log_transformed_data.csv"), index_col=0)
-        missing_samples = set(df['sample']) - set(expression_data.columns)
+        expression_data = data_processor.expression_store.get()
+        missing_samples = set(df['sample']) - set(expression_data.samples)
         if missing_samples:
             return jsonify({
                 "error": f"Some samples in design file not found in expression data: {', '.join(missing_samples)}"
@@ -369,40 +591,146 @@ def upload_design():
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/deseq2', methods=['GET'])
+@conditional(lambda: data_processor.result_files(requested_engine(), requested_contrast()))
 def get_deseq2_results():
     try:
-        deseq2_file = get_data_path("deseq2_results.json")
+        try:
+            engine = requested_engine()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        contrast = requested_contrast()
+        deseq2_file = str(data_processor.results_path(engine, contrast))
         if not os.path.exists(deseq2_file):
-            return jsonify({"error": "DESeq2 results file not found"}), 404
+            if contrast:
+                return contrast_not_found(engine, contrast)
+            return jsonify({"error": f"{engine} results file not found"}), 404
 
-        with open(deseq2_file, 'r') as f:
-            deseq2_results = json.load(f)
-            
-        return jsonify(deseq2_results)
+        table = data_processor.results_store.get(deseq2_file)
+        return Response(table.records_json(), mimetype='application/json')
         
     except Exception as e:
         logging.error(f"Error in get_deseq2_results: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/deseq2/query', methods=['GET'])
+@conditional(lambda: data_processor.result_files(requested_engine(), requested_contrast()))
+def query_deseq2_results():
+    try:
+        try:
+            engine = requested_engine()
+            padj_max = numeric_arg('padj_max')
+            pvalue_max = numeric_arg('pvalue_max')
+            lfc_min = numeric_arg('lfc_min')
+            direction = request.args.get('direction', 'both')
+            sort = request.args.get('sort', 'padj')
+            order = request.args.get('order')
+            if order not in (None, 'asc', 'desc'):
+                raise ValueError("order must be 'asc' or 'desc'")
+            offset = numeric_arg('offset', int, 0)
+            limit = numeric_arg('limit', int, 100)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        contrast = requested_contrast()
+        deseq2_file = data_processor.results_path(engine, contrast)
+        if not deseq2_file.exists():
+            if contrast:
+                return contrast_not_found(engine, contrast)
+            return jsonify({"error": f"{engine} results file not found"}), 404
+
+        table = data_processor.results_store.get(deseq2_file)
+        try:
+            rows, matched = table.query(
+                padj_max=padj_max,
+                pvalue_max=pvalue_max,
+                lfc_min=lfc_min,
+                direction=direction,
+                sort=sort,
+                descending=None if order is None else order == 'desc',
+                offset=offset,
+                limit=limit
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return json_response({
+            'results': table.records(rows),
+            'matched': matched,
+            'total': len(table),
+            'offset': offset,
+            'limit': limit
+        })
+
+    except Exception as e:
+        logging.error(f"Error in query_deseq2_results: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/deseq2/contrasts', methods=['GET'])
+@conditional(lambda: data_processor.result_files(requested_engine()))
+def get_deseq2_contrasts():
+    try:
+        engine = requested_engine()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    manifest = data_processor.list_contrasts(engine)
+    contrasts = []
+    if manifest.get('default'):
+        contrasts.append(dict(manifest['default_contrast'], name=manifest['default'], default=True))
+    contrasts += [
+        {'name': name, 'numerator': entry['numerator'], 'denominator': entry['denominator'], 'default': False}
+        for name, entry in manifest['contrasts'].items()
+    ]
+    return jsonify({'engine': engine, 'contrasts': contrasts})
+
 @app.route('/api/volcano_plot', methods=['GET'])
+@conditional(lambda: data_processor.result_files(requested_engine(), requested_contrast()))
 def get_volcano_plot():
     try:
-        deseq2_file = get_data_path("deseq2_results.json")
+        try:
+            engine = requested_engine()
+            mode = request.args.get('mode', 'full')
+            if mode not in ('full', 'lod'):
+                raise ValueError("mode must be 'full' or 'lod'")
+            bins = numeric_arg('bins', int, VOLCANO_BINS)
+            if not 1 <= bins <= VOLCANO_MAX_BINS:
+                raise ValueError(f"bins must be between 1 and {VOLCANO_MAX_BINS}")
+            pvalue_max = numeric_arg('pvalue_max', default=0.05)
+            lfc_min = numeric_arg('lfc_min', default=1.0)
+            viewport = tuple(numeric_arg(name) for name in ('x_min', 'x_max', 'y_min', 'y_max'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        contrast = requested_contrast()
+        deseq2_file = str(data_processor.results_path(engine, contrast))
         if not os.path.exists(deseq2_file):
-            return jsonify({"error": "DESeq2 results file not found"}), 404
+            if contrast:
+                return contrast_not_found(engine, contrast)
+            return jsonify({"error": f"{engine} results file not found"}), 404
         
-        # Load DESeq2 results
-        with open(deseq2_file, 'r') as f:
-            deseq2_results = pd.DataFrame(json.load(f))
+        table = data_processor.results_store.get(deseq2_file)
+
+        if mode == 'lod':
+            labels = [gene for gene in request.args.get('labels', '').split(',') if gene]
+            try:
+                volcano_data = table.volcano(
+                    bins,
+                    pvalue_max=pvalue_max,
+                    lfc_min=lfc_min,
+                    labels=labels,
+                    viewport=viewport,
+                    point_budget=VOLCANO_POINT_BUDGET
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return json_response(volcano_data, decimals=request.args.get('decimals', type=int))
         
         # Prepare volcano plot data
         volcano_data = {
-            'log2_fold_change': deseq2_results['log2_fold_change'].tolist(),
-            'p_value': deseq2_results['p_value'].tolist(),
-            'gene': deseq2_results['gene'].tolist()
+            'log2_fold_change': table.log2_fold_change,
+            'p_value': table.p_value,
+            'gene': table.genes
         }
         
-        return jsonify(volcano_data)
+        return json_response(volcano_data, decimals=request.args.get('decimals', type=int))
         
     except Exception as e:
         logging.error(f"Error in get_volcano_plot: {str(e)}", exc_info=True)
@@ -421,8 +749,14 @@ def run_enrichr_analysis():
         if not library:
             return jsonify({"error": "Missing library parameter"}), 400
 
+        try:
+            engine = requested_engine()
+            source = requested_enrichment_source()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         # Extract significant genes
-        significant_genes = extract_significant_genes()
+        significant_genes = extract_significant_genes(engine, requested_contrast())
         if not significant_genes:
             return jsonify({
                 "enrichment_results": [],
@@ -433,60 +767,25 @@ def run_enrichr_analysis():
                 }
             }), 200
 
-        genes_str = '\n'.join(significant_genes)
-
-        # Submit to Enrichr
-        enrichr_response = requests.post(
-            'https://maayanlab.cloud/Enrichr/addList',
-            files={
-                'list': (None, genes_str),
-                'description': (None, 'Gene list')
-            }
-        )
-        if enrichr_response.status_code != 200:
-            logging.error(f"Failed to submit gene list: {enrichr_response.status_code}")
-            return jsonify({
-                "error": f"Enrichr API returned status {enrichr_response.status_code}",
-                "details": enrichr_response.text
-            }), 500
-
-        try:
-            enrichr_data = enrichr_response.json()
-        except ValueError:
-            logging.error(f"Unexpected Enrichr response: {enrichr_response.text}")
-            return jsonify({
-                "error": "Enrichr API returned an unexpected response",
-                "details": enrichr_response.text
-            }), 500
-
-        user_list_id = enrichr_data.get('userListId')
-        if not user_list_id:
-            return jsonify({"error": "No userListId received from Enrichr"}), 500
-
-        # Get enrichment results
-        results_url = f"https://maayanlab.cloud/Enrichr/enrich?userListId={user_list_id}&backgroundType={library}"
-        results_response = requests.get(results_url)
-        if results_response.status_code != 200:
-            return jsonify({
-                "error": f"Enrichr API enrichment failed: {results_response.status_code}",
-                "details": results_response.text
-            }), 500
-
         try:
-            enrichment_results = results_response.json()
-        except ValueError:
-            logging.error(f"Unexpected enrichment results: {results_response.text}")
-            return jsonify({
-                "error": "Unexpected enrichment results from Enrichr",
-                "details": results_response.text
-            }), 500
+            client = local_enrichment if source == 'local' else enrichr_client
+            results, _ = client.enrich_libraries(significant_genes, [library])
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e), "available_libraries": local_enrichment.available()}), 404
+        except EnrichrError as e:
+            logging.error(f"Enrichr request failed: {str(e)}")
+            return jsonify({"error": str(e), "details": e.details}), 500
+        except requests.RequestException as e:
+            logging.error(f"Enrichr request failed: {str(e)}")
+            return jsonify({"error": f"Enrichr request failed: {str(e)}"}), 502
 
         # Format response
         return jsonify({
-            "enrichment_results": enrichment_results.get(library, []),
+            "enrichment_results": results[library],
             "metadata": {
                 "total_genes_analyzed": len(significant_genes),
                 "library_used": library,
+                "source": source,
                 "timestamp": datetime.datetime.now().isoformat()
             }
         }), 200
@@ -496,20 +795,85 @@ def run_enrichr_analysis():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/api/enrichr/batch', methods=['POST'])
+def run_enrichr_batch():
+    """Enrichment for several libraries from one gene list upload"""
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+
+        libraries = (request.get_json(silent=True) or {}).get('libraries')
+        if isinstance(libraries, str):
+            libraries = [name for name in libraries.split(',') if name]
+        if not libraries or not isinstance(libraries, list):
+            return jsonify({"error": "Missing libraries parameter"}), 400
+        libraries = list(dict.fromkeys(libraries))
+
+        try:
+            engine = requested_engine()
+            source = requested_enrichment_source()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        significant_genes = extract_significant_genes(engine, requested_contrast())
+        metadata = {
+            "total_genes_analyzed": len(significant_genes),
+            "libraries": libraries,
+            "source": source,
+            "timestamp": datetime.datetime.now().isoformat()
+        }
+        if not significant_genes:
+            return jsonify({
+                "enrichment_results": {library: [] for library in libraries},
+                "errors": {},
+                "metadata": metadata
+            }), 200
+
+        try:
+            client = local_enrichment if source == 'local' else enrichr_client
+            results, errors = client.enrich_libraries(significant_genes, libraries)
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e), "available_libraries": local_enrichment.available()}), 404
+        except EnrichrError as e:
+            logging.error(f"Enrichr request failed: {str(e)}")
+            return jsonify({"error": str(e), "details": e.details}), 500
+        except requests.RequestException as e:
+            logging.error(f"Enrichr request failed: {str(e)}")
+            return jsonify({"error": f"Enrichr request failed: {str(e)}"}), 502
+
+        return jsonify({
+            "enrichment_results": results,
+            "errors": {library: str(e) for library, e in errors.items()},
+            "metadata": metadata
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error in batch enrichment analysis: {str(e)}", exc_info=True)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/api/enrichment/libraries', methods=['GET'])
+@conditional(lambda: [local_enrichment.library_dir])
+def list_enrichment_libraries():
+    """Gene-set libraries available to source=local"""
+    return jsonify({"libraries": local_enrichment.available()})
+
+
 @app.route('/api/top_variable_genes', methods=['GET'])
+@conditional(data_processor.expression_files)
 def get_top_variable_genes():
     try:
-        log_data = pd.read_csv(get_data_path("log_transformed_data.csv"), index_col=0)
+        log_data = data_processor.expression_store.get()
         top_n = int(request.args.get('top_n', 100))
 
-        variances = log_data.var(axis=1)
-        top_variable = variances.nlargest(top_n)
+        top_rows = log_data.top_variable(top_n)
+        top_variable = pd.Series(log_data.row_variances()[top_rows], index=log_data.genes[top_rows])
 
         result = {
             'genes': top_variable.index.tolist(),
             'variances': top_variable.values.tolist(),
             'metadata': {
-                'total_genes': len(log_data.index),
+                'total_genes': len(log_data.genes),
                 'selected_genes': len(top_variable),
                 'variance_range': {
                     'min': float(top_variable.min()),
@@ -525,26 +889,58 @@ def get_top_variable_genes():
         return jsonify({"error": str(e)}), 500
 
 
-# Add utility function to validate genes
-def validate_genes(genes):
-    """Validate gene symbols against known databases"""
+@app.route('/api/genes/validate', methods=['POST'])
+def validate_gene_list():
+    """Split a gene list into approved HGNC symbols and the rest"""
     try:
-        # Check against HGNC database or similar
-        valid_genes = []
-        for gene in genes:
-            response = requests.get(
-                f"https://rest.genenames.org/fetch/symbol/{gene}",
-                headers={"Accept": "application/json"}
-            )
-            if response.ok:
-                valid_genes.append(gene)
-        return valid_genes
+        genes = (request.get_json(silent=True) or {}).get('genes')
+        if not genes or not isinstance(genes, list):
+            return jsonify({"error": "Missing genes parameter"}), 400
+        genes = [str(gene) for gene in genes]
+
+        valid, invalid = validate_genes(genes)
+        index = gene_symbols.load_index()
+        # Aliases and previous symbols with the approved symbol they map to
+        approved = {}
+        if index is not None:
+            approved = {gene: index.resolve(gene) for gene in invalid if index.resolve(gene)}
+        return jsonify({
+            "valid": valid,
+            "invalid": invalid,
+            "approved_symbols": approved,
+            "source": "local" if index is not None else "remote"
+        })
+    except requests.RequestException as e:
+        logging.error(f"Gene validation failed: {str(e)}")
+        return jsonify({"error": f"HGNC request failed: {str(e)}"}), 502
     except Exception as e:
-        app.logger.error(f"Gene validation error: {str(e)}")
-        return []
+        logging.error(f"Gene validation failed: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
 
-    
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit, miss and eviction counters and size of the shared response cache"""
+    try:
+        return jsonify({"backend": RESPONSE_CACHE_BACKEND, **body_cache.stats()})
+    except Exception as e:
+        logging.error(f"Error reading cache stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/health', methods=['GET'])
+def get_health():
+    """Startup phase timings and the cached R environment check (?refresh=1 re-runs it)"""
+    try:
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+        return jsonify({
+            "status": "ok",
+            "startup": startup.report(),
+            "r": data_processor.r_status(refresh=refresh)
+        })
+    except Exception as e:
+        logging.error(f"Health check failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/genomic-tools/redirect', methods=['GET'])
 def get_tool_url():
     """Get redirect URL for genomic tools"""
@@ -604,6 +1000,9 @@ def get_tools_info():
     })
 
 
+startup.mark('routes')
+startup.finish()
+
 
 if __name__ == '__main__':
     logging.info(f"Starting server with data directory: {DATA_DIR}")
@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    CLUSTERING_APPROX_CLUSTERS,
+    CLUSTERING_APPROX_LEAF_EXACT_MAX,
+    CLUSTERING_BLOCKED_MAX_GENES,
+    CLUSTERING_CACHE_ENTRIES,
+    CLUSTERING_EXACT_MAX_GENES
+)
+from distance import condensed_distances
+
+logger = logging.getLogger(__name__)
+
+LINKAGE_METHODS = ('single', 'complete', 'average', 'weighted', 'centroid', 'median', 'ward')
+DISTANCE_METRICS = ('correlation', 'euclidean', 'cosine', 'cityblock')
+EUCLIDEAN_ONLY_METHODS = ('centroid', 'median', 'ward')
+STRATEGIES = ('auto', 'exact', 'blocked', 'approximate')
+
+
+@dataclass(frozen=True)
+class ClusteringResult:
+    """Hierarchical clustering of the top variable genes and all samples.
+
+    For the approximate strategy gene_linkage links the k-means centroids
+    rather than individual genes; gene_leaves is always a full gene order.
+    """
+    zscores: np.ndarray  # reordered by gene_leaves x sample_leaves
+    genes: np.ndarray
+    samples: np.ndarray
+    gene_linkage: np.ndarray
+    sample_linkage: np.ndarray
+    gene_leaves: np.ndarray
+    sample_leaves: np.ndarray
+    strategy: str = 'exact'
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.zscores, index=self.genes, columns=self.samples, copy=False)
+
+
+def validate_params(metric: str, method: str, strategy: str = 'auto') -> None:
+    """Raise ValueError for unsupported metric/linkage/strategy combinations"""
+    if metric not in DISTANCE_METRICS:
+        raise ValueError(f"Unsupported metric '{metric}'. Available: {', '.join(DISTANCE_METRICS)}")
+    if method not in LINKAGE_METHODS:
+        raise ValueError(f"Unsupported linkage method '{method}'. Available: {', '.join(LINKAGE_METHODS)}")
+    if method in EUCLIDEAN_ONLY_METHODS and metric != 'euclidean':
+        raise ValueError(f"Linkage method '{method}' requires the euclidean metric")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unsupported strategy '{strategy}'. Available: {', '.join(STRATEGIES)}")
+
+
+def resolve_strategy(strategy: str, n_genes: int) -> str:
+    """Pick the concrete strategy for 'auto' based on the number of genes"""
+    if strategy != 'auto':
+        return strategy
+    if n_genes <= CLUSTERING_EXACT_MAX_GENES:
+        return 'exact'
+    if n_genes <= CLUSTERING_BLOCKED_MAX_GENES:
+        return 'blocked'
+    return 'approximate'
+
+
+def _linkage(values: np.ndarray, metric: str, method: str, dtype=np.float64) -> np.ndarray:
+    from scipy.cluster.hierarchy import linkage
+
+    # scipy's linkage needs float64 distances; float32 products are written
+    # straight into a float64 buffer rather than converted afterwards
+    condensed = condensed_distances(values, metric=metric, dtype=dtype, out_dtype=np.float64)
+    return linkage(condensed, method=method)
+
+
+def _kmeans_plus_plus(values: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """k-means++ seeding that updates distances incrementally (O(n·k))"""
+    rng = np.random.default_rng(seed)
+    chosen = [int(rng.integers(len(values)))]
+    min_dist = ((values - values[chosen[0]]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = min_dist.sum()
+        if total > 0:
+            chosen.append(int(rng.choice(len(values), p=min_dist / total)))
+        else:
+            chosen.append(int(rng.integers(len(values))))
+        min_dist = np.minimum(min_dist, ((values - values[chosen[-1]]) ** 2).sum(axis=1))
+    return values[chosen].copy()
+
+
+def _approximate_gene_order(zscores: np.ndarray, metric: str, method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Order genes by clustering k-means centroids, then ordering within clusters"""
+    from scipy.cluster.hierarchy import leaves_list
+    from scipy.cluster.vq import kmeans2
+    from scipy.spatial.distance import cdist
+
+    n = zscores.shape[0]
+    k = min(CLUSTERING_APPROX_CLUSTERS, n)
+    # scipy's own '++' init recomputes all distances per centroid
+    centroids, labels = kmeans2(zscores, _kmeans_plus_plus(zscores, k), minit='matrix', seed=0)
+
+    # Drop empty clusters so the centroid linkage only sees real groups
+    used = np.unique(labels)
+    centroids = centroids[used]
+    labels = np.searchsorted(used, labels)
+
+    centroid_linkage = _linkage(centroids, metric, method)
+    order = []
+    for cluster in leaves_list(centroid_linkage):
+        members = np.flatnonzero(labels == cluster)
+        if 2 < len(members) <= CLUSTERING_APPROX_LEAF_EXACT_MAX:
+            sub_linkage = _linkage(zscores[members], metric, method)
+            members = members[leaves_list(sub_linkage)]
+        elif len(members) > 2:
+            distances = cdist(zscores[members], centroids[cluster:cluster + 1], metric=metric)[:, 0]
+            members = members[np.argsort(distances, kind='stable')]
+        order.append(members)
+    return centroid_linkage, np.concatenate(order)
+
+
+def compute_clustering(
+    data: pd.DataFrame,
+    metric: str = 'correlation',
+    method: str = 'average',
+    strategy: str = 'auto'
+) -> ClusteringResult:
+    """Z-score genes and cluster both axes.
+
+    Strategies for the gene axis:
+    - exact: float64 distances + linkage
+    - blocked: distances from float32 matrix products, which are faster;
+      the condensed matrix is float64, so peak memory is the same as exact
+    - approximate: k-means centroids clustered hierarchically, genes ordered
+      within each centroid's cluster
+    """
+    from scipy import stats
+    from scipy.cluster.hierarchy import leaves_list
+
+    strategy = resolve_strategy(strategy, data.shape[0])
+    zscores = stats.zscore(data.to_numpy(dtype=np.float64), axis=1)
+
+    if strategy == 'exact':
+        gene_linkage = _linkage(zscores, metric, method)
+        # Same left-to-right order as dendrogram(no_plot=True)['leaves']
+        gene_leaves = leaves_list(gene_linkage)
+    elif strategy == 'blocked':
+        gene_linkage = _linkage(zscores, metric, method, dtype=np.float32)
+        gene_leaves = leaves_list(gene_linkage)
+    else:
+        gene_linkage, gene_leaves = _approximate_gene_order(zscores, metric, method)
+
+    # Sample counts stay small, so samples are always clustered exactly
+    sample_linkage = _linkage(zscores.T, metric, method)
+    sample_leaves = leaves_list(sample_linkage)
+
+    return ClusteringResult(
+        zscores=np.ascontiguousarray(zscores[np.ix_(gene_leaves, sample_leaves)]),
+        genes=data.index.to_numpy(dtype=str)[gene_leaves],
+        samples=data.columns.to_numpy(dtype=str)[sample_leaves],
+        gene_linkage=gene_linkage,
+        sample_linkage=sample_linkage,
+        gene_leaves=gene_leaves,
+        sample_leaves=sample_leaves,
+        strategy=strategy
+    )
+
+
+class ClusteringCache:
+    """Memory and on-disk cache of clustering results.
+
+    Entries are keyed by the expression dataset version plus the clustering
+    parameters, so a new upload never matches an old entry. Results for other
+    dataset versions are pruned whenever a new result is stored.
+    """
+
+    def __init__(self, cache_dir: Path, max_entries: int = CLUSTERING_CACHE_ENTRIES):
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ClusteringResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def make_key(version: str, **params) -> str:
+        param_str = ','.join(f"{name}={params[name]}" for name in sorted(params))
+        param_hash = hashlib.blake2b(param_str.encode(), digest_size=8).hexdigest()
+        return f"{version}_{param_hash}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def _remember(self, key: str, result: ClusteringResult) -> None:
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[ClusteringResult]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                fields = {name: stored[name] for name in stored.files}
+            fields['strategy'] = str(fields.get('strategy', 'exact'))
+            return ClusteringResult(**fields)
+        except Exception as e:
+            self.logger.warning(f"Discarding unreadable clustering cache entry {path}: {str(e)}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def _save(self, key: str, result: ClusteringResult) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **result.__dict__)
+        os.replace(tmp_path, path)
+
+    def prune(self, keep_version: str) -> None:
+        """Drop entries that belong to other dataset versions"""
+        with self._lock:
+            for key in [k for k in self._entries if not k.startswith(f"{keep_version}_")]:
+                del self._entries[key]
+        if self.cache_dir.exists():
+            for path in self.cache_dir.glob('*.npz'):
+                if not path.name.startswith(f"{keep_version}_"):
+                    path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """Remove every cached result"""
+        with self._lock:
+            self._entries.clear()
+        if self.cache_dir.exists():
+            for path in self.cache_dir.glob('*.npz'):
+                path.unlink(missing_ok=True)
+
+    def get_or_compute(
+        self,
+        version: str,
+        compute: Callable[[], ClusteringResult],
+        **params
+    ) -> Tuple[ClusteringResult, bool]:
+        """Return (result, cache_hit), computing and storing it on a miss"""
+        key = self.make_key(version, **params)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key], True
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent requests for the same key wait for a single computation
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key], True
+
+            result = self._load(key)
+            hit = result is not None
+            if not hit:
+                result = compute()
+                self.prune(version)
+                try:
+                    self._save(key, result)
+                except OSError as e:
+                    self.logger.warning(f"Could not persist clustering result: {str(e)}")
+
+            with self._lock:
+                self._remember(key, result)
+                self._key_locks.pop(key, None)
+        return result, hit
@@ -7,10 +7,6 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 SCRIPT_DIR = os.path.join(BASE_DIR, 'scripts')
 
-# Create directories if they don't exist
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(SCRIPT_DIR, exist_ok=True)
-
 # File paths
 REQUIRED_FILES = {
     'raw_counts.csv': 'Raw gene expression counts',
@@ -23,12 +19,83 @@ REQUIRED_FILES = {
 ENRICHR_ADD_LIST_URL = 'https://maayanlab.cloud/Enrichr/addList'
 ENRICHR_ENRICH_URL = 'https://maayanlab.cloud/Enrichr/enrich'
 MAX_RETRIES = 3
-DELAY_BETWEEN_RETRIES = 5
+DELAY_BETWEEN_RETRIES = 5  # seconds; doubled on each 429 unless Retry-After says otherwise
+ENRICHR_TIMEOUT = 30  # seconds per Enrichr HTTP request
+ENRICHR_MAX_CONCURRENCY = 4  # library lookups in flight across all requests
+ENRICHR_LIST_TTL = 24 * 3600  # seconds a cached userListId is reused
+ENRICHR_LIST_CACHE_SIZE = 256  # gene sets whose userListId is remembered
 
 # Analysis parameters
 DEFAULT_TOP_N_GENES = 500
 PVALUE_THRESHOLD = 0.05
 LOG2FC_THRESHOLD = 1
+CLUSTERING_CACHE_ENTRIES = 16  # clustering results kept in memory per process
+CLUSTERING_EXACT_MAX_GENES = 5000  # 'auto' uses float64 pdist up to this many genes
+CLUSTERING_BLOCKED_MAX_GENES = 12000  # then float32 distance products (same memory, faster), then k-means
+CLUSTERING_APPROX_CLUSTERS = 256  # k-means centroids for the approximate strategy
+CLUSTERING_APPROX_LEAF_EXACT_MAX = 500  # clusters up to this size are ordered by linkage
+HEATMAP_TILE_SIZE = 256  # genes and samples per heatmap tile
+HEATMAP_PYRAMID_CACHE_ENTRIES = 4  # tile pyramids kept in memory per process
+
+# Differential expression
+DEFAULT_DE_ENGINE = 'deseq2'  # 'deseq2' (Rscript), 'nbinom' or 'voom' (in-process)
+
+# DESeq2 jobs
+DESEQ2_TIMEOUT = 300  # seconds before an R run is killed
+DESEQ2_PARALLEL_WORKERS = 1  # BiocParallel cores per run, used when installed
+JOB_MAX_WORKERS = 2  # concurrent background jobs (Rscript processes)
+JOB_HISTORY_SIZE = 100  # finished jobs kept for status queries
+R_WORKER_POOL_SIZE = 2  # warm Rscript workers; 0 starts one Rscript per run
+R_WORKER_MAX_JOBS = 50  # runs before a worker is recycled
+R_WORKER_STARTUP_TIMEOUT = 120  # seconds to load R libraries
+R_REQUIRED_PACKAGES = ('DESeq2', 'jsonlite')
+R_PROBE_CACHE_PATH = os.path.join(DATA_DIR, 'r_probe.json')  # last R environment check, shared by workers
+R_PROBE_TTL = 24 * 3600  # seconds before the R environment is checked again
+R_PROBE_TIMEOUT = 60  # seconds for the Rscript check to finish
+# Progress reported for each log_message line of deseq2_analysis.R
+DESEQ2_PROGRESS_STAGES = [
+    ("Loading required libraries", 5),
+    ("Libraries loaded", 15),
+    ("Reading input files", 20),
+    ("Files read", 25),
+    ("Creating DESeqDataSet", 30),
+    ("DESeqDataSet object created", 35),
+    ("Running DESeq2 analysis", 40),
+    ("DESeq2 analysis completed", 85),
+    ("Retrieving results", 90),
+    ("Writing results", 95),
+    ("Analysis completed", 100)
+]
+
+# Expression matrix storage
+EXPRESSION_DTYPE = 'float64'  # or 'float32' to halve memory for very large matrices
+EXPRESSION_MMAP = True  # memory-map the binary copy instead of loading it into RAM
+EXPRESSION_BLOCK_BYTES = 64 * 1024 * 1024  # working set for blockwise scans
+UPLOAD_CHUNK_ROWS = 20000  # rows parsed per block when streaming a counts upload
+
+# JSON serialization of numeric responses
+JSON_FLOAT_DECIMALS = None  # round floats to this many decimals, None keeps full precision
+JSON_NAN_MODE = 'null'  # 'null', 'zero' or 'error'
+
+# HTTP response layer: conditional GETs and compression
+HTTP_COMPRESS_MIN_BYTES = 1024  # smaller bodies are sent uncompressed
+HTTP_COMPRESS_LEVEL = 6  # gzip level, or brotli quality when brotli is installed
+HTTP_COMPRESS_MIMETYPES = (
+    'application/json',
+    'application/octet-stream',
+    'application/vnd.apache.arrow.stream',
+    'text/csv',
+    'text/plain'
+)
+HTTP_BODY_CACHE_BYTES = 64 * 1024 * 1024  # finished response bodies kept, by ETag
+RESPONSE_CACHE_BACKEND = 'sqlite'  # 'sqlite' shares cached responses between worker processes, 'memory' keeps them per process
+RESPONSE_CACHE_PATH = os.path.join(DATA_DIR, 'response_cache.sqlite3')
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+
+# Volcano plot level of detail (/api/volcano_plot?mode=lod)
+VOLCANO_BINS = 128  # density grid resolution per axis when none is requested
+VOLCANO_MAX_BINS = 1024
+VOLCANO_POINT_BUDGET = 5000  # send background genes as points when no more than this many are visible
 
 # Genomic Tools Configuration
 GENOMIC_TOOLS = {
@@ -54,6 +121,10 @@ GENOMIC_TOOLS = {
         "base_url": "https://genemania.org/api",
         "organism": "homo-sapiens",
         "cache_timeout": 3600
+    },
+    "enrichr": {
+        "base_url": "https://maayanlab.cloud/Enrichr",
+        "cache_timeout": 86400  # library versions are pinned, so results are stable
     }
 }
 
@@ -65,9 +136,20 @@ TOOL_PATHS = {
     'genemania_results': os.path.join(DATA_DIR, 'genemania_results'),
 }
 
-# Create tool result directories
-for path in TOOL_PATHS.values():
-    os.makedirs(path, exist_ok=True)
+# Content-addressed cache of external tool results (Enrichr, STRING, ...)
+TOOL_CACHE_DIR = os.path.join(DATA_DIR, 'tool_cache')
+TOOL_CACHE_MAX_ENTRIES = 5000
+TOOL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TOOL_CACHE_DEFAULT_TTL = 3600  # seconds, for tools without a cache_timeout
+
+# GMT gene-set libraries for offline enrichment (e.g. Enrichr library downloads)
+GENE_SET_DIR = os.path.join(DATA_DIR, 'gene_sets')
+
+# Local HGNC symbol index (download hgnc_complete_set.txt from genenames.org)
+HGNC_DUMP_PATH = os.path.join(DATA_DIR, 'hgnc_complete_set.txt')
+HGNC_INDEX_PATH = os.path.join(DATA_DIR, 'hgnc_symbol_index.json')  # parsed index, rebuilt when the dump changes
+HGNC_REST_URL = 'https://rest.genenames.org/fetch/symbol'  # fallback when no dump is installed
+NORMALISE_GENE_SYMBOLS = False  # map aliases and previous symbols to approved symbols on upload
 
 # Logging configuration
 LOGGING_CONFIG = {
@@ -97,5 +179,14 @@ LOGGING_CONFIG = {
     }
 }
 
-# Initialize logging
-dictConfig(LOGGING_CONFIG)
\ No newline at end of file
+
+# Importing this module has no side effects; app.py calls these at startup
+def ensure_directories() -> None:
+    """Create the data, script and tool result directories"""
+    for path in (DATA_DIR, SCRIPT_DIR, *TOOL_PATHS.values()):
+        os.makedirs(path, exist_ok=True)
+
+
+def configure_logging() -> None:
+    """Console logging at DEBUG plus app.log at INFO"""
+    dictConfig(LOGGING_CONFIG)
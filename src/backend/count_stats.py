@@ -0,0 +1,194 @@
+import importlib.util
+import logging
+import threading
+from typing import Any, Dict, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import matrix_io
+from config import EXPRESSION_BLOCK_BYTES
+
+# numba takes about a second to import, so it is loaded with the first scan
+HAVE_NUMBA = importlib.util.find_spec('numba') is not None
+_kernel = None
+_kernel_lock = threading.Lock()
+
+
+class BlockScan(NamedTuple):
+    """Validation flags and per-sample moments of one block of count rows"""
+    keep: np.ndarray  # rows with at least one positive count
+    negative: bool
+    zero_variance: int  # rows whose non-missing counts are all equal
+    count: np.ndarray  # per sample, over the rows included in the moments
+    mean: np.ndarray
+    m2: np.ndarray  # sum of squared deviations from mean
+    zeros: int
+    rows: int
+
+
+def _scan_numpy(values: np.ndarray, kept_only: bool) -> BlockScan:
+    """Vectorised scan: two row reductions, then moments of the kept block"""
+    # fmin/fmax skip NaN, so one pass each gives the negative, zero-variance
+    # and all-zero flags for every row
+    lo = np.fmin.reduce(values, axis=1)
+    hi = np.fmax.reduce(values, axis=1)
+    negative = bool((lo < 0).any())
+    keep = hi > 0
+
+    flat = np.flatnonzero(lo == hi)
+    if values.dtype.kind == 'f' and len(flat):
+        present = values.shape[1] - np.isnan(values[flat]).sum(axis=1)
+        zero_variance = int((present > 1).sum())
+    else:
+        zero_variance = len(flat) if values.shape[1] > 1 else 0
+
+    block = values[keep] if kept_only else values
+    block = np.asarray(block, dtype=np.float64)
+    if block.dtype.kind == 'f' and np.isnan(block).any():
+        count = (~np.isnan(block)).sum(axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nan_to_num(np.nansum(block, axis=0) / count)
+        centered = np.nan_to_num(block - mean)
+    else:
+        count = np.full(block.shape[1], float(len(block)))
+        mean = block.mean(axis=0) if len(block) else np.zeros(block.shape[1])
+        centered = block - mean
+    m2 = np.einsum('ij,ij->j', centered, centered)
+    # count_nonzero treats NaN as non-zero, so no boolean temporary is needed
+    zeros = int(block.size - np.count_nonzero(block))
+    return BlockScan(keep, negative, zero_variance, count, mean, m2, zeros, len(block))
+
+
+def _scan_kernel(values, kept_only):
+    n_rows, n_cols = values.shape
+    keep = np.zeros(n_rows, dtype=np.bool_)
+    count = np.zeros(n_cols)
+    mean = np.zeros(n_cols)
+    m2 = np.zeros(n_cols)
+    negative = False
+    zero_variance = 0
+    zeros = 0
+    rows = 0
+    for i in range(n_rows):
+        lo = np.inf
+        hi = -np.inf
+        present = 0
+        for j in range(n_cols):
+            x = float(values[i, j])
+            if x != x:
+                continue
+            present += 1
+            lo = min(lo, x)
+            hi = max(hi, x)
+        if lo < 0:
+            negative = True
+        if present > 1 and lo == hi:
+            zero_variance += 1
+        keep[i] = hi > 0
+        if kept_only and not keep[i]:
+            continue
+        # Welford update while the row is still in cache
+        rows += 1
+        for j in range(n_cols):
+            x = float(values[i, j])
+            if x != x:
+                continue
+            if x == 0:
+                zeros += 1
+            count[j] += 1
+            delta = x - mean[j]
+            mean[j] += delta / count[j]
+            m2[j] += delta * (x - mean[j])
+    return keep, negative, zero_variance, count, mean, m2, zeros, rows
+
+
+def _compiled_kernel():
+    """_scan_kernel compiled by numba, imported and jitted once per process"""
+    global _kernel
+    with _kernel_lock:
+        if _kernel is None:
+            import numba
+            # The app logs at DEBUG; keep numba's compiler traces out of it
+            logging.getLogger('numba').setLevel(logging.WARNING)
+            _kernel = numba.njit(cache=True, nogil=True)(_scan_kernel)
+    return _kernel
+
+
+def scan_block(values: np.ndarray, kept_only: bool = True) -> BlockScan:
+    """Validate a block of raw counts and collect its per-sample moments.
+
+    One pass finds negative counts, zero-variance rows and the rows with any
+    positive count; the moments cover only those rows unless kept_only is
+    False. Uses the compiled kernel when numba is installed.
+    """
+    if HAVE_NUMBA and values.dtype.kind in 'iuf':
+        return BlockScan(*_compiled_kernel()(np.ascontiguousarray(values), kept_only))
+    return _scan_numpy(values, kept_only)
+
+
+class CountStats:
+    """Per-sample moments merged across blocks (Chan et al. pairwise update)"""
+
+    def __init__(self):
+        self.count = self.mean = self.m2 = None
+        self.rows = 0
+        self.negative = False
+        self.non_zero_rows = 0
+        self.zeros = 0
+        self.zero_variance = 0
+
+    def update(self, scan: BlockScan) -> None:
+        self.rows += scan.rows
+        self.negative = self.negative or scan.negative
+        self.non_zero_rows += int(scan.keep.sum())
+        self.zeros += scan.zeros
+        self.zero_variance += scan.zero_variance
+        if self.count is None:
+            self.count, self.mean, self.m2 = scan.count, scan.mean, scan.m2
+            return
+        count = self.count + scan.count
+        delta = scan.mean - self.mean
+        ratio = np.divide(scan.count, count, out=np.zeros_like(count), where=count > 0)
+        self.mean = self.mean + delta * ratio
+        self.m2 = self.m2 + scan.m2 + delta ** 2 * self.count * ratio
+        self.count = count
+
+    def summary(self, samples: pd.Index, medians: np.ndarray) -> Dict[str, Any]:
+        """Summary in the calculate_summary_stats format"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.mean, np.nan)
+            std = np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+        cells = self.rows * len(samples)
+        return {
+            'samples': len(samples),
+            'genes': self.rows,
+            'mean_counts': float(np.nanmean(mean)),
+            'median_counts': float(np.nanmedian(medians)),
+            'zero_counts_pct': float(self.zeros / cells * 100) if cells else 0.0,
+            'non_zero_genes': self.non_zero_rows,
+            'stats_per_sample': {
+                'mean': dict(zip(samples, mean.tolist())),
+                'median': dict(zip(samples, medians.tolist())),
+                'std': dict(zip(samples, std.tolist()))
+            }
+        }
+
+
+def scan_matrix(values: np.ndarray, kept_only: bool = True, block_bytes: int = EXPRESSION_BLOCK_BYTES) -> CountStats:
+    """Scan a whole matrix block by block"""
+    stats = CountStats()
+    for start, stop in matrix_io.row_blocks(values, block_bytes):
+        stats.update(scan_block(values[start:stop], kept_only))
+    return stats
+
+
+def column_medians(values: np.ndarray, block_bytes: int = EXPRESSION_BLOCK_BYTES) -> np.ndarray:
+    """Per-column medians, reading a few columns at a time from a mapped matrix"""
+    n_rows, n_cols = values.shape
+    step = max(1, block_bytes // max(n_rows * 8, 1))
+    medians = np.empty(n_cols)
+    for start in range(0, n_cols, step):
+        block = np.asarray(values[:, start:start + step], dtype=np.float64)
+        medians[start:start + step] = np.nanmedian(block, axis=0)
+    return medians
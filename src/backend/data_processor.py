@@ -5,47 +5,92 @@ import logging
 import subprocess
 import os
 import json
-from typing import Tuple, Optional, Dict, Any
-from config import DATA_DIR, DEFAULT_TOP_N_GENES
+import re
+import threading
+import time
+from typing import Tuple, Optional, Dict, Any, Union, Callable, List
+from config import (
+    DATA_DIR,
+    DEFAULT_DE_ENGINE,
+    DEFAULT_TOP_N_GENES,
+    DESEQ2_PARALLEL_WORKERS,
+    DESEQ2_PROGRESS_STAGES,
+    DESEQ2_TIMEOUT,
+    EXPRESSION_DTYPE,
+    NORMALISE_GENE_SYMBOLS,
+    UPLOAD_CHUNK_ROWS
+)
+from expression_store import ExpressionMatrix, ExpressionStore, file_content_hash
+from jobs import Job, JobCancelled, JobManager
+import differential_expression
+from differential_expression import contrast_name, resolve_contrasts, validate_engine
+from r_worker import RAnalysisError, RProbe, RWorkerPool
+from results_store import ResultsStore
+import count_stats
+import gene_symbols
+from heatmap_tiles import PyramidCache, TilePyramid
+from clustering import (
+    ClusteringCache,
+    ClusteringResult,
+    compute_clustering,
+    resolve_strategy,
+    validate_params
+)
+import matrix_io
 from utils import get_data_path, safe_save_csv, validate_dataframe
 
+LOG_LINE_PATTERN = re.compile(r'^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\] (?P<message>.*)$')
+
+
+def parse_deseq2_progress(line: str) -> Optional[Tuple[str, Optional[int]]]:
+    """Map a log_message line from deseq2_analysis.R to (stage, percent)"""
+    match = LOG_LINE_PATTERN.match(line.strip())
+    if not match:
+        return None
+    message = match.group('message')
+    for prefix, percent in DESEQ2_PROGRESS_STAGES:
+        if message.startswith(prefix):
+            return message, percent
+    return message, None
+
+
 class DataProcessor:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         # Add data_dir initialization
         self.data_dir = Path(__file__).parent.parent.parent / "data"
         self.r_script_path = Path(__file__).parent / "deseq2_analysis.R"
+        self.r_worker_script_path = Path(__file__).parent / "deseq2_worker.R"
         
         # Create data directory if it doesn't exist
         self.data_dir.mkdir(parents=True, exist_ok=True)
+
+        # Shared in-memory copy of the log-transformed matrix
+        self.expression_store = ExpressionStore(self.data_dir / "log_transformed_data.csv")
+        self.clustering_cache = ClusteringCache(self.data_dir / "clustering_cache")
+        self.tile_cache = PyramidCache()
+
+        # Bounded pool for background DESeq2 runs
+        self.jobs = JobManager()
+        self._results_lock = threading.Lock()
+        # Parsed, indexed results files shared by all result views
+        self.results_store = ResultsStore()
+        # Warm Rscript processes; started on the first DESeq2 run
+        self.r_workers = RWorkerPool(self.r_worker_script_path)
+        # R installation check; runs on the first DESeq2 job or health check
+        self.r_probe = RProbe()
         
         self.logger.info(f"Initialized with data directory: {self.data_dir}")
         self.logger.info(f"R script path: {self.r_script_path}")
-        
-        # Check R installation and packages
-        try:
-            # Check R is installed
-            r_version = subprocess.run(["Rscript", "--version"], 
-                                     capture_output=True, 
-                                     text=True)
-            self.logger.info(f"R version: {r_version.stderr}")
-            
-            # Check required packages
-            if not self.check_r_packages():
-                self.logger.warning("Some required R packages are missing. DESeq2 analysis may fail.")
-        except Exception as e:
-            self.logger.warning(f"Error checking R setup: {str(e)}")
+
+    def r_status(self, refresh: bool = False) -> Dict[str, Any]:
+        """Cached R availability, version and missing packages"""
+        return self.r_probe.status(refresh)
 
     def check_r_packages(self) -> bool:
         """Check if required R packages are installed"""
         try:
-            check_packages_cmd = [
-                "Rscript",
-                "-e",
-                'if (!all(c("DESeq2", "jsonlite") %in% installed.packages()[,"Package"])) quit(status=1)'
-            ]
-            result = subprocess.run(check_packages_cmd, capture_output=True, text=True)
-            return result.returncode == 0
+            return self.r_status()['packages_ok']
         except Exception as e:
             self.logger.error(f"Error checking R packages: {str(e)}")
             return False
@@ -65,14 +110,12 @@ class DataProcessor:
             if not df.select_dtypes(include=[np.number]).columns.size == df.columns.size:
                 return False, "All count values must be numeric"
                 
-            # Check for negative values
-            if (df < 0).any().any():
+            # Negative values and zero variance genes in one pass per block
+            stats = count_stats.scan_matrix(df.to_numpy(), kept_only=False)
+            if stats.negative:
                 return False, "Raw counts cannot contain negative values"
-                
-            # Check for zero variance genes
-            zero_var_genes = df.index[df.var(axis=1) == 0]
-            if not zero_var_genes.empty:
-                self.logger.warning(f"Found {len(zero_var_genes)} genes with zero variance")
+            if stats.zero_variance:
+                self.logger.warning(f"Found {stats.zero_variance} genes with zero variance")
                 
             return True, ""
         except Exception as e:
@@ -114,97 +157,140 @@ class DataProcessor:
     def calculate_summary_stats(self, data: pd.DataFrame) -> Dict[str, Any]:
         """Calculate summary statistics for the data"""
         try:
-            summary = {
-                'samples': len(data.columns),
-                'genes': len(data.index),
-                'mean_counts': float(data.mean().mean()),
-                'median_counts': float(data.median().median()),
-                'zero_counts_pct': float((data == 0).sum().sum() / (data.shape[0] * data.shape[1]) * 100),
-                'non_zero_genes': int((data > 0).any(axis=1).sum()),
-                'stats_per_sample': {
-                    'mean': data.mean().to_dict(),
-                    'median': data.median().to_dict(),
-                    'std': data.std().to_dict()
-                }
-            }
+            values = data.to_numpy()
+            stats = count_stats.scan_matrix(values, kept_only=False)
+            summary = stats.summary(data.columns, count_stats.column_medians(values))
             return summary
         except Exception as e:
             self.logger.error(f"Error calculating summary stats: {str(e)}")
             return {}
 
-    def filter_top_variable_genes(self, data: pd.DataFrame, top_n: int = DEFAULT_TOP_N_GENES) -> pd.DataFrame:
-        """Filter top variable genes"""
+    def filter_top_variable_genes(
+        self,
+        data: Union[pd.DataFrame, ExpressionMatrix],
+        top_n: int = DEFAULT_TOP_N_GENES
+    ) -> pd.DataFrame:
+        """Filter top variable genes
+
+        For an ExpressionMatrix the variances are computed blockwise and only
+        the selected rows are read, so memory-mapped matrices stay on disk.
+        """
         try:
+            if isinstance(data, ExpressionMatrix):
+                return data.take(rows=data.top_variable(top_n))
             variances = data.var(axis=1)
             top_genes = variances.nlargest(top_n).index
             return data.loc[top_genes]
         except Exception as e:
             self.logger.error(f"Error filtering top variable genes: {str(e)}")
-            return data
+            return data if isinstance(data, pd.DataFrame) else data.to_frame()
+
+    def cluster_top_variable_genes(
+        self,
+        top_n: int = DEFAULT_TOP_N_GENES,
+        metric: str = 'correlation',
+        method: str = 'average',
+        strategy: str = 'auto',
+        matrix: Optional[ExpressionMatrix] = None
+    ) -> Tuple[ClusteringResult, bool]:
+        """Cluster the top variable genes, reusing cached results
+
+        Returns the clustering result and whether it came from the cache.
+        """
+        validate_params(metric, method, strategy)
+        if matrix is None:
+            matrix = self.expression_store.get()
+        strategy = resolve_strategy(strategy, min(top_n, matrix.shape[0]))
+
+        def compute() -> ClusteringResult:
+            filtered = self.filter_top_variable_genes(matrix, top_n=top_n)
+            self.logger.info(f"Clustering {filtered.shape} with {metric}/{method} ({strategy})")
+            return compute_clustering(filtered, metric=metric, method=method, strategy=strategy)
+
+        return self.clustering_cache.get_or_compute(
+            matrix.version,
+            compute,
+            top_n=top_n,
+            metric=metric,
+            method=method,
+            strategy=strategy
+        )
+
+    def heatmap_pyramid(
+        self,
+        top_n: int = DEFAULT_TOP_N_GENES,
+        metric: str = 'correlation',
+        method: str = 'average',
+        strategy: str = 'auto'
+    ) -> Tuple[TilePyramid, ClusteringResult]:
+        """Tile pyramid of a clustering result, built once per result"""
+        matrix = self.expression_store.get()
+        clustered, _ = self.cluster_top_variable_genes(top_n, metric, method, strategy, matrix=matrix)
+        key = self.clustering_cache.make_key(
+            matrix.version,
+            top_n=top_n,
+            metric=metric,
+            method=method,
+            strategy=clustered.strategy
+        )
+        pyramid = self.tile_cache.get_or_build(key, lambda: TilePyramid.build(clustered.zscores))
+        return pyramid, clustered
+
     def get_top_expressed_genes(
         self,
-        top_n: int = DEFAULT_TOP_N_GENES
+        top_n: int = DEFAULT_TOP_N_GENES,
+        engine: str = DEFAULT_DE_ENGINE,
+        contrast: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Get top expressed genes from existing DESeq2 results
         
         Args:
             top_n: Number of top genes to return
+            engine: Differential expression engine whose results are used
+            contrast: Contrast name ('<numerator>_vs_<denominator>'); default contrast if None
         Returns:
             Dictionary containing top genes and metadata
         """
         try:
             # Load existing DESeq2 results
-            deseq2_results_path = self.data_dir / "deseq2_results.json"
+            deseq2_results_path = self.results_path(engine, contrast)
             
             if not deseq2_results_path.exists():
                 raise FileNotFoundError("DESeq2 results file not found. Please run DESeq2 analysis first.")
                 
-            # Read the results
-            with open(deseq2_results_path, 'r') as f:
-                deseq_data = json.load(f)
-                
-            # Convert to DataFrame
-            results_df = pd.DataFrame(deseq_data)
+            table = self.results_store.get(deseq2_results_path)
             
-            # Verify required columns exist
-            required_columns = ['gene', 'log2_fold_change', 'p_value', 'adjusted_p_value']
-            if not all(col in results_df.columns for col in required_columns):
-                raise ValueError(f"Missing required columns in DESeq2 results. Required: {required_columns}")
-            
-            # Filter for significant genes (p-adj < 0.05)
-            significant_genes = results_df[
-                (results_df['adjusted_p_value'].notna()) & 
-                (results_df['adjusted_p_value'] < 0.05)
-            ]
-            
-            # Sort by absolute log2 fold change
-            significant_genes['abs_log2fc'] = abs(significant_genes['log2_fold_change'])
-            top_genes = significant_genes.nlargest(min(top_n, len(significant_genes)), 'abs_log2fc')
+            # Significant genes (p-adj < 0.05) by absolute log2 fold change
+            top_rows, significant = table.query(padj_max=0.05, sort='abs_lfc', limit=top_n)
+            _, upregulated = table.query(padj_max=0.05, direction='up', limit=0)
+            _, downregulated = table.query(padj_max=0.05, direction='down', limit=0)
             
             # Format results
             formatted_results = {
                 'top_genes': [
                     {
-                        'gene': row['gene'],
-                        'log2_fold_change': float(row['log2_fold_change']),
-                        'p_value': float(row['p_value']),
-                        'adjusted_p_value': float(row['adjusted_p_value']),
-                        'fold_change': float(2 ** abs(row['log2_fold_change'])),
-                        'regulation': 'up' if row['log2_fold_change'] > 0 else 'down'
+                        'gene': record['gene'],
+                        'log2_fold_change': record['log2_fold_change'],
+                        'p_value': record['p_value'],
+                        'adjusted_p_value': record['adjusted_p_value'],
+                        'fold_change': float(2 ** abs(record['log2_fold_change'])),
+                        'regulation': 'up' if record['log2_fold_change'] > 0 else 'down'
                     }
-                    for _, row in top_genes.iterrows()
+                    for record in table.records(top_rows)
                 ],
                 'metadata': {
-                    'total_genes': len(results_df),
-                    'significant_genes': len(significant_genes),
+                    'total_genes': len(table),
+                    'significant_genes': significant,
                     'analysis_parameters': {
                         'significance_threshold': 0.05,
-                        'top_n': top_n
+                        'top_n': top_n,
+                        'engine': engine,
+                        'contrast': contrast or self.list_contrasts(engine).get('default')
                     },
                     'summary': {
-                        'upregulated': len(significant_genes[significant_genes['log2_fold_change'] > 0]),
-                        'downregulated': len(significant_genes[significant_genes['log2_fold_change'] < 0])
+                        'upregulated': upregulated,
+                        'downregulated': downregulated
                     }
                 }
             }
@@ -214,110 +300,485 @@ class DataProcessor:
         except Exception as e:
             self.logger.error(f"Error getting top expressed genes: {str(e)}")
             raise
-    def run_deseq2_analysis(self) -> bool:
-        """Run DESeq2 analysis using existing count and design data"""
+
+    def _contrast_dir(self, engine: str) -> Path:
+        return self.data_dir / "de_contrasts" / engine
+
+    def list_contrasts(self, engine: str = DEFAULT_DE_ENGINE) -> Dict[str, Any]:
+        """Manifest of the contrasts stored for an engine"""
+        manifest_path = self._contrast_dir(engine) / "contrasts.json"
+        if not manifest_path.exists():
+            return {'inputs': None, 'default': None, 'contrasts': {}}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def expression_files(self) -> List[Path]:
+        """Files the expression matrix is read from, for response validators"""
+        _, index_path = matrix_io.binary_paths(self.expression_store.path)
+        return [self.expression_store.path, index_path]
+
+    def result_files(self, engine: str = DEFAULT_DE_ENGINE, contrast: Optional[str] = None) -> List[Path]:
+        """Results file of a contrast plus the contrast manifest, for response validators"""
+        return [self.results_path(engine, contrast), self._contrast_dir(engine) / "contrasts.json"]
+
+    def results_path(self, engine: str = DEFAULT_DE_ENGINE, contrast: Optional[str] = None) -> Path:
+        """Results file for an engine and contrast name ('<numerator>_vs_<denominator>')
+
+        The default contrast lives in the original results file
+        (deseq2_results.json for DESeq2); other contrasts are stored under
+        de_contrasts/<engine>/.
+        """
+        if contrast is None or contrast == self.list_contrasts(engine).get('default'):
+            if engine == 'deseq2':
+                return self.data_dir / "deseq2_results.json"
+            return self.data_dir / f"de_results_{engine}.json"
+        return self._contrast_file(engine, contrast)
+
+    def _contrast_file(self, engine: str, contrast: str) -> Path:
+        safe_name = re.sub(r'[^A-Za-z0-9._-]+', '_', contrast)
+        return self._contrast_dir(engine) / f"{safe_name}.json"
+
+    def _inputs_version(self) -> str:
+        """Content version of the raw counts and design file"""
+        count_file = self.data_dir / "raw_counts.csv"
+        design_file = self.data_dir / "experiment_design.csv"
+        if matrix_io.has_binary(count_file):
+            counts_version = matrix_io.read_index(count_file)['content_hash']
+        else:
+            counts_version = file_content_hash(count_file) if count_file.exists() else 'missing'
+        design_version = file_content_hash(design_file) if design_file.exists() else 'missing'
+        return f"{counts_version}:{design_version}"
+
+    def design_levels(self) -> List[str]:
+        """Condition levels of the current design file, in factor order"""
+        design_file = self.data_dir / "experiment_design.csv"
+        if not design_file.exists():
+            raise FileNotFoundError(f"Design file not found at {design_file}")
+        design = pd.read_csv(design_file)
+        if 'condition' not in design.columns:
+            raise ValueError("Design file must contain 'sample' and 'condition' columns")
+        return sorted(design['condition'].astype(str).unique())
+
+    def deseq2_job_key(
+        self,
+        engine: str = DEFAULT_DE_ENGINE,
+        contrasts: Optional[List[Tuple[str, str]]] = None
+    ) -> str:
+        """Identify a differential expression run by engine, inputs and contrasts"""
+        names = ','.join(contrast_name(c) for c in contrasts or [])
+        return f"{engine}:{self._inputs_version()}:{names}"
+
+    def submit_deseq2_analysis(
+        self,
+        engine: str = DEFAULT_DE_ENGINE,
+        contrasts: Optional[Union[str, List[Any]]] = None
+    ) -> Tuple[Job, bool]:
+        """Queue a differential expression run on the worker pool
+
+        contrasts accepts anything resolve_contrasts does and is validated
+        against the design file before queueing. Returns the job and whether
+        an identical in-flight job was reused.
+        """
+        validate_engine(engine)
+        resolved = resolve_contrasts(contrasts, self.design_levels())
+
+        def run(job: Job) -> str:
+            return str(self._run_analysis(engine, resolved, job.report, job.cancel_event))
+
+        params = {'engine': engine, 'contrasts': [contrast_name(c) for c in resolved]}
+        return self.jobs.submit('deseq2', self.deseq2_job_key(engine, resolved), run, params=params)
+
+    def run_deseq2_analysis(
+        self,
+        engine: str = DEFAULT_DE_ENGINE,
+        contrasts: Optional[Union[str, List[Any]]] = None
+    ) -> bool:
+        """Run differential expression analysis using existing count and design data"""
         try:
-            # Check if input files exist
-            count_file = self.data_dir / "raw_counts.csv"
-            design_file = self.data_dir / "experiment_design.csv"
-            output_file = self.data_dir / "deseq2_results.json"
+            self._run_analysis(engine, contrasts)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error running {engine} analysis: {str(e)}")
+            return False
+
+    def _run_analysis(
+        self,
+        engine: str,
+        contrasts: Optional[Union[str, List[Any]]] = None,
+        progress_callback: Optional[Callable[[str, Optional[int]], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Path:
+        """Fit the engine's model once and write results for every contrast
+
+        Cancellation is checked at every progress step. Returns the path of
+        the default contrast's results file.
+        """
+        validate_engine(engine)
+
+        def report(stage: str, progress: Optional[int] = None) -> None:
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled(f"{engine} analysis cancelled")
+            if progress_callback is not None:
+                progress_callback(stage, progress)
+
+        report("Reading input files", 5)
+        counts, design = self._load_de_inputs()
+        inputs_version = self._inputs_version()
+        levels = differential_expression.align_conditions(counts.columns, design).categories
+        contrasts = resolve_contrasts(contrasts, levels)
+
+        # Results go to temp files so readers never see a partial JSON document;
+        # the default contrast keeps the original results file
+        self._contrast_dir(engine).mkdir(parents=True, exist_ok=True)
+        paths = [self.results_path(engine)] + [self._contrast_file(engine, contrast_name(c)) for c in contrasts[1:]]
+        staged = {contrast: path.with_name(path.name + '.tmp') for contrast, path in zip(contrasts, paths)}
+
+        if engine == 'deseq2':
+            self._run_deseq2(counts, staged, report, cancel_event)
+        else:
+            results = differential_expression.run_engine(engine, counts, design, contrasts=contrasts, progress=report)
+            report("Writing results", 95)
+            for contrast, frame in results.items():
+                frame.to_json(staged[contrast], orient='records', double_precision=15)
+
+        # Verify output
+        for contrast, tmp_path in staged.items():
+            if not tmp_path.exists():
+                raise FileNotFoundError(f"{engine} did not create output file at {tmp_path}")
+            with open(tmp_path, 'r') as f:
+                results = json.load(f)
+            self.logger.info(f"{engine} {contrast_name(contrast)}: {len(results)} results")
+
+        return self._publish_results(engine, inputs_version, staged)
+
+    def _publish_results(
+        self,
+        engine: str,
+        inputs_version: str,
+        staged: Dict[Tuple[str, str], Path]
+    ) -> Path:
+        """Move staged contrast files into place and update the manifest
+
+        Contrasts computed earlier for the same inputs are kept; results for
+        older inputs are removed.
+        """
+        contrast_dir = self._contrast_dir(engine)
+        with self._results_lock:
+            manifest = self.list_contrasts(engine)
+            if manifest.get('inputs') != inputs_version:
+                for entry in manifest['contrasts'].values():
+                    (contrast_dir / entry['file']).unlink(missing_ok=True)
+                manifest = {'inputs': inputs_version, 'default': None, 'contrasts': {}}
+
+            default = next(iter(staged))
+            default_path = None
+            for contrast, tmp_path in staged.items():
+                path = tmp_path.with_name(tmp_path.name[:-len('.tmp')])
+                os.replace(tmp_path, path)
+                if contrast == default:
+                    default_path = path
+                    continue
+                manifest['contrasts'][contrast_name(contrast)] = {
+                    'numerator': contrast[0],
+                    'denominator': contrast[1],
+                    'file': path.name
+                }
+            manifest['default'] = contrast_name(default)
+            manifest['default_contrast'] = {'numerator': default[0], 'denominator': default[1]}
+
+            manifest_path = contrast_dir / "contrasts.json"
+            tmp_manifest = manifest_path.with_name(manifest_path.name + '.tmp')
+            with open(tmp_manifest, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_manifest, manifest_path)
+        return default_path
+
+    def _load_de_inputs(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Read and validate the raw counts and design file"""
+        # Check if input files exist
+        count_file = self.data_dir / "raw_counts.csv"
+        design_file = self.data_dir / "experiment_design.csv"
+        
+        # Detailed file checks
+        self.logger.info("Checking files:")
+        self.logger.info(f"Count file exists: {count_file.exists()}")
+        self.logger.info(f"Design file exists: {design_file.exists()}")
+        
+        if not count_file.exists():
+            raise FileNotFoundError(f"Count data file not found at {count_file}")
+        if not design_file.exists():
+            raise FileNotFoundError(f"Design file not found at {design_file}")
             
-            # Detailed file checks
-            self.logger.info("Checking files:")
-            self.logger.info(f"Count file exists: {count_file.exists()}")
-            self.logger.info(f"Design file exists: {design_file.exists()}")
-            self.logger.info(f"R script exists: {self.r_script_path.exists()}")
+        # Read and validate input files
+        try:
+            counts = matrix_io.read_matrix(count_file)
+            design = pd.read_csv(design_file)
             
-            if not count_file.exists():
-                raise FileNotFoundError(f"Count data file not found at {count_file}")
-            if not design_file.exists():
-                raise FileNotFoundError(f"Design file not found at {design_file}")
-                
-            # Read and validate input files
-            try:
-                counts = pd.read_csv(count_file, index_col=0)
-                design = pd.read_csv(design_file)
+            # Validate files
+            is_valid, error_msg = self.validate_raw_counts(counts)
+            if not is_valid:
+                raise ValueError(f"Invalid count data: {error_msg}")
                 
-                # Validate files
-                is_valid, error_msg = self.validate_raw_counts(counts)
-                if not is_valid:
-                    raise ValueError(f"Invalid count data: {error_msg}")
-                    
-                is_valid, error_msg = self.validate_design_file(design)
-                if not is_valid:
-                    raise ValueError(f"Invalid design file: {error_msg}")
-                    
-                self.logger.info(f"Count data shape: {counts.shape}")
-                self.logger.info(f"Design data shape: {design.shape}")
-                self.logger.info(f"Design columns: {design.columns.tolist()}")
+            is_valid, error_msg = self.validate_design_file(design)
+            if not is_valid:
+                raise ValueError(f"Invalid design file: {error_msg}")
                 
-            except Exception as e:
-                raise ValueError(f"Error reading input files: {str(e)}")
-            
-            # Run R script
-            cmd = [
-                "Rscript",
-                "--vanilla",
-                str(self.r_script_path),
-                str(count_file),
-                str(design_file),
-                str(output_file)
-            ]
-            
-            self.logger.info(f"Running command: {' '.join(cmd)}")
+            self.logger.info(f"Count data shape: {counts.shape}")
+            self.logger.info(f"Design data shape: {design.shape}")
+            self.logger.info(f"Design columns: {design.columns.tolist()}")
             
+        except Exception as e:
+            raise ValueError(f"Error reading input files: {str(e)}")
+
+        return counts, design
+
+    def _run_deseq2(
+        self,
+        counts: pd.DataFrame,
+        staged: Dict[Tuple[str, str], Path],
+        progress_callback: Optional[Callable[[str, Optional[int]], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> None:
+        """Run DESeq2 once for all staged contrasts, streaming its log output
+
+        Uses the warm R worker pool unless it is disabled, in which case a
+        fresh Rscript process runs deseq2_analysis.R. Raises on failure and
+        JobCancelled when cancel_event is set.
+        """
+        if not self.check_r_packages():
+            self.logger.warning("Some required R packages are missing. DESeq2 analysis may fail.")
+
+        count_file = self.data_dir / "raw_counts.csv"
+        design_file = self.data_dir / "experiment_design.csv"
+        contrasts = [
+            {'numerator': numerator, 'denominator': denominator, 'output_file': str(path)}
+            for (numerator, denominator), path in staged.items()
+        ]
+
+        if self.r_workers.enabled:
+            self._run_deseq2_worker(counts, count_file, design_file, contrasts, progress_callback, cancel_event)
+        else:
+            self._run_deseq2_script(count_file, design_file, contrasts, progress_callback, cancel_event)
+
+    def _run_deseq2_worker(
+        self,
+        counts: pd.DataFrame,
+        count_file: Path,
+        design_file: Path,
+        contrasts: List[Dict[str, str]],
+        progress_callback: Optional[Callable[[str, Optional[int]], None]],
+        cancel_event: Optional[threading.Event]
+    ) -> None:
+        """Run DESeq2 on a warm R worker that reads the binary count block"""
+        if not matrix_io.has_binary(count_file):
+            matrix_io.write_binary(counts.to_numpy(), counts.index, counts.columns, count_file)
+
+        def on_line(line: str) -> None:
+            progress = parse_deseq2_progress(line)
+            if progress is not None and progress_callback is not None:
+                progress_callback(*progress)
+
+        request = {
+            'counts': matrix_io.npy_layout(count_file),
+            'design_file': str(design_file),
+            'contrasts': contrasts,
+            'parallel_workers': DESEQ2_PARALLEL_WORKERS
+        }
+        self.logger.info(f"Sending DESeq2 job to R worker pool: {request['counts']['path']}")
+        try:
+            output = self.r_workers.run(request, DESEQ2_TIMEOUT, on_line=on_line, cancel_event=cancel_event)
+        except RAnalysisError as e:
+            raise RuntimeError(f"DESeq2 analysis failed: {str(e)}")
+        except TimeoutError:
+            raise TimeoutError(f"DESeq2 analysis exceeded {DESEQ2_TIMEOUT} seconds")
+        if output:
+            self.logger.info(f"DESeq2 output:\n{''.join(output)}")
+
+    def _run_deseq2_script(
+        self,
+        count_file: Path,
+        design_file: Path,
+        contrasts: List[Dict[str, str]],
+        progress_callback: Optional[Callable[[str, Optional[int]], None]],
+        cancel_event: Optional[threading.Event]
+    ) -> None:
+        """Run deseq2_analysis.R in a fresh Rscript process"""
+        self.logger.info(f"R script exists: {self.r_script_path.exists()}")
+        contrasts_file = Path(contrasts[0]['output_file']).with_suffix('.contrasts.json')
+        with open(contrasts_file, 'w') as f:
+            json.dump(contrasts, f)
+
+        # The script takes <input_file> <output_file> <design_file> [<contrasts_file>]
+        cmd = [
+            "Rscript",
+            "--vanilla",
+            str(self.r_script_path),
+            str(count_file),
+            contrasts[0]['output_file'],
+            str(design_file),
+            str(contrasts_file)
+        ]
+        
+        self.logger.info(f"Running command: {' '.join(cmd)}")
+        
+        try:
             process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                bufsize=1
             )
+            output_lines: List[str] = []
+            reader = threading.Thread(
+                target=self._read_deseq2_output,
+                args=(process.stdout, output_lines, progress_callback),
+                daemon=True
+            )
+            reader.start()
+
+            deadline = time.monotonic() + DESEQ2_TIMEOUT
+            while True:
+                try:
+                    process.wait(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel_event is not None and cancel_event.is_set():
+                        process.kill()
+                        process.wait()
+                        raise JobCancelled("DESeq2 analysis cancelled")
+                    if time.monotonic() > deadline:
+                        process.kill()
+                        process.wait()
+                        raise TimeoutError(f"DESeq2 analysis exceeded {DESEQ2_TIMEOUT} seconds")
+            reader.join(timeout=5)
+        finally:
+            contrasts_file.unlink(missing_ok=True)
+
+        output = ''.join(output_lines)
+        if output:
+            self.logger.info(f"DESeq2 output:\n{output}")
             
-            stdout, stderr = process.communicate(timeout=300)
-            
-            if stdout:
-                self.logger.info(f"DESeq2 output:\n{stdout}")
-            if stderr:
-                self.logger.error(f"DESeq2 errors:\n{stderr}")
-                
-            if process.returncode != 0:
-                raise RuntimeError(f"DESeq2 analysis failed with return code {process.returncode}\nError: {stderr}")
-                
-            # Verify output
-            if not output_file.exists():
-                raise FileNotFoundError(f"DESeq2 did not create output file at {output_file}")
-                
-            with open(output_file, 'r') as f:
-                results = json.load(f)
-                self.logger.info(f"Successfully created results with {len(results)} entries")
-                
-            return True
-                
-        except Exception as e:
-            self.logger.error(f"Error running DESeq2 analysis: {str(e)}")
-            return False
+        if process.returncode != 0:
+            raise RuntimeError(f"DESeq2 analysis failed with return code {process.returncode}\nError: {output}")
+
+    def _read_deseq2_output(
+        self,
+        stream,
+        output_lines: List[str],
+        progress_callback: Optional[Callable[[str, Optional[int]], None]]
+    ) -> None:
+        """Collect script output and turn log_message lines into progress updates.
+
+        The pipe must be drained until the script exits, so a failing
+        callback (JobCancelled from job.report included) only stops the
+        progress updates; cancellation is handled by the polling loop.
+        """
+        for line in stream:
+            output_lines.append(line)
+            if progress_callback is None:
+                continue
+            progress = parse_deseq2_progress(line)
+            if progress is None:
+                continue
+            try:
+                progress_callback(*progress)
+            except Exception as e:
+                self.logger.info(f"Stopped DESeq2 progress updates: {str(e)}")
+                progress_callback = None
+
+    def process_upload(self, source: Any) -> Tuple[bool, str, Dict[str, Any]]:
+        """Stream an uploaded raw counts CSV into the raw and log matrices.
 
-    def process_upload(self, raw_counts_df: pd.DataFrame) -> Tuple[bool, str, Dict[str, Any]]:
-        """Process uploaded raw counts data"""
+        The file is parsed UPLOAD_CHUNK_ROWS rows at a time. Each block is
+        validated, stripped of all-zero genes, log-transformed and appended
+        to the raw_counts and log_transformed_data copies while the summary
+        statistics accumulate, so peak memory follows the block size rather
+        than the file size. Outputs are only published once the whole file
+        has been accepted. With NORMALISE_GENE_SYMBOLS, aliases and previous
+        symbols are renamed to their approved HGNC symbols, so DESeq2 results
+        carry the approved names too.
+        """
+        raw_writer = log_writer = None
+        symbol_index = gene_symbols.load_index() if NORMALISE_GENE_SYMBOLS else None
+        if NORMALISE_GENE_SYMBOLS and symbol_index is None:
+            self.logger.warning("NORMALISE_GENE_SYMBOLS is set but no HGNC dump is installed; keeping gene names")
         try:
-            # Validate data
-            is_valid, error_message = self.validate_raw_counts(raw_counts_df)
-            if not is_valid:
-                return False, error_message, {}
+            try:
+                reserved_genes = set()
+                if symbol_index is not None:
+                    # Names already in the file win over aliases that resolve to them
+                    reserved_genes = set(pd.read_csv(source, usecols=[0], dtype=str).iloc[:, 0])
+                    if hasattr(source, 'seek'):
+                        source.seek(0)
+                reader = pd.read_csv(source, index_col=0, chunksize=UPLOAD_CHUNK_ROWS)
+            except Exception as e:
+                return False, f"Error reading file: {str(e)}", {}
 
-            # Process data
-            raw_filtered, log_transformed = self.preprocess_data(raw_counts_df)
-            if raw_filtered is None or log_transformed is None:
-                return False, "Error processing data", {}
+            stats = count_stats.CountStats()
+            seen_genes = set()
+            output_genes = set()
+            for chunk in reader:
+                if chunk.empty:
+                    continue
+                if raw_writer is None:
+                    raw_dtype = np.int64 if all(pd.api.types.is_integer_dtype(t) for t in chunk.dtypes) else np.float64
+                    raw_writer = matrix_io.MatrixWriter(
+                        self.data_dir / "raw_counts.csv", chunk.columns, raw_dtype, index_label=chunk.index.name
+                    )
+                    log_writer = matrix_io.MatrixWriter(
+                        self.expression_store.path, chunk.columns, EXPRESSION_DTYPE, index_label=chunk.index.name
+                    )
 
-            # Calculate summary statistics
-            summary_stats = self.calculate_summary_stats(raw_filtered)
+                # Same checks as validate_raw_counts, applied per block
+                if chunk.index.duplicated().any() or seen_genes.intersection(chunk.index):
+                    return False, "Duplicate gene names found in the index", {}
+                seen_genes.update(chunk.index)
+                if chunk.select_dtypes(include=[np.number]).columns.size != chunk.columns.size:
+                    return False, "All count values must be numeric", {}
+                values = chunk.to_numpy()
+                # One fused pass: validation flags, zero-row mask and moments
+                scan = count_stats.scan_block(values)
+                if scan.negative:
+                    return False, "Raw counts cannot contain negative values", {}
+                # raw_counts stays integer only if every block is, as when the
+                # whole file is read at once
+                if raw_writer.dtype.kind == 'i' and values.dtype.kind == 'f':
+                    raw_writer.upcast(np.float64)
+                stats.update(scan)
 
-            return True, "Data processed successfully", {
-                'raw_filtered': raw_filtered,
-                'log_transformed': log_transformed,
-                'summary': summary_stats
-            }
+                # Remove genes with zero counts across all samples
+                kept = values[scan.keep]
+                genes = chunk.index[scan.keep]
+                if symbol_index is not None:
+                    genes = gene_symbols.normalise_unique(genes, symbol_index, output_genes, reserved_genes)
+                    if len(set(genes)) != len(genes) or output_genes.intersection(genes):
+                        return False, "Duplicate gene names after symbol normalisation", {}
+                    output_genes.update(genes)
+                raw_writer.append(kept, genes)
+                log_writer.append(np.log2(kept + 1), genes)
+
+            if raw_writer is None or not seen_genes:
+                return False, "File is empty", {}
+            if stats.zero_variance:
+                self.logger.warning(f"Found {stats.zero_variance} genes with zero variance")
+            if not raw_writer.genes:
+                return False, "No genes with non-zero counts", {}
+
+            raw_writer.commit()
+            log_writer.commit()
+            self.logger.info(f"Filtered data shape: ({len(raw_writer.genes)}, {len(raw_writer.samples)})")
+
+            # Medians need whole columns; read them back from the binary copy
+            raw_values, _, samples, _ = matrix_io.load_arrays(self.data_dir / "raw_counts.csv", mmap=True)
+            summary = stats.summary(samples, count_stats.column_medians(raw_values))
+            return True, "Data processed successfully", {'summary': summary}
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            return False, f"Error reading file: {str(e)}", {}
         except Exception as e:
             self.logger.error(f"Error in process_upload: {str(e)}")
-            return False, str(e), {}
\ No newline at end of file
+            return False, str(e), {}
+        finally:
+            for writer in (raw_writer, log_writer):
+                if writer is not None:
+                    writer.abort()
@@ -0,0 +1,465 @@
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# scipy is imported inside the engine functions: it adds ~0.5 s to app startup
+
+logger = logging.getLogger(__name__)
+
+# 'deseq2' runs deseq2_analysis.R; the others run in-process
+ENGINES = ('deseq2', 'nbinom', 'voom')
+PYTHON_ENGINES = ('nbinom', 'voom')
+
+RESULT_COLUMNS = ['gene', 'baseMean', 'log2_fold_change', 'p_value', 'adjusted_p_value']
+
+ProgressCallback = Callable[[str, Optional[int]], None]
+
+
+def validate_engine(engine: str) -> None:
+    """Raise ValueError for unknown engines"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unsupported engine '{engine}'. Available: {', '.join(ENGINES)}")
+
+
+def _noop(stage: str, progress: Optional[int] = None) -> None:
+    pass
+
+
+def align_conditions(samples: pd.Index, design: pd.DataFrame) -> pd.Categorical:
+    """Condition of every count column, with levels sorted like R factor levels"""
+    conditions = design.assign(sample=design['sample'].astype(str)).set_index('sample')['condition']
+    missing = [name for name in samples.astype(str) if name not in conditions.index]
+    if missing:
+        raise ValueError(f"Samples missing from design file: {', '.join(missing)}")
+    return pd.Categorical(conditions.loc[samples.astype(str)].astype(str))
+
+
+def default_contrast(levels: Sequence[str]) -> Tuple[str, str]:
+    """(numerator, denominator) used by DESeq2's results(): last level vs first"""
+    return levels[-1], levels[0]
+
+
+def contrast_name(contrast: Tuple[str, str]) -> str:
+    return f"{contrast[0]}_vs_{contrast[1]}"
+
+
+def resolve_contrasts(
+    requested: Optional[Union[str, Sequence[Union[str, Sequence[str]]]]],
+    levels: Sequence[str]
+) -> List[Tuple[str, str]]:
+    """Turn a contrast request into (numerator, denominator) pairs.
+
+    Accepts None (default contrast only), 'all' (every pairwise comparison,
+    later level over earlier level like DESeq2), or a list of
+    'numerator_vs_denominator' names or [numerator, denominator] pairs. The
+    default contrast is always included first.
+    """
+    levels = [str(level) for level in levels]
+    if len(levels) < 2:
+        raise ValueError("At least two different conditions required")
+    contrasts = [default_contrast(levels)]
+
+    if requested == 'all':
+        pairs = [(later, earlier) for i, earlier in enumerate(levels) for later in levels[i + 1:]]
+    elif isinstance(requested, str):
+        pairs = [requested]
+    else:
+        pairs = list(requested or [])
+
+    names = {contrast_name((a, b)): (a, b) for a in levels for b in levels if a != b}
+    for pair in pairs:
+        if isinstance(pair, str):
+            if pair not in names:
+                raise ValueError(f"Unknown contrast '{pair}'. Conditions: {', '.join(levels)}")
+            pair = names[pair]
+        numerator, denominator = (str(level) for level in pair)
+        if numerator not in levels or denominator not in levels or numerator == denominator:
+            raise ValueError(f"Invalid contrast {numerator} vs {denominator}. Conditions: {', '.join(levels)}")
+        if (numerator, denominator) not in contrasts:
+            contrasts.append((numerator, denominator))
+    return contrasts
+
+
+def size_factors(counts: np.ndarray) -> np.ndarray:
+    """DESeq2 median-of-ratios size factors"""
+    with np.errstate(divide='ignore'):
+        log_counts = np.log(counts)
+    log_geo_means = log_counts.mean(axis=1)
+    usable = np.isfinite(log_geo_means)
+    if not usable.any():
+        raise ValueError("Every gene contains a zero count; cannot estimate size factors")
+    return np.exp(np.median(log_counts[usable] - log_geo_means[usable, None], axis=0))
+
+
+def bh_adjust(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values; NaN entries stay NaN"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full(p_values.shape, np.nan)
+    tested = ~np.isnan(p_values)
+    p = p_values[tested]
+    n = len(p)
+    if n == 0:
+        return adjusted
+    order = np.argsort(p)[::-1]
+    ranked = np.minimum.accumulate(p[order] * n / np.arange(n, 0, -1))
+    result = np.empty(n)
+    result[order] = np.minimum(ranked, 1.0)
+    adjusted[tested] = result
+    return adjusted
+
+
+def independent_filter(base_mean: np.ndarray, p_values: np.ndarray, alpha: float = 0.1) -> np.ndarray:
+    """Adjust p-values after dropping low-mean genes, as DESeq2's results() does.
+
+    The baseMean quantile that maximises the number of rejections at alpha is
+    chosen; genes below it get NaN adjusted p-values.
+    """
+    best, best_rejections = bh_adjust(p_values), -1
+    tested = ~np.isnan(p_values)
+    if not tested.any():
+        return best
+    for quantile in np.linspace(0, 0.95, 50):
+        threshold = np.quantile(base_mean[tested], quantile)
+        keep = base_mean > threshold if quantile > 0 else np.ones_like(tested)
+        adjusted = bh_adjust(np.where(keep, p_values, np.nan))
+        rejections = int(np.nansum(adjusted < alpha))
+        if rejections > best_rejections:
+            best, best_rejections = adjusted, rejections
+    return best
+
+
+def _one_hot(conditions: pd.Categorical) -> np.ndarray:
+    """Samples x levels indicator matrix for a one-factor design"""
+    return np.eye(len(conditions.categories))[conditions.codes]
+
+
+def _nb_group_means(
+    counts: np.ndarray,
+    factors: np.ndarray,
+    groups: np.ndarray,
+    alpha: np.ndarray,
+    iterations: int = 30
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Maximum-likelihood level means q for mu = s * q under a NB model.
+
+    With a one-factor design the Fisher information is diagonal, so every
+    level is a scalar Newton update on log q, vectorised over genes. Returns
+    the means and the per-level information sum(mu / (1 + alpha * mu)).
+    """
+    normalized = counts / factors
+    q = (normalized @ groups) / groups.sum(axis=0)
+    # Levels with only zero counts are capped, like DESeq2's beta bounds
+    q = np.maximum(q, 1e-8)
+    log_q = np.log(q)
+    for _ in range(iterations):
+        mu = (np.exp(log_q) @ groups.T) * factors
+        denom = 1 + alpha[:, None] * mu
+        score = ((counts - mu) / denom) @ groups
+        info = (mu / denom) @ groups
+        step = np.where(info > 0, score / np.maximum(info, 1e-300), 0)
+        log_q = np.clip(log_q + step, np.log(1e-8), None)
+        if np.abs(step).max(initial=0) < 1e-8:
+            break
+    mu = (np.exp(log_q) @ groups.T) * factors
+    info = (mu / (1 + alpha[:, None] * mu)) @ groups
+    return np.exp(log_q), info
+
+
+def _nb_profile_loglik(counts: np.ndarray, mu: np.ndarray, groups: np.ndarray, alpha) -> np.ndarray:
+    """Cox-Reid adjusted NB log-likelihood of every gene at a shared or per-gene dispersion"""
+    from scipy import special
+
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), counts.shape[:1])[:, None]
+    size = 1 / alpha
+    loglik = (
+        special.gammaln(counts + size) - special.gammaln(size)
+        + counts * np.log(alpha * mu) - (counts + size) * np.log1p(alpha * mu)
+    ).sum(axis=1)
+    info = (mu / (1 + alpha * mu)) @ groups
+    return loglik - 0.5 * np.log(info).sum(axis=1)
+
+
+def _grid_maximise(objective: Callable[[np.ndarray], np.ndarray], low: float, high: float, points: int = 60) -> np.ndarray:
+    """Per-gene argmax of objective(log alpha) over a coarse then a fine grid"""
+    grid = np.linspace(low, high, points)
+    values = np.stack([objective(a) for a in grid], axis=1)
+    best = grid[np.argmax(values, axis=1)]
+    step = grid[1] - grid[0]
+
+    offsets = np.linspace(-step, step, 21)
+    fine = np.stack([objective(best + o) for o in offsets], axis=1)
+    return np.clip(best + offsets[np.argmax(fine, axis=1)], low, high)
+
+
+def _fit_dispersion_trend(mean: np.ndarray, dispersion: np.ndarray) -> np.ndarray:
+    """Fit DESeq2's parametric trend a0 + a1 / mean with a gamma GLM"""
+    usable = dispersion > 100 * 1e-8
+    coefs = np.array([0.1, 1.0])
+    for _ in range(10):
+        design = np.column_stack([np.ones(usable.sum()), 1 / mean[usable]])
+        for _ in range(25):
+            fitted = design @ coefs
+            weights = 1 / fitted ** 2
+            new_coefs = np.linalg.solve(design.T @ (design * weights[:, None]), design.T @ (weights * dispersion[usable]))
+            if np.any(new_coefs <= 0):
+                break
+            converged = np.allclose(new_coefs, coefs, rtol=1e-6)
+            coefs = new_coefs
+            if converged:
+                break
+        if np.any(coefs <= 0):
+            # Fall back to a constant trend, as DESeq2 falls back to a simpler fit
+            logger.warning("Parametric dispersion trend failed; using the mean dispersion")
+            return np.full(mean.shape, dispersion[usable].mean() if usable.any() else 0.1)
+        ratio = dispersion / (coefs[0] + coefs[1] / mean)
+        refit = (dispersion > 100 * 1e-8) & (ratio > 1e-4) & (ratio < 15)
+        if np.array_equal(refit, usable):
+            break
+        usable = refit
+    return coefs[0] + coefs[1] / mean
+
+
+def nbinom_wald(
+    counts: np.ndarray,
+    conditions: pd.Categorical,
+    contrasts: Optional[List[Tuple[str, str]]] = None,
+    progress: ProgressCallback = _noop
+) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """DESeq2-style negative binomial GLM with Wald tests.
+
+    Follows DESeq2's steps for a one-factor design: median-of-ratios size
+    factors, Cox-Reid gene-wise dispersions, a parametric dispersion trend,
+    MAP shrinkage towards it, then a Wald test per contrast and independent
+    filtering. The model is fitted once for all contrasts. Cook's distance
+    outlier handling is not done.
+    """
+    from scipy import special, stats
+
+    counts = np.asarray(counts, dtype=np.float64)
+    contrasts = contrasts or [default_contrast(conditions.categories)]
+    groups = _one_hot(conditions)
+    n_samples, n_levels = groups.shape
+    if n_samples <= n_levels:
+        raise ValueError("At least one replicate is needed to estimate dispersions")
+
+    progress("Estimating size factors", 10)
+    factors = size_factors(counts)
+    normalized = counts / factors
+    base_mean = normalized.mean(axis=1)
+    expressed = base_mean > 0
+    y = counts[expressed]
+    gene_mean = base_mean[expressed]
+
+    progress("Estimating gene-wise dispersions", 25)
+    max_log_alpha = np.log(max(10.0, n_samples))
+    min_log_alpha = np.log(1e-8)
+    residual_df = n_samples - n_levels
+    group_means = (normalized[expressed] @ groups) / groups.sum(axis=0)
+    residual_var = ((normalized[expressed] - group_means @ groups.T) ** 2).sum(axis=1) / residual_df
+    moments = (residual_var - gene_mean * np.mean(1 / factors)) / gene_mean ** 2
+    start = np.clip(moments, 1e-8, np.exp(max_log_alpha))
+
+    q, _ = _nb_group_means(y, factors, groups, start)
+    mu = (q @ groups.T) * factors
+    gene_loglik = lambda log_alpha: _nb_profile_loglik(y, mu, groups, np.exp(log_alpha))
+    log_gene_wise = _grid_maximise(gene_loglik, min_log_alpha, max_log_alpha)
+    gene_wise = np.exp(log_gene_wise)
+
+    progress("Fitting dispersion trend", 45)
+    trend = _fit_dispersion_trend(gene_mean, gene_wise)
+
+    progress("Shrinking dispersions", 55)
+    fitted_genes = gene_wise > 100 * 1e-8
+    log_residuals = log_gene_wise[fitted_genes] - np.log(trend[fitted_genes])
+    residual_sd = stats.median_abs_deviation(log_residuals, scale='normal') if fitted_genes.any() else 0.0
+    prior_var = max(residual_sd ** 2 - special.polygamma(1, residual_df / 2), 0.25)
+    log_trend = np.log(trend)
+    posterior = lambda log_alpha: gene_loglik(log_alpha) - (log_alpha - log_trend) ** 2 / (2 * prior_var)
+    log_map = _grid_maximise(posterior, min_log_alpha, max_log_alpha)
+    # Genes far above the trend keep their gene-wise estimate
+    outliers = log_gene_wise > log_trend + 2 * residual_sd
+    dispersion = np.exp(np.where(outliers, log_gene_wise, log_map))
+
+    progress("Running Wald tests", 75)
+    q, info = _nb_group_means(y, factors, groups, dispersion)
+    results = {}
+    for numerator, denominator in contrasts:
+        num = conditions.categories.get_loc(numerator)
+        den = conditions.categories.get_loc(denominator)
+        lfc = np.log2(q[:, num] / q[:, den])
+        se = np.sqrt(1 / info[:, num] + 1 / info[:, den]) / np.log(2)
+
+        log2_fold_change = np.full(counts.shape[0], np.nan)
+        p_values = np.full(counts.shape[0], np.nan)
+        log2_fold_change[expressed] = lfc
+        p_values[expressed] = 2 * stats.norm.sf(np.abs(lfc / se))
+        results[(numerator, denominator)] = pd.DataFrame({
+            'baseMean': base_mean,
+            'log2_fold_change': log2_fold_change,
+            'p_value': p_values,
+            'adjusted_p_value': independent_filter(base_mean, p_values)
+        })
+    return results
+
+
+def _lowess(x: np.ndarray, y: np.ndarray, frac: float = 0.5, points: int = 200, robust_iterations: int = 3) -> Callable[[np.ndarray], np.ndarray]:
+    """Robust local-linear smoother evaluated on a grid and interpolated.
+
+    Mirrors R's lowess(f=frac) closely enough for voom's mean-variance trend
+    without fitting every gene individually.
+    """
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    n = len(x)
+    window = max(2, int(np.ceil(frac * n)))
+    grid = np.quantile(x, np.linspace(0, 1, min(points, n)))
+    robustness = np.ones(n)
+
+    for _ in range(robust_iterations + 1):
+        fitted_grid = np.empty(len(grid))
+        for i, x0 in enumerate(grid):
+            distance = np.abs(x - x0)
+            radius = np.partition(distance, window - 1)[window - 1]
+            weights = np.clip(1 - (distance / max(radius, 1e-12)) ** 3, 0, None) ** 3 * robustness
+            total = weights.sum()
+            mean_x = (weights * x).sum() / total
+            mean_y = (weights * y).sum() / total
+            var_x = (weights * (x - mean_x) ** 2).sum()
+            slope = (weights * (x - mean_x) * (y - mean_y)).sum() / var_x if var_x > 1e-12 else 0.0
+            fitted_grid[i] = mean_y + slope * (x0 - mean_x)
+        residuals = y - np.interp(x, grid, fitted_grid)
+        scale = 6 * np.median(np.abs(residuals))
+        if scale < 1e-12:
+            break
+        robustness = np.clip(1 - (residuals / scale) ** 2, 0, None) ** 2
+
+    return lambda values: np.interp(values, grid, fitted_grid)
+
+
+def _trigamma_inverse(x: float) -> float:
+    """Solve trigamma(y) = x by Newton's method (limma's trigammaInverse)"""
+    from scipy import special
+
+    if x > 1e7:
+        return 1 / np.sqrt(x)
+    if x < 1e-6:
+        return 1 / x
+    y = 0.5 + 1 / x
+    for _ in range(50):
+        tri = special.polygamma(1, y)
+        step = tri * (1 - tri / x) / special.polygamma(2, y)
+        y += step
+        if -step / y < 1e-8:
+            break
+    return y
+
+
+def _squeeze_variances(variances: np.ndarray, df: float) -> Tuple[np.ndarray, float]:
+    """limma's empirical Bayes variance moderation; returns (posterior, prior df)"""
+    from scipy import special
+
+    finite = np.isfinite(variances) & (variances > 0)
+    z = np.log(variances[finite])
+    e = z - special.digamma(df / 2) + np.log(df / 2)
+    e_mean = e.mean()
+    e_var = e.var(ddof=1) - special.polygamma(1, df / 2)
+    if e_var > 0:
+        prior_df = 2 * _trigamma_inverse(e_var)
+        prior_var = np.exp(e_mean + special.digamma(prior_df / 2) - np.log(prior_df / 2))
+        posterior = (prior_df * prior_var + df * variances) / (prior_df + df)
+    else:
+        prior_df = np.inf
+        posterior = np.full(variances.shape, np.exp(e_mean))
+    return posterior, prior_df
+
+
+def voom_limma(
+    counts: np.ndarray,
+    conditions: pd.Categorical,
+    contrasts: Optional[List[Tuple[str, str]]] = None,
+    progress: ProgressCallback = _noop
+) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """limma-voom: precision-weighted log-CPM linear model with moderated t-tests.
+
+    One fit serves every contrast.
+    """
+    from scipy import stats
+
+    counts = np.asarray(counts, dtype=np.float64)
+    contrasts = contrasts or [default_contrast(conditions.categories)]
+    groups = _one_hot(conditions)
+    n_samples, n_levels = groups.shape
+    residual_df = n_samples - n_levels
+    if residual_df < 1:
+        raise ValueError("At least one replicate is needed to estimate variances")
+
+    progress("Computing log-CPM", 10)
+    # Effective library sizes from median-of-ratios factors, which play the
+    # role of edgeR's TMM normalisation factors
+    factors = size_factors(counts)
+    lib_size = factors * np.exp(np.mean(np.log(counts.sum(axis=0))))
+    log_cpm = np.log2((counts + 0.5) / (lib_size + 1) * 1e6)
+    counts_per_level = groups.sum(axis=0)
+
+    progress("Estimating mean-variance trend", 30)
+    level_means = (log_cpm @ groups) / counts_per_level
+    fitted = level_means @ groups.T
+    sigma = np.sqrt(((log_cpm - fitted) ** 2).sum(axis=1) / residual_df)
+    expressed = counts.sum(axis=1) > 0
+    mean_log_count = log_cpm.mean(axis=1) + np.mean(np.log2(lib_size + 1)) - np.log2(1e6)
+    trend = _lowess(mean_log_count[expressed], np.sqrt(sigma[expressed]))
+
+    progress("Computing precision weights", 50)
+    fitted_log_count = fitted + np.log2(lib_size + 1) - np.log2(1e6)
+    weights = 1 / np.maximum(trend(fitted_log_count), 1e-12) ** 4
+
+    progress("Fitting weighted linear models", 65)
+    weight_sums = weights @ groups
+    coefficients = ((weights * log_cpm) @ groups) / weight_sums
+    residuals = log_cpm - coefficients @ groups.T
+    variances = (weights * residuals ** 2).sum(axis=1) / residual_df
+
+    progress("Moderating variances", 80)
+    posterior, prior_df = _squeeze_variances(variances, residual_df)
+    total_df = min(residual_df + prior_df, residual_df * len(counts))
+    base_mean = (counts / factors).mean(axis=1)
+
+    progress("Testing contrasts", 90)
+    results = {}
+    for numerator, denominator in contrasts:
+        num = conditions.categories.get_loc(numerator)
+        den = conditions.categories.get_loc(denominator)
+        lfc = coefficients[:, num] - coefficients[:, den]
+        t = lfc / np.sqrt(posterior * (1 / weight_sums[:, num] + 1 / weight_sums[:, den]))
+        p_value = 2 * stats.t.sf(np.abs(t), total_df)
+        results[(numerator, denominator)] = pd.DataFrame({
+            'baseMean': base_mean,
+            'log2_fold_change': lfc,
+            'p_value': p_value,
+            'adjusted_p_value': bh_adjust(p_value)
+        })
+    return results
+
+
+def run_engine(
+    engine: str,
+    counts: pd.DataFrame,
+    design: pd.DataFrame,
+    contrasts: Optional[List[Tuple[str, str]]] = None,
+    progress: ProgressCallback = _noop
+) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """Run an in-process engine and return rows in the deseq2_results.json schema per contrast"""
+    if engine not in PYTHON_ENGINES:
+        raise ValueError(f"Engine '{engine}' does not run in-process")
+    conditions = align_conditions(counts.columns, design)
+    if len(conditions.categories) < 2:
+        raise ValueError("At least two different conditions required")
+
+    fit = nbinom_wald if engine == 'nbinom' else voom_limma
+    results = fit(counts.to_numpy(dtype=np.float64), conditions, contrasts=contrasts, progress=progress)
+    genes = counts.index.astype(str)
+    for frame in results.values():
+        frame.insert(0, 'gene', genes)
+    return {contrast: frame[RESULT_COLUMNS] for contrast, frame in results.items()}
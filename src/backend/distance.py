@@ -0,0 +1,83 @@
+import numpy as np
+
+from config import EXPRESSION_BLOCK_BYTES
+
+# Metrics that reduce to 1 - U·Uᵀ after normalising the rows of U
+GEMM_METRICS = ('correlation', 'cosine')
+
+
+def _rows_per_block(n: int, itemsize: int, block_bytes: int) -> int:
+    return max(1, block_bytes // (itemsize * max(n, 1)))
+
+
+def _normalised_rows(values: np.ndarray, center: bool, dtype) -> np.ndarray:
+    """Rows scaled to unit norm (after centering for correlation)"""
+    unit = np.array(values, dtype=dtype, copy=True)
+    if center:
+        unit -= unit.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(unit, axis=1, keepdims=True)
+    # Constant rows get NaN distances, as pdist does
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unit /= norms
+    return unit
+
+
+def _gemm_condensed(values: np.ndarray, center: bool, dtype, block_bytes: int, out_dtype) -> np.ndarray:
+    """Condensed 1 - U·Uᵀ, one block of rows per matrix product, stored as out_dtype"""
+    unit = _normalised_rows(values, center, dtype)
+    n = unit.shape[0]
+    condensed = np.empty(n * (n - 1) // 2, dtype=out_dtype)
+    rows_per_block = _rows_per_block(n, unit.itemsize, block_bytes)
+
+    for start in range(0, n - 1, rows_per_block):
+        stop = min(start + rows_per_block, n - 1)
+        # Only the upper triangle is needed, so multiply against rows start..n-1
+        block = unit[start:stop] @ unit[start:].T
+        np.subtract(1, block, out=block)
+        np.clip(block, 0, 2, out=block)
+        for i in range(start, stop):
+            offset = n * i - i * (i + 1) // 2
+            condensed[offset:offset + n - i - 1] = block[i - start, i - start + 1:]
+    return condensed
+
+
+def _cdist_condensed(values: np.ndarray, metric: str, dtype, block_bytes: int) -> np.ndarray:
+    """Condensed distances for any scipy metric, built from cdist row blocks"""
+    from scipy.spatial.distance import cdist
+
+    n = values.shape[0]
+    condensed = np.empty(n * (n - 1) // 2, dtype=dtype)
+    rows_per_block = _rows_per_block(n, 8, block_bytes)
+    for start in range(0, n - 1, rows_per_block):
+        stop = min(start + rows_per_block, n - 1)
+        block = cdist(values[start:stop], values[start:], metric=metric)
+        for i in range(start, stop):
+            offset = n * i - i * (i + 1) // 2
+            condensed[offset:offset + n - i - 1] = block[i - start, i - start + 1:]
+    return condensed
+
+
+def condensed_distances(
+    values: np.ndarray,
+    metric: str = 'correlation',
+    dtype=np.float64,
+    block_bytes: int = EXPRESSION_BLOCK_BYTES,
+    out_dtype=None
+) -> np.ndarray:
+    """Pairwise row distances in pdist's condensed layout.
+
+    Correlation and cosine distances are computed as 1 - U·Uᵀ on unit-norm
+    rows, so the work is a multi-threaded BLAS product instead of pdist's
+    single-threaded loop. The product is evaluated in dtype, in row blocks
+    of at most block_bytes, and each block is written straight into the
+    result, which is out_dtype (dtype by default). Other metrics use pdist
+    for a float64 result or blocked cdist otherwise.
+    """
+    dtype = np.dtype(dtype)
+    out_dtype = dtype if out_dtype is None else np.dtype(out_dtype)
+    if metric in GEMM_METRICS:
+        return _gemm_condensed(values, metric == 'correlation', dtype, block_bytes, out_dtype)
+    if out_dtype == np.float64:
+        from scipy.spatial.distance import pdist
+        return pdist(values, metric=metric)
+    return _cdist_condensed(values, metric, out_dtype, block_bytes)
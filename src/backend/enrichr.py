@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    DELAY_BETWEEN_RETRIES,
+    ENRICHR_ADD_LIST_URL,
+    ENRICHR_ENRICH_URL,
+    ENRICHR_LIST_CACHE_SIZE,
+    ENRICHR_LIST_TTL,
+    ENRICHR_MAX_CONCURRENCY,
+    ENRICHR_TIMEOUT,
+    MAX_RETRIES
+)
+from tool_cache import ToolResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichrError(RuntimeError):
+    """Enrichr rejected a request or returned something unusable"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, details: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+def gene_set_key(genes: Iterable[str]) -> str:
+    """Hash of a gene list that ignores order and duplicates"""
+    digest = hashlib.sha256()
+    for gene in sorted(set(map(str, genes))):
+        digest.update(gene.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class EnrichrClient:
+    """Pooled Enrichr client that uploads each gene list once.
+
+    The userListId returned by addList is cached per gene-set hash, so
+    switching libraries only costs an /enrich call. Library lookups run on a
+    small shared thread pool, which also bounds concurrency across requests,
+    and 429 responses are retried with exponential backoff (honouring
+    Retry-After). With a cache, library results for a gene set already seen
+    are served locally and only the missing libraries reach Enrichr.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = ENRICHR_MAX_CONCURRENCY,
+        timeout: float = ENRICHR_TIMEOUT,
+        list_ttl: float = ENRICHR_LIST_TTL,
+        list_cache_size: int = ENRICHR_LIST_CACHE_SIZE,
+        max_retries: int = MAX_RETRIES,
+        retry_delay: float = DELAY_BETWEEN_RETRIES,
+        cache: Optional[ToolResultCache] = None
+    ):
+        self.timeout = timeout
+        self.cache = cache
+        self.list_ttl = list_ttl
+        self.list_cache_size = list_cache_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_concurrency, 1), thread_name_prefix='enrichr')
+
+        self._lists: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lists_lock = threading.Lock()
+        # One upload per gene set even when several requests race for it
+        self._uploads: Dict[str, threading.Lock] = {}
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request, backing off on 429 until max_retries is used up"""
+        for attempt in range(self.max_retries + 1):
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                break
+            retry_after = response.headers.get('Retry-After')
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = self.retry_delay * 2 ** attempt
+            logger.warning(f"Enrichr rate limited {url}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+        if response.status_code != 200:
+            raise EnrichrError(
+                f"Enrichr API returned status {response.status_code}",
+                status_code=response.status_code,
+                details=response.text
+            )
+        return response
+
+    @staticmethod
+    def _json(response: requests.Response) -> Dict[str, Any]:
+        try:
+            return response.json()
+        except ValueError:
+            logger.error(f"Unexpected Enrichr response: {response.text}")
+            raise EnrichrError("Enrichr API returned an unexpected response", details=response.text)
+
+    def _cached_list(self, key: str) -> Optional[int]:
+        with self._lists_lock:
+            entry = self._lists.get(key)
+            if entry is None:
+                return None
+            user_list_id, created = entry
+            if time.monotonic() - created > self.list_ttl:
+                del self._lists[key]
+                return None
+            self._lists.move_to_end(key)
+            return user_list_id
+
+    def add_list(self, genes: List[str], description: str = 'Gene list') -> int:
+        """Upload a gene list, reusing the userListId of an identical set"""
+        key = gene_set_key(genes)
+        user_list_id = self._cached_list(key)
+        if user_list_id is not None:
+            return user_list_id
+
+        with self._lists_lock:
+            upload_lock = self._uploads.setdefault(key, threading.Lock())
+        try:
+            with upload_lock:
+                user_list_id = self._cached_list(key)
+                if user_list_id is not None:
+                    return user_list_id
+
+                response = self._request('POST', ENRICHR_ADD_LIST_URL, files={
+                    'list': (None, '\n'.join(genes)),
+                    'description': (None, description)
+                })
+                user_list_id = self._json(response).get('userListId')
+                if not user_list_id:
+                    raise EnrichrError("No userListId received from Enrichr")
+
+                with self._lists_lock:
+                    self._lists[key] = (user_list_id, time.monotonic())
+                    self._lists.move_to_end(key)
+                    while len(self._lists) > self.list_cache_size:
+                        self._lists.popitem(last=False)
+                logger.info(f"Submitted {len(genes)} genes to Enrichr as list {user_list_id}")
+                return user_list_id
+        finally:
+            with self._lists_lock:
+                self._uploads.pop(key, None)
+
+    def enrich(self, user_list_id: int, library: str) -> List[Any]:
+        """Enrichment table of one library for an uploaded list"""
+        response = self._request('GET', ENRICHR_ENRICH_URL, params={
+            'userListId': user_list_id,
+            'backgroundType': library
+        })
+        return self._json(response).get(library, [])
+
+    def enrich_libraries(
+        self,
+        genes: List[str],
+        libraries: List[str]
+    ) -> Tuple[Dict[str, List[Any]], Dict[str, EnrichrError]]:
+        """Results for several libraries from one upload.
+
+        Libraries are fetched concurrently. A library that fails is reported
+        in the errors dict instead of failing the whole batch, except when it
+        is the only one requested; upload failures always raise.
+        """
+        results: Dict[str, List[Any]] = {}
+        errors: Dict[str, EnrichrError] = {}
+        if self.cache is not None:
+            for library in libraries:
+                cached = self.cache.get('enrichr', genes, library)
+                if cached is not None:
+                    results[library] = cached
+        missing = [library for library in libraries if library not in results]
+        if not missing:
+            return results, errors
+
+        user_list_id = self.add_list(genes)
+        futures = {library: self._executor.submit(self.enrich, user_list_id, library) for library in missing}
+        for library, future in futures.items():
+            try:
+                results[library] = future.result()
+                if self.cache is not None:
+                    self.cache.put('enrichr', genes, results[library], library)
+            except EnrichrError as e:
+                errors[library] = e
+            except requests.RequestException as e:
+                errors[library] = EnrichrError(f"Enrichr request failed: {str(e)}")
+
+        if errors and len(libraries) == 1:
+            raise errors[libraries[0]]
+        return results, errors
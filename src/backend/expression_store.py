@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import matrix_io
+from config import EXPRESSION_DTYPE, EXPRESSION_MMAP
+
+logger = logging.getLogger(__name__)
+
+
+def file_content_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Compute a content hash for a data file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_variances(values: np.ndarray) -> np.ndarray:
+    """Per-row sample variance (ddof=1), computed one block of rows at a time"""
+    variances = np.empty(values.shape[0], dtype=np.float64)
+    for start, stop in matrix_io.row_blocks(values):
+        variances[start:stop] = np.var(values[start:stop], axis=1, ddof=1)
+    return variances
+
+
+@dataclass(frozen=True)
+class ExpressionMatrix:
+    """Immutable snapshot of the log-transformed expression matrix.
+
+    ``values`` may be a read-only memmap, so helpers here touch only the rows
+    and columns they need instead of materialising the whole matrix.
+    """
+    values: np.ndarray
+    genes: pd.Index
+    samples: pd.Index
+    version: str
+    _cache: Dict[str, np.ndarray] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.values.shape
+
+    def to_frame(self) -> pd.DataFrame:
+        """Wrap the matrix in a DataFrame without copying the values"""
+        return pd.DataFrame(self.values, index=self.genes, columns=self.samples, copy=False)
+
+    def row_variances(self) -> np.ndarray:
+        """Per-gene variance, computed once per snapshot"""
+        if 'row_variances' not in self._cache:
+            self._cache['row_variances'] = row_variances(self.values)
+        return self._cache['row_variances']
+
+    def top_variable(self, top_n: int) -> np.ndarray:
+        """Row positions of the top_n most variable genes, highest first"""
+        variances = self.row_variances()
+        # NaN variances (single-sample matrices) sort last, like nlargest drops them
+        ranked = np.where(np.isnan(variances), -np.inf, variances)
+        return np.argsort(-ranked, kind='stable')[:top_n]
+
+    def take(
+        self,
+        rows: Optional[Sequence[int]] = None,
+        cols: Optional[Sequence[int]] = None
+    ) -> pd.DataFrame:
+        """Materialise only the selected rows/columns as a DataFrame"""
+        values = self.values
+        genes, samples = self.genes, self.samples
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            # Read rows in file order, then restore the requested order
+            order = np.argsort(rows, kind='stable')
+            block = np.empty((len(rows), values.shape[1]), dtype=values.dtype)
+            block[order] = values[rows[order]]
+            values, genes = block, genes[rows]
+        if cols is not None:
+            cols = np.asarray(cols, dtype=np.intp)
+            values, samples = values[:, cols], samples[cols]
+        return pd.DataFrame(values, index=genes, columns=samples, copy=False)
+
+
+    def sample_positions(self, samples: Sequence[str]) -> np.ndarray:
+        """Column positions for sample names, raising ValueError on unknown names"""
+        positions = self.samples.get_indexer(samples)
+        missing = [name for name, pos in zip(samples, positions) if pos < 0]
+        if missing:
+            raise ValueError(f"Unknown samples: {', '.join(missing)}")
+        return positions
+
+    def query(
+        self,
+        gene_filter: Optional[str] = None,
+        samples: Optional[Sequence[str]] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[pd.DataFrame, int]:
+        """Select a window of the matrix.
+
+        Genes are filtered by a case-insensitive substring match, optionally
+        sorted by one sample's values, then sliced to [offset, offset + limit).
+        Only the rows in the returned window are read from the matrix. Returns
+        the window and the number of genes that matched the filter.
+        """
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("offset and limit must be non-negative")
+
+        rows = np.arange(len(self.genes))
+        if gene_filter:
+            if 'genes_lower' not in self._cache:
+                self._cache['genes_lower'] = self.genes.astype(str).str.lower()
+            mask = self._cache['genes_lower'].str.contains(gene_filter.lower(), regex=False)
+            rows = rows[np.asarray(mask, dtype=bool)]
+        matched = len(rows)
+
+        if sort_by is not None:
+            column = self.sample_positions([sort_by])[0]
+            keys = np.asarray(self.values[rows, column], dtype=np.float64)
+            if descending:
+                keys = -keys
+            # Stable sort keeps gene order for ties; NaN sorts last either way
+            rows = rows[np.argsort(keys, kind='stable')]
+
+        stop = None if limit is None else offset + limit
+        rows = rows[offset:stop]
+
+        cols = self.sample_positions(samples) if samples else None
+        return self.take(rows=rows, cols=cols), matched
+
+class ExpressionStore:
+    """Process-wide cache of the log-transformed expression matrix.
+
+    The matrix is loaded once and kept as a contiguous NumPy block, from the
+    binary copy when one is available and from the CSV otherwise. With mmap
+    enabled the binary copy is memory-mapped, so matrices larger than RAM are
+    paged in on demand. Each access
+    stats the backing file and only reloads it when the mtime/size changed and
+    the content hash differs from the loaded version.
+    """
+
+    def __init__(self, path: Path, dtype: str = EXPRESSION_DTYPE, mmap: bool = EXPRESSION_MMAP):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._matrix: Optional[ExpressionMatrix] = None
+        self._stat: Optional[Tuple[str, int, int]] = None
+
+    def _file_stat(self) -> Tuple[str, int, int]:
+        source = matrix_io.source_path(self.path)
+        st = os.stat(source)
+        return str(source), st.st_mtime_ns, st.st_size
+
+    def _content_version(self) -> str:
+        if matrix_io.has_binary(self.path):
+            return matrix_io.read_index(self.path)['content_hash']
+        return file_content_hash(self.path)
+
+    def _load(self) -> ExpressionMatrix:
+        values, genes, samples, version = matrix_io.load_arrays(self.path, dtype=self.dtype, mmap=self.mmap)
+        if version is None:
+            version = file_content_hash(self.path)
+        values = np.ascontiguousarray(values)
+        values.setflags(write=False)
+        return ExpressionMatrix(values=values, genes=genes, samples=samples, version=version)
+
+    def get(self) -> ExpressionMatrix:
+        """Return the current matrix, reloading it if the file changed"""
+        if not (self.path.exists() or matrix_io.has_binary(self.path)):
+            raise FileNotFoundError(f"Expression data file not found at {self.path}")
+
+        stat = self._file_stat()
+        matrix = self._matrix
+        if matrix is not None and stat == self._stat:
+            return matrix
+
+        with self._lock:
+            # Another thread may have reloaded while we were waiting
+            stat = self._file_stat()
+            if self._matrix is not None and stat == self._stat:
+                return self._matrix
+
+            if self._matrix is not None and self._content_version() == self._matrix.version:
+                self.logger.debug("Expression file touched but content unchanged")
+                self._stat = stat
+                return self._matrix
+
+            matrix = self._load()
+            self.logger.info(f"Loaded expression matrix {matrix.shape} (version {matrix.version})")
+            self._matrix = matrix
+            self._stat = stat
+            return matrix
+
+    def reload(self) -> ExpressionMatrix:
+        """Load the matrix that was just written to disk and swap it in"""
+        with self._lock:
+            stat = self._file_stat()
+            matrix = self._load()
+            self._matrix = matrix
+            self._stat = stat
+
+        self.logger.info(f"Swapped in expression matrix {matrix.shape} (version {matrix.version})")
+        return matrix
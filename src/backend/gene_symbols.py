@@ -0,0 +1,149 @@
+import csv
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import HGNC_DUMP_PATH, HGNC_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolIndex:
+    """In-memory HGNC symbol index with alias and previous-symbol lookups.
+
+    Built from the HGNC complete set (hgnc_complete_set.txt, tab separated,
+    with symbol, alias_symbol and prev_symbol columns; multiple values are
+    '|' separated). Keys are upper-cased, so every lookup is one dict access.
+    Aliases or previous symbols shared by several approved genes are left
+    unresolved rather than guessed.
+    """
+
+    def __init__(self, approved: Iterable[str], aliases: Dict[str, str], version: Optional[List[int]] = None):
+        self.approved: Dict[str, str] = {symbol.upper(): symbol for symbol in approved}
+        self.aliases = aliases
+        self.version = version
+
+    @classmethod
+    def from_hgnc(cls, path: Path, version: Optional[List[int]] = None) -> 'SymbolIndex':
+        approved: List[str] = []
+        candidates: Dict[str, Set[str]] = {}
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f, delimiter='\t')
+            for row in reader:
+                if row.get('status', 'Approved') not in ('Approved', ''):
+                    continue
+                symbol = (row.get('symbol') or '').strip()
+                if not symbol:
+                    continue
+                approved.append(symbol)
+                for column in ('alias_symbol', 'prev_symbol'):
+                    for alias in (row.get(column) or '').strip('"').split('|'):
+                        alias = alias.strip()
+                        if alias:
+                            candidates.setdefault(alias.upper(), set()).add(symbol)
+
+        approved_keys = {symbol.upper() for symbol in approved}
+        aliases = {
+            alias: next(iter(symbols))
+            for alias, symbols in candidates.items()
+            # An approved symbol always wins over another gene's alias
+            if len(symbols) == 1 and alias not in approved_keys
+        }
+        return cls(approved, aliases, version)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {'version': self.version, 'approved': list(self.approved.values()), 'aliases': self.aliases}
+
+    def __len__(self) -> int:
+        return len(self.approved)
+
+    def is_approved(self, symbol: str) -> bool:
+        return str(symbol).upper() in self.approved
+
+    def resolve(self, symbol: str) -> Optional[str]:
+        """Approved symbol for a symbol, alias or previous symbol, or None"""
+        key = str(symbol).strip().upper()
+        return self.approved.get(key) or self.aliases.get(key)
+
+    def validate(self, genes: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Split genes into approved symbols and everything else"""
+        valid: List[str] = []
+        invalid: List[str] = []
+        for gene in genes:
+            (valid if self.is_approved(gene) else invalid).append(gene)
+        return valid, invalid
+
+    def normalise(self, genes: Iterable[str]) -> List[str]:
+        """Map each gene to its approved symbol, keeping unknown names as they are"""
+        return [self.resolve(gene) or gene for gene in genes]
+
+
+_index: Optional[SymbolIndex] = None
+_index_lock = threading.Lock()
+
+
+def _dump_version(path: Path) -> List[int]:
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_index(dump_path: Path = HGNC_DUMP_PATH, index_path: Path = HGNC_INDEX_PATH) -> Optional[SymbolIndex]:
+    """The shared symbol index, or None when no HGNC dump is installed.
+
+    The parsed index is cached next to the dump as JSON and rebuilt only when
+    the dump file changes.
+    """
+    global _index
+    dump_path, index_path = Path(dump_path), Path(index_path)
+    if not dump_path.exists():
+        return None
+    version = _dump_version(dump_path)
+    with _index_lock:
+        if _index is not None and _index.version == version:
+            return _index
+
+        if index_path.exists():
+            try:
+                with open(index_path, 'r') as f:
+                    stored = json.load(f)
+                if stored.get('version') == version:
+                    _index = SymbolIndex(stored['approved'], stored['aliases'], version)
+                    return _index
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Rebuilding unreadable symbol index {index_path}: {str(e)}")
+
+        _index = SymbolIndex.from_hgnc(dump_path, version)
+        tmp_path = index_path.with_name(index_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(_index.to_dict(), f)
+        os.replace(tmp_path, index_path)
+        logger.info(f"Built HGNC symbol index: {len(_index)} symbols, {len(_index.aliases)} aliases")
+        return _index
+
+
+def normalise_unique(
+    genes: Iterable[str],
+    index: SymbolIndex,
+    seen: Set[str],
+    reserved: Set[str] = frozenset()
+) -> List[str]:
+    """Normalise gene names, keeping a name as-is when its approved symbol is taken.
+
+    seen holds the names already used (for example by earlier upload blocks)
+    and reserved the original names of the whole file, so an alias never
+    takes the name of a gene that is listed under its approved symbol. Neither
+    set is modified.
+    """
+    names: List[str] = []
+    taken = set()
+    for gene in genes:
+        symbol = index.resolve(gene)
+        if symbol is None or symbol == gene or symbol in seen or symbol in reserved or symbol in taken:
+            names.append(gene)
+        else:
+            names.append(symbol)
+        taken.add(names[-1])
+    return names
@@ -0,0 +1,150 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from config import HEATMAP_PYRAMID_CACHE_ENTRIES, HEATMAP_TILE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_pairs(sums: np.ndarray, counts: np.ndarray, axis: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge neighbouring pairs along an axis; an odd last row or column stays alone"""
+    if sums.shape[axis] % 2:
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (0, 1)
+        sums = np.pad(sums, pad)
+        counts = np.pad(counts, pad)
+    if axis == 0:
+        return sums[0::2] + sums[1::2], counts[0::2] + counts[1::2]
+    return sums[:, 0::2] + sums[:, 1::2], counts[:, 0::2] + counts[:, 1::2]
+
+
+def bin_labels(names: np.ndarray, start: int, stop: int, width: int) -> List[str]:
+    """Labels for pooled rows or columns: the name itself, or 'first..last' of each bin"""
+    names = np.asarray(names, dtype=str)[start:stop]
+    if width == 1:
+        return names.tolist()
+    labels = []
+    for first in range(0, len(names), width):
+        last = min(first + width, len(names)) - 1
+        labels.append(str(names[first]) if last == first else f"{names[first]}..{names[last]}")
+    return labels
+
+
+@dataclass(frozen=True)
+class TilePyramid:
+    """Mean-pooled levels of a clustered z-score matrix, cut into fixed-size tiles.
+
+    Level 0 is the coarsest overview and the last level is the full-resolution
+    matrix in leaf order. Each level halves every axis that is still larger
+    than one tile, so genes keep being pooled after the few samples already
+    fit. Means skip NaN cells (genes with zero variance).
+    """
+    levels: List[np.ndarray]
+    gene_bins: List[int]  # leaf-ordered genes per row at each level
+    sample_bins: List[int]
+    tile_size: int
+
+    @classmethod
+    def build(cls, zscores: np.ndarray, tile_size: int = HEATMAP_TILE_SIZE) -> 'TilePyramid':
+        values = np.asarray(zscores)
+        valid = ~np.isnan(values)
+        sums = np.where(valid, values, 0.0)
+        counts = valid.astype(np.int32)
+
+        levels = [values]
+        gene_bins, sample_bins = [1], [1]
+        while sums.shape[0] > tile_size or sums.shape[1] > tile_size:
+            genes_pooled = sums.shape[0] > tile_size
+            samples_pooled = sums.shape[1] > tile_size
+            if genes_pooled:
+                sums, counts = _pool_pairs(sums, counts, 0)
+            if samples_pooled:
+                sums, counts = _pool_pairs(sums, counts, 1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                levels.append((sums / counts).astype(np.float32))
+            gene_bins.append(gene_bins[-1] * (2 if genes_pooled else 1))
+            sample_bins.append(sample_bins[-1] * (2 if samples_pooled else 1))
+
+        return cls(levels[::-1], gene_bins[::-1], sample_bins[::-1], tile_size)
+
+    @property
+    def max_level(self) -> int:
+        return len(self.levels) - 1
+
+    def grid(self, level: int) -> Tuple[int, int]:
+        """Number of tile rows and columns at a level"""
+        rows, cols = self.levels[level].shape
+        return -(-rows // self.tile_size), -(-cols // self.tile_size)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                'level': level,
+                'shape': list(values.shape),
+                'tiles': list(self.grid(level)),
+                'genes_per_row': self.gene_bins[level],
+                'samples_per_column': self.sample_bins[level]
+            }
+            for level, values in enumerate(self.levels)
+        ]
+
+    def tile(self, level: int, row: int, col: int) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Values of one tile (smaller at the matrix edges) and the leaf ranges it covers"""
+        if not 0 <= level <= self.max_level:
+            raise IndexError(f"level must be between 0 and {self.max_level}")
+        rows, cols = self.grid(level)
+        if not (0 <= row < rows and 0 <= col < cols):
+            raise IndexError(f"tile ({row}, {col}) is outside the {rows}x{cols} grid of level {level}")
+
+        size = self.tile_size
+        values = self.levels[level][row * size:(row + 1) * size, col * size:(col + 1) * size]
+        n_genes, n_samples = self.levels[-1].shape
+        gene_start = row * size * self.gene_bins[level]
+        sample_start = col * size * self.sample_bins[level]
+        extent = {
+            'gene_start': gene_start,
+            'gene_stop': min(gene_start + values.shape[0] * self.gene_bins[level], n_genes),
+            'sample_start': sample_start,
+            'sample_stop': min(sample_start + values.shape[1] * self.sample_bins[level], n_samples)
+        }
+        return values, extent
+
+
+class PyramidCache:
+    """LRU of tile pyramids keyed like the clustering results they come from"""
+
+    def __init__(self, max_entries: int = HEATMAP_PYRAMID_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, TilePyramid]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def get_or_build(self, key: str, build: Callable[[], TilePyramid]) -> TilePyramid:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent tile requests for a new result build its pyramid once
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+            pyramid = build()
+            with self._lock:
+                self._entries[key] = pyramid
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._key_locks.pop(key, None)
+        logger.info(f"Built heatmap tile pyramid with {len(pyramid.levels)} levels")
+        return pyramid
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
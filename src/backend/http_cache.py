@@ -0,0 +1,195 @@
+import email.utils
+import functools
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from flask import Response, request
+
+from config import (
+    HTTP_BODY_CACHE_BYTES,
+    HTTP_COMPRESS_LEVEL,
+    HTTP_COMPRESS_MIN_BYTES,
+    HTTP_COMPRESS_MIMETYPES,
+    RESPONSE_CACHE_BACKEND
+)
+from shared_cache import SQLiteCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+VARY = 'Accept, Accept-Encoding'
+
+
+def _encodings() -> list:
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def negotiate_encoding() -> Optional[str]:
+    """Best content coding the client accepts, or None for identity"""
+    best = request.accept_encodings.best_match(_encodings())
+    return best if best in _encodings() else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(HTTP_COMPRESS_LEVEL, 11))
+    return gzip.compress(body, compresslevel=HTTP_COMPRESS_LEVEL, mtime=0)
+
+
+def compress_response(response: Response, encoding: Optional[str] = None) -> Response:
+    """Compress a buffered response body in place when it is worth it"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in HTTP_COMPRESS_MIMETYPES
+    ):
+        return response
+    encoding = encoding or negotiate_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < HTTP_COMPRESS_MIN_BYTES:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def file_version(paths: Iterable[Path]) -> Tuple[str, Optional[float]]:
+    """Version token and newest mtime of the files a view reads; missing files count too"""
+    parts = []
+    newest = None
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            parts.append(f"{path}:missing")
+            continue
+        parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        newest = st.st_mtime if newest is None else max(newest, st.st_mtime)
+    return '|'.join(parts), newest
+
+
+class BodyCache:
+    """Byte-bounded LRU of finished (possibly compressed) response bodies by ETag.
+
+    Per process; SQLiteCache offers the same interface shared between workers.
+    """
+
+    def __init__(self, max_bytes: int = HTTP_BODY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, dict]]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, dict]]:
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(etag)
+            self._counters['hits'] += 1
+            return entry
+
+    def put(self, etag: str, body: bytes, headers: dict) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[etag] = (body, headers)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (old_body, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old_body)
+                self._counters['evictions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, bytes=self._bytes, entries=len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def make_body_cache(backend: str = RESPONSE_CACHE_BACKEND):
+    """Finished-response cache for the configured backend ('sqlite' or 'memory')"""
+    if backend == 'sqlite':
+        return SQLiteCache()
+    if backend == 'memory':
+        return BodyCache()
+    raise ValueError(f"Unsupported response cache backend '{backend}'")
+
+
+body_cache = make_body_cache()
+
+
+def _request_etag(version: str, encoding: Optional[str]) -> str:
+    """Strong ETag for this route, query, negotiated format, coding and data version"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.path, sorted(request.args.items(multi=True)), request.headers.get('Accept', ''), version):
+        digest.update(repr(part).encode())
+        digest.update(b'\0')
+    # A strong validator must differ between content codings
+    return f"{digest.hexdigest()}-{encoding}" if encoding else digest.hexdigest()
+
+
+def conditional(files: Callable[[], Iterable[Path]]) -> Callable:
+    """Serve a GET view with ETag/Last-Modified validators and cached bodies.
+
+    files returns the paths the view's output is derived from (or raises
+    ValueError for bad parameters, leaving the view to report them). Their
+    mtimes and sizes plus the request make up a strong ETag. If-None-Match
+    hits are answered with 304 and repeated requests from the cached body,
+    both without calling the view. Only 200 responses are cached.
+    """
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version, modified = file_version(files())
+            except ValueError:
+                return view(*args, **kwargs)
+
+            encoding = negotiate_encoding()
+            etag = _request_etag(version, encoding)
+            cached = None
+            if etag in request.if_none_match.as_set():
+                response = Response(status=304)
+            elif (cached := body_cache.get(etag)) is not None:
+                body, headers = cached
+                response = Response(body, headers=headers)
+            else:
+                response = view(*args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+                compress_response(response, encoding)
+
+            response.set_etag(etag)
+            if modified is not None:
+                response.headers['Last-Modified'] = email.utils.formatdate(modified, usegmt=True)
+            response.cache_control.no_cache = True
+            response.headers['Vary'] = VARY
+            buffered = not (response.direct_passthrough or response.is_streamed)
+            if response.status_code == 200 and cached is None and buffered:
+                body_cache.put(etag, response.get_data(), dict(response.headers))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import JOB_HISTORY_SIZE, JOB_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when the job was cancelled"""
+
+
+@dataclass
+class Job:
+    """A unit of background work and its observable state"""
+    kind: str
+    key: str
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    progress: int = 0
+    stage: str = 'Queued'
+    error: Optional[str] = None
+    result: Any = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def report(self, stage: str, progress: Optional[int] = None) -> None:
+        """Record progress from inside the job function"""
+        self.stage = stage
+        if progress is not None:
+            self.progress = max(self.progress, min(100, int(progress)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'progress': self.progress,
+            'stage': self.stage,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """Bounded worker pool for long-running jobs such as DESeq2 runs.
+
+    Jobs with the same key are deduplicated while one is queued or running,
+    so concurrent requests share a single run instead of starting duplicates.
+    """
+
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS, history_size: int = JOB_HISTORY_SIZE):
+        self.logger = logging.getLogger(__name__)
+        self.history_size = history_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, str] = {}  # job key -> id of the queued/running job
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        key: str,
+        fn: Callable[[Job], Any],
+        params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Job, bool]:
+        """Queue fn(job) unless an identical job is in flight.
+
+        Returns the job and whether an existing job was reused.
+        """
+        with self._lock:
+            active_id = self._active.get(key)
+            if active_id is not None:
+                return self._jobs[active_id], True
+
+            job = Job(kind=kind, key=key, params=params or {})
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            self._trim_history()
+
+        self._executor.submit(self._run, job, fn)
+        self.logger.info(f"Queued {kind} job {job.id}")
+        return job, False
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED, stage='Cancelled before start')
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.report('Started')
+        try:
+            job.result = fn(job)
+            self._finish(job, SUCCEEDED, stage='Completed')
+        except JobCancelled:
+            self._finish(job, CANCELLED, stage='Cancelled')
+        except Exception as e:
+            self.logger.error(f"{job.kind} job {job.id} failed: {str(e)}")
+            self._finish(job, FAILED, stage='Failed', error=str(e))
+
+    def _finish(self, job: Job, status: str, stage: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            job.status = status
+            job.stage = stage
+            job.error = error
+            job.finished_at = time.time()
+            if status == SUCCEEDED:
+                job.progress = 100
+            if self._active.get(job.key) == job.id:
+                del self._active[job.key]
+        self.logger.info(f"{job.kind} job {job.id} {status}")
+
+    def _trim_history(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(0, len(self._jobs) - self.history_size)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def active(self, key: str) -> Optional[Job]:
+        """Return the queued or running job for a key, if any"""
+        with self._lock:
+            job_id = self._active.get(key)
+            return self._jobs.get(job_id) if job_id else None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Request cancellation; running jobs stop at their next check"""
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel_event.set()
+            job.report('Cancelling')
+        return job
@@ -0,0 +1,242 @@
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import GENE_SET_DIR
+from differential_expression import bh_adjust
+
+logger = logging.getLogger(__name__)
+
+GMT_SUFFIX = '.gmt'
+
+
+def _log_choose(n: np.ndarray, k: np.ndarray) -> np.ndarray:
+    from scipy.special import gammaln
+
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+
+def _tail_sum(x: np.ndarray, pmf: np.ndarray, sizes: np.ndarray, universe: int, n: int, bound: np.ndarray, step: int) -> np.ndarray:
+    """Sum the pmf from x towards bound (step +1 or -1) with the ratio recurrence.
+
+    Each tail starts at its largest pmf, so a term drops out once the next
+    terms no longer change its sum.
+    """
+    total = pmf.copy()
+    active = np.flatnonzero((x != bound) & (pmf > 0))
+    x, term = x[active], pmf[active]
+    while len(active):
+        K = sizes[active]
+        if step > 0:
+            term = term * (K - x) * (n - x) / ((x + 1) * (universe - K - n + x + 1))
+        else:
+            term = term * x * (universe - K - n + x) / ((K - x + 1) * (n - x + 1))
+        x = x + step
+        total[active] += term
+        keep = (x != bound[active]) & (term > total[active] * 1e-17)
+        active, x, term = active[keep], x[keep], term[keep]
+    return total
+
+
+def hypergeom_sf(k: np.ndarray, universe: int, sizes: np.ndarray, n: int) -> np.ndarray:
+    """P(X >= k) for X ~ Hypergeometric(universe, sizes, n), for many terms at once.
+
+    Walks whichever tail lies away from the mode with the pmf ratio
+    recurrence, vectorised across terms: the upper tail from k, or one minus
+    the lower tail from k - 1. Matches scipy's hypergeom.sf(k - 1, ...)
+    without its per-element summation.
+    """
+    k = np.asarray(k, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64)
+    log_total = _log_choose(np.float64(universe), np.float64(n))
+
+    def pmf(x: np.ndarray, K: np.ndarray) -> np.ndarray:
+        return np.exp(_log_choose(K, x) + _log_choose(universe - K, n - x) - log_total)
+
+    p_values = np.ones(len(k))
+    mode = np.floor((n + 1) * (sizes + 1) / (universe + 2))
+    lower = np.maximum(0, n - (universe - sizes))
+    upper_side = k > mode
+    if upper_side.any():
+        x, K = k[upper_side], sizes[upper_side]
+        p_values[upper_side] = _tail_sum(x, pmf(x, K), K, universe, n, np.minimum(K, n), 1)
+    lower_side = ~upper_side & (k > lower)
+    if lower_side.any():
+        x, K = k[lower_side] - 1, sizes[lower_side]
+        p_values[lower_side] = 1 - _tail_sum(x, pmf(x, K), K, universe, n, lower[lower_side], -1)
+    return np.clip(p_values, 0.0, 1.0)
+
+
+@dataclass(frozen=True)
+class GeneSetLibrary:
+    """A GMT library as integer-indexed sparse sets (CSR rows per term).
+
+    Gene symbols are stored once in a sorted vocabulary; each term holds the
+    vocabulary positions of its genes in indices[indptr[t]:indptr[t + 1]].
+    """
+    name: str
+    terms: np.ndarray
+    genes: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    term_of: np.ndarray  # term of each entry in indices
+    version: Tuple[int, int]
+
+    @classmethod
+    def from_gmt(cls, path: Path, version: Tuple[int, int]) -> 'GeneSetLibrary':
+        terms: List[str] = []
+        members: List[List[str]] = []
+        with open(path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 3 or not fields[0]:
+                    continue
+                # Enrichr GMTs pad with empty fields and may append ",1.0" weights
+                genes = {gene.split(',')[0].strip().upper() for gene in fields[2:]}
+                genes.discard('')
+                if genes:
+                    terms.append(fields[0])
+                    members.append(sorted(genes))
+
+        vocabulary = np.array(sorted({gene for genes in members for gene in genes}), dtype=object)
+        position = {gene: i for i, gene in enumerate(vocabulary)}
+        sizes = np.fromiter((len(genes) for genes in members), dtype=np.int64, count=len(members))
+        indptr = np.zeros(len(members) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+        indices = np.fromiter(
+            (position[gene] for genes in members for gene in genes),
+            dtype=np.int32,
+            count=int(indptr[-1])
+        )
+        return cls(
+            name=path.name[:-len(GMT_SUFFIX)],
+            terms=np.array(terms, dtype=object),
+            genes=vocabulary,
+            indptr=indptr,
+            indices=indices,
+            term_of=np.repeat(np.arange(len(members), dtype=np.int32), sizes),
+            version=version
+        )
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def enrich(self, genes: List[str], background_size: Optional[int] = None) -> List[List[Any]]:
+        """Over-representation of the gene list in every term.
+
+        Hypergeometric p-values (one-sided Fisher exact test) are computed for
+        all terms at once over the library's gene universe, or over
+        background_size genes when given. Terms without overlap are dropped,
+        the rest are BH-adjusted and returned as Enrichr rows:
+        [rank, term, p-value, odds ratio, combined score, overlapping genes,
+        adjusted p-value, old p-value, old adjusted p-value].
+        """
+        wanted = np.array(sorted({str(gene).upper() for gene in genes}), dtype=object)
+        if len(wanted) == 0 or len(self.genes) == 0:
+            return []
+        positions = np.minimum(np.searchsorted(self.genes, wanted), len(self.genes) - 1)
+        query = np.zeros(len(self.genes), dtype=bool)
+        query[positions[self.genes[positions] == wanted]] = True
+
+        n = int(query.sum())
+        universe = background_size or len(self.genes)
+        if n == 0:
+            return []
+
+        # Entries of the CSR arrays that are query genes, grouped by term
+        hits = np.flatnonzero(query[self.indices])
+        hit_terms = self.term_of[hits]
+        overlap = np.bincount(hit_terms, minlength=len(self.terms))
+        reported = np.flatnonzero(overlap)
+
+        k = overlap[reported].astype(np.float64)
+        size = self.sizes[reported].astype(np.float64)
+        p_values = hypergeom_sf(k, universe, size, n)
+        adjusted = bh_adjust(p_values)
+
+        # Sample odds ratio with a Haldane correction where a cell is empty
+        a, b, c = k, size - k, n - k
+        d = universe - size - n + k
+        correction = np.where((a == 0) | (b == 0) | (c == 0) | (d <= 0), 0.5, 0.0)
+        odds_ratio = ((a + correction) * (np.maximum(d, 0) + correction)) / ((b + correction) * (c + correction))
+        combined = odds_ratio * -np.log(np.maximum(p_values, np.finfo(float).tiny))
+
+        hit_genes = self.genes[self.indices[hits]].tolist()
+        starts = np.searchsorted(hit_terms, reported).tolist()
+        counts = overlap[reported].tolist()
+        names = self.terms[reported].tolist()
+        p_list, odds_list, combined_list, adjusted_list = (
+            p_values.tolist(), odds_ratio.tolist(), combined.tolist(), adjusted.tolist()
+        )
+
+        rows = []
+        for rank, i in enumerate(np.lexsort((-combined, p_values)).tolist(), start=1):
+            rows.append([
+                rank,
+                names[i],
+                p_list[i],
+                odds_list[i],
+                combined_list[i],
+                hit_genes[starts[i]:starts[i] + counts[i]],
+                adjusted_list[i],
+                0,
+                0
+            ])
+        return rows
+
+
+class LocalEnrichment:
+    """Gene-set libraries on disk, parsed once per file version.
+
+    Libraries are the <name>.gmt files in GENE_SET_DIR (for example the
+    Enrichr library downloads) and are addressed by file name.
+    """
+
+    def __init__(self, library_dir: Path = GENE_SET_DIR):
+        self.logger = logging.getLogger(__name__)
+        self.library_dir = Path(library_dir)
+        self._libraries: Dict[str, GeneSetLibrary] = {}
+        self._lock = threading.Lock()
+
+    def available(self) -> List[str]:
+        if not self.library_dir.exists():
+            return []
+        return sorted(path.name[:-len(GMT_SUFFIX)] for path in self.library_dir.glob(f'*{GMT_SUFFIX}'))
+
+    def load(self, name: str) -> GeneSetLibrary:
+        if name not in self.available():
+            raise FileNotFoundError(f"Gene set library '{name}' not found in {self.library_dir}")
+        path = self.library_dir / f"{name}{GMT_SUFFIX}"
+        st = path.stat()
+        version = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            library = self._libraries.get(name)
+            if library is None or library.version != version:
+                library = GeneSetLibrary.from_gmt(path, version)
+                self._libraries[name] = library
+                self.logger.info(
+                    f"Loaded gene set library {name}: {len(library.terms)} terms, {len(library.genes)} genes"
+                )
+            return library
+
+    def enrich_libraries(
+        self,
+        genes: List[str],
+        libraries: List[str]
+    ) -> Tuple[Dict[str, List[Any]], Dict[str, Exception]]:
+        """Results and per-library errors, like EnrichrClient.enrich_libraries"""
+        results: Dict[str, List[Any]] = {}
+        errors: Dict[str, Exception] = {}
+        for name in libraries:
+            try:
+                results[name] = self.load(name).enrich(genes)
+            except FileNotFoundError as e:
+                errors[name] = e
+        if errors and len(libraries) == 1:
+            raise errors[libraries[0]]
+        return results, errors
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import EXPRESSION_BLOCK_BYTES
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.index.json'
+
+
+def binary_paths(csv_path: Path) -> Tuple[Path, Path]:
+    """Return the .npy block and index sidecar paths stored next to a CSV"""
+    csv_path = Path(csv_path)
+    stem = csv_path.with_suffix('')
+    return stem.with_suffix('.npy'), stem.with_name(stem.name + INDEX_SUFFIX)
+
+
+def matrix_hash(values: np.ndarray, genes, samples) -> str:
+    """Hash the matrix contents and labels"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(values.dtype).encode())
+    digest.update(np.asarray(values.shape, dtype=np.int64).tobytes())
+    digest.update(json.dumps([list(map(str, genes)), list(map(str, samples))]).encode())
+    for start, stop in row_blocks(values):
+        digest.update(np.ascontiguousarray(values[start:stop]).data)
+    return digest.hexdigest()
+
+
+def has_binary(csv_path: Path) -> bool:
+    """Check whether an up-to-date binary copy exists for the CSV"""
+    npy_path, index_path = binary_paths(csv_path)
+    if not (npy_path.exists() and index_path.exists()):
+        return False
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        return True
+    # The binary copy is written after the CSV; an older one is stale
+    return index_path.stat().st_mtime_ns >= csv_path.stat().st_mtime_ns
+
+
+def source_path(csv_path: Path) -> Path:
+    """Return the file a reader should load for this matrix"""
+    if has_binary(csv_path):
+        return binary_paths(csv_path)[1]
+    return Path(csv_path)
+
+
+def read_index(csv_path: Path) -> Dict[str, Any]:
+    """Load the index sidecar of a binary matrix"""
+    _, index_path = binary_paths(csv_path)
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def npy_layout(csv_path: Path) -> Dict[str, Any]:
+    """Describe where the raw values of the binary copy start in the .npy file.
+
+    Lets non-Python readers (the R worker) read the block with a plain seek
+    and readBin instead of parsing the CSV.
+    """
+    npy_path, index_path = binary_paths(csv_path)
+    with open(npy_path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return {
+        'path': str(npy_path),
+        'index_path': str(index_path),
+        'offset': offset,
+        'dtype': dtype.str,
+        'shape': list(shape),
+        'fortran_order': fortran_order
+    }
+
+
+def row_blocks(values: np.ndarray, block_bytes: int = EXPRESSION_BLOCK_BYTES) -> Iterator[Tuple[int, int]]:
+    """Yield (start, stop) row ranges that keep each block under block_bytes"""
+    n_rows = values.shape[0]
+    row_bytes = max(1, int(np.prod(values.shape[1:])) * values.dtype.itemsize)
+    step = max(1, block_bytes // row_bytes)
+    for start in range(0, n_rows, step):
+        yield start, min(start + step, n_rows)
+
+
+def create_binary(csv_path: Path, shape: Tuple[int, ...], dtype) -> np.memmap:
+    """Open a writable .npy memmap for a matrix that is filled block by block"""
+    npy_path, _ = binary_paths(csv_path)
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_npy = npy_path.with_name(npy_path.name + '.tmp')
+    return np.lib.format.open_memmap(tmp_npy, mode='w+', dtype=dtype, shape=shape)
+
+
+def commit_binary(values: np.memmap, genes, samples, csv_path: Path) -> str:
+    """Publish a memmap from create_binary and write its index sidecar"""
+    npy_path, index_path = binary_paths(csv_path)
+    values.flush()
+    content_hash = matrix_hash(values, genes, samples)
+
+    index = {
+        'genes': [str(g) for g in genes],
+        'samples': [str(s) for s in samples],
+        'dtype': str(values.dtype),
+        'shape': list(values.shape),
+        'content_hash': content_hash
+    }
+    tmp_index = index_path.with_name(index_path.name + '.tmp')
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f)
+
+    # Sidecar goes last so readers never pair it with a half-written block
+    os.replace(values.filename, npy_path)
+    os.replace(tmp_index, index_path)
+    return content_hash
+
+
+def write_binary(values: np.ndarray, genes, samples, csv_path: Path) -> str:
+    """Write the .npy block and its index sidecar, returning the content hash"""
+    out = create_binary(csv_path, values.shape, values.dtype)
+    for start, stop in row_blocks(values):
+        out[start:stop] = values[start:stop]
+    content_hash = commit_binary(out, genes, samples, csv_path)
+    del out
+    return content_hash
+
+
+class MatrixWriter:
+    """Append-only writer for a matrix whose row count is not known up front.
+
+    Rows are appended to a temporary .npy file behind a placeholder header
+    (and to a temporary CSV copy) as they arrive, so only the current block
+    is held in memory. commit() patches the header with the final shape and
+    publishes both copies, CSV first and the index sidecar last, so readers
+    never see a binary copy older than the CSV.
+    """
+
+    def __init__(self, csv_path: Path, samples, dtype, write_csv: bool = True, index_label: Optional[str] = None):
+        self.csv_path = Path(csv_path)
+        self.csv_path.parent.mkdir(parents=True, exist_ok=True)
+        self.npy_path, self.index_path = binary_paths(self.csv_path)
+        self.samples = pd.Index(samples)
+        self.dtype = np.dtype(dtype)
+        self.index_label = index_label
+        self.genes: list = []
+
+        self._tmp_npy = self.npy_path.with_name(self.npy_path.name + '.tmp')
+        self._npy = open(self._tmp_npy, 'wb')
+        # numpy pads the header so the row count can grow in place
+        np.lib.format.write_array_header_1_0(self._npy, self._header(0))
+        self._data_offset = self._npy.tell()
+
+        self._tmp_csv = self.csv_path.with_name(self.csv_path.name + '.tmp') if write_csv else None
+        self._csv = open(self._tmp_csv, 'w', newline='') if write_csv else None
+        self._csv_header = True
+
+    def _header(self, n_rows: int) -> Dict[str, Any]:
+        return {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (n_rows, len(self.samples))
+        }
+
+    def append(self, values: np.ndarray, genes) -> None:
+        """Append a block of rows"""
+        if values.shape[1:] != (len(self.samples),):
+            raise ValueError(f"Block shape {values.shape} does not match {len(self.samples)} samples")
+        if len(values) == 0:
+            return
+        block = np.ascontiguousarray(values, dtype=self.dtype)
+        self._npy.write(block.data)
+        self.genes.extend(genes)
+        if self._csv is not None:
+            pd.DataFrame(values, index=genes, columns=self.samples, copy=False).to_csv(
+                self._csv,
+                header=self._csv_header,
+                index_label=self.index_label
+            )
+            self._csv_header = False
+
+    def upcast(self, dtype) -> None:
+        """Switch the binary copy to a wider dtype, converting the rows written so far.
+
+        The converted rows are copied block by block into a fresh temporary
+        file, so memory stays bounded. The CSV copy needs no change.
+        """
+        dtype = np.dtype(dtype)
+        if dtype == self.dtype:
+            return
+        self._npy.close()
+        old_path = self._tmp_npy.with_name(self._tmp_npy.name + '.old')
+        os.replace(self._tmp_npy, old_path)
+        old_dtype, old_offset = self.dtype, self._data_offset
+        try:
+            self.dtype = dtype
+            self._npy = open(self._tmp_npy, 'wb')
+            np.lib.format.write_array_header_1_0(self._npy, self._header(0))
+            self._data_offset = self._npy.tell()
+            if self.genes:
+                rows = np.memmap(
+                    old_path, dtype=old_dtype, mode='r', offset=old_offset,
+                    shape=(len(self.genes), len(self.samples))
+                )
+                for start, stop in row_blocks(rows):
+                    self._npy.write(np.ascontiguousarray(rows[start:stop], dtype=dtype).data)
+                del rows
+        finally:
+            old_path.unlink()
+
+    def commit(self) -> str:
+        """Finalise the header, publish the copies and return the content hash"""
+        self._npy.seek(0)
+        np.lib.format.write_array_header_1_0(self._npy, self._header(len(self.genes)))
+        if self._npy.tell() != self._data_offset:
+            raise ValueError("Array header changed size while growing the matrix")
+        self._npy.close()
+        if self._csv is not None:
+            self._csv.close()
+
+        values = np.load(self._tmp_npy, mmap_mode='r', allow_pickle=False)
+        content_hash = matrix_hash(values, self.genes, self.samples)
+        del values
+
+        index = {
+            'genes': [str(g) for g in self.genes],
+            'samples': [str(s) for s in self.samples],
+            'dtype': str(self.dtype),
+            'shape': [len(self.genes), len(self.samples)],
+            'content_hash': content_hash
+        }
+        tmp_index = self.index_path.with_name(self.index_path.name + '.tmp')
+        with open(tmp_index, 'w') as f:
+            json.dump(index, f)
+
+        # CSV first, sidecar last, so the binary copy is never older than the CSV
+        if self._tmp_csv is not None:
+            os.replace(self._tmp_csv, self.csv_path)
+        os.replace(self._tmp_npy, self.npy_path)
+        os.replace(tmp_index, self.index_path)
+        return content_hash
+
+    def abort(self) -> None:
+        """Close and remove the temporary files"""
+        for handle in (self._npy, self._csv):
+            if handle is not None and not handle.closed:
+                handle.close()
+        for path in (self._tmp_npy, self._tmp_csv):
+            if path is not None and path.exists():
+                path.unlink()
+
+
+def load_arrays(
+    csv_path: Path,
+    dtype: Optional[np.dtype] = None,
+    mmap: bool = False
+) -> Tuple[np.ndarray, pd.Index, pd.Index, Optional[str]]:
+    """Load values and labels, preferring the binary copy over the CSV.
+
+    With mmap=True the binary copy is memory-mapped read-only instead of read
+    into memory, and keeps its stored dtype even when dtype differs: converting
+    would copy the whole matrix into RAM, so callers convert the blocks they
+    read. Returns the stored content hash as the last element when the binary
+    copy was used, otherwise None.
+    """
+    csv_path = Path(csv_path)
+    if has_binary(csv_path):
+        npy_path, _ = binary_paths(csv_path)
+        try:
+            index = read_index(csv_path)
+            values = np.load(npy_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+            if list(values.shape) != index['shape']:
+                raise ValueError(f"Shape {values.shape} does not match index {index['shape']}")
+            if dtype is not None and values.dtype != dtype:
+                if mmap:
+                    logger.warning(
+                        f"{npy_path} is stored as {values.dtype}, not {np.dtype(dtype)}; "
+                        "mapping it as stored (upload the data again to convert it)"
+                    )
+                else:
+                    values = values.astype(dtype)
+            return values, pd.Index(index['genes']), pd.Index(index['samples']), index['content_hash']
+        except Exception as e:
+            logger.warning(f"Falling back to CSV for {csv_path}: {str(e)}")
+
+    df = pd.read_csv(csv_path, index_col=0)
+    values = df.to_numpy(dtype=dtype) if dtype is not None else df.to_numpy()
+    return values, pd.Index(df.index), pd.Index(df.columns), None
+
+
+def read_matrix(csv_path: Path, dtype: Optional[np.dtype] = None, mmap: bool = False) -> pd.DataFrame:
+    """Read a matrix as a DataFrame, preferring the binary copy over the CSV"""
+    values, genes, samples, _ = load_arrays(csv_path, dtype=dtype, mmap=mmap)
+    return pd.DataFrame(values, index=genes, columns=samples, copy=False)
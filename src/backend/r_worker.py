@@ -0,0 +1,325 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import (
+    R_PROBE_CACHE_PATH,
+    R_PROBE_TIMEOUT,
+    R_PROBE_TTL,
+    R_REQUIRED_PACKAGES,
+    R_WORKER_MAX_JOBS,
+    R_WORKER_POOL_SIZE,
+    R_WORKER_STARTUP_TIMEOUT
+)
+from jobs import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+READY_LINE = '@@READY'
+DONE_PREFIX = '@@DONE '
+
+
+class RWorkerError(RuntimeError):
+    """The worker process died or broke the protocol and must be replaced"""
+
+
+class RAnalysisError(RuntimeError):
+    """The job failed inside R; the worker itself is still usable"""
+
+
+class RWorker:
+    """One warm Rscript process running deseq2_worker.R.
+
+    A reader thread moves stdout lines onto a queue so waits can honour
+    timeouts and cancellation without blocking on the pipe.
+    """
+
+    def __init__(self, script_path: Path, startup_timeout: float = R_WORKER_STARTUP_TIMEOUT):
+        self.process = subprocess.Popen(
+            ["Rscript", "--vanilla", str(script_path)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1
+        )
+        self.jobs_run = 0
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._pump, daemon=True).start()
+
+        startup: List[str] = []
+        deadline = time.monotonic() + startup_timeout
+        try:
+            while True:
+                line = self._next_line(deadline)
+                if line.strip() == READY_LINE:
+                    break
+                startup.append(line)
+        except Exception as e:
+            self.kill()
+            raise RWorkerError(f"R worker failed to start: {str(e)}\n{''.join(startup)}")
+        logger.info(f"Started R worker (pid {self.process.pid})")
+
+    def _pump(self) -> None:
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def _next_line(self, deadline: float, cancel_event: Optional[threading.Event] = None) -> str:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled("DESeq2 analysis cancelled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("R worker did not respond in time")
+            try:
+                line = self._lines.get(timeout=min(0.5, remaining))
+            except queue.Empty:
+                continue
+            if line is None:
+                self.process.wait()
+                raise RWorkerError(f"R worker exited with code {self.process.returncode}")
+            return line
+
+    def run(
+        self,
+        request: Dict[str, Any],
+        timeout: float,
+        on_line: Optional[Callable[[str], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[str]:
+        """Send one job and collect its output lines until the worker replies"""
+        job_id = uuid.uuid4().hex
+        try:
+            self.process.stdin.write(json.dumps(dict(request, id=job_id)) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise RWorkerError(f"Could not send job to R worker: {str(e)}")
+
+        output: List[str] = []
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._next_line(deadline, cancel_event)
+            if line.startswith(DONE_PREFIX):
+                reply_id, status, message = (line[len(DONE_PREFIX):].rstrip("\n").split(" ", 2) + [""])[:3]
+                if reply_id != job_id:
+                    raise RWorkerError(f"R worker replied to unexpected job {reply_id}")
+                self.jobs_run += 1
+                if status != "ok":
+                    raise RAnalysisError(message or "DESeq2 analysis failed")
+                return output
+            output.append(line)
+            if on_line is not None:
+                on_line(line)
+
+    def stop(self) -> None:
+        """Ask the worker to exit by closing its stdin, killing it if needed"""
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+    def kill(self) -> None:
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class RWorkerPool:
+    """Warm R workers shared by DESeq2 jobs.
+
+    Workers start on first use and stay alive between jobs, so R startup and
+    library(DESeq2) are paid once per worker. Workers that crash, hang past
+    the timeout or are cancelled mid-job are killed and replaced on the next
+    run; healthy workers are also recycled after max_jobs runs.
+    """
+
+    def __init__(
+        self,
+        script_path: Path,
+        size: int = R_WORKER_POOL_SIZE,
+        max_jobs: int = R_WORKER_MAX_JOBS,
+        startup_timeout: float = R_WORKER_STARTUP_TIMEOUT
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.script_path = Path(script_path)
+        self.size = size
+        self.max_jobs = max_jobs
+        self.startup_timeout = startup_timeout
+        self._slots = threading.BoundedSemaphore(max(size, 1))
+        self._idle: List[RWorker] = []
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _checkout(self) -> RWorker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+                self.logger.warning(f"Discarding dead R worker (pid {worker.process.pid})")
+        return RWorker(self.script_path, self.startup_timeout)
+
+    def _checkin(self, worker: RWorker) -> None:
+        if not worker.alive() or worker.jobs_run >= self.max_jobs:
+            worker.stop()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def run(
+        self,
+        request: Dict[str, Any],
+        timeout: float,
+        on_line: Optional[Callable[[str], None]] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[str]:
+        """Run a job on a warm worker, starting one if none is idle"""
+        with self._slots:
+            worker = self._checkout()
+            try:
+                output = worker.run(request, timeout, on_line=on_line, cancel_event=cancel_event)
+            except RAnalysisError:
+                self._checkin(worker)
+                raise
+            except BaseException:
+                # Hung, crashed or cancelled mid-job: the worker state is unknown
+                self.logger.warning(f"Recycling R worker (pid {worker.process.pid})")
+                worker.kill()
+                raise
+            self._checkin(worker)
+            return output
+
+    def shutdown(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+def probe_r_environment(
+    packages: Sequence[str] = R_REQUIRED_PACKAGES,
+    timeout: float = R_PROBE_TIMEOUT
+) -> Dict[str, Any]:
+    """Check for Rscript and the given packages with a single R process.
+
+    system.file() is used instead of installed.packages(), which scans every
+    library on the search path.
+    """
+    names = ', '.join(json.dumps(package) for package in packages)
+    expression = (
+        'cat(R.version.string, "\\n", sep = ""); '
+        f'pkgs <- c({names}); '
+        'cat(pkgs[!nzchar(vapply(pkgs, function(p) system.file(package = p), ""))], sep = "\\n")'
+    )
+    status = {
+        'available': False,
+        'version': None,
+        'packages': list(packages),
+        'missing': list(packages),
+        'packages_ok': False,
+        'error': None,
+        'checked_at': time.time()
+    }
+    try:
+        result = subprocess.run(["Rscript", "-e", expression], capture_output=True, text=True, timeout=timeout)
+    except FileNotFoundError:
+        status['error'] = "Rscript not found on PATH"
+        return status
+    except subprocess.TimeoutExpired:
+        status['error'] = f"Rscript did not answer within {timeout} seconds"
+        return status
+    if result.returncode != 0:
+        status['error'] = result.stderr.strip() or f"Rscript exited with status {result.returncode}"
+        return status
+
+    lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    status['available'] = True
+    status['version'] = lines[0] if lines else None
+    status['missing'] = lines[1:]
+    status['packages_ok'] = not status['missing']
+    return status
+
+
+class RProbe:
+    """Cached result of probe_r_environment.
+
+    Probing starts R, which takes seconds, so it runs on first use instead of
+    at startup. The result is kept in memory and in a JSON file that every
+    worker process reads, and is trusted for ttl seconds.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path = R_PROBE_CACHE_PATH,
+        ttl: float = R_PROBE_TTL,
+        packages: Sequence[str] = R_REQUIRED_PACKAGES
+    ):
+        self.cache_path = Path(cache_path)
+        self.ttl = ttl
+        self.packages = list(packages)
+        self._status: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, status: Optional[Dict[str, Any]]) -> bool:
+        return (
+            status is not None
+            and status.get('packages') == self.packages
+            and time.time() - status.get('checked_at', 0) < self.ttl
+        )
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, status: Dict[str, Any]) -> None:
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not save R environment check: {str(e)}")
+
+    def status(self, refresh: bool = False) -> Dict[str, Any]:
+        """Availability, version and missing packages of the R environment"""
+        with self._lock:
+            if not refresh:
+                if self._fresh(self._status):
+                    return self._status
+                stored = self._read()
+                if self._fresh(stored):
+                    self._status = stored
+                    return stored
+
+            self._status = probe_r_environment(self.packages)
+            self._write(self._status)
+            if not self._status['available']:
+                logger.warning(f"R is not available: {self._status['error']}")
+            else:
+                logger.info(f"R version: {self._status['version']}")
+                if not self._status['packages_ok']:
+                    logger.warning(
+                        f"Missing R packages: {', '.join(self._status['missing'])}. DESeq2 analysis may fail."
+                    )
+            return self._status
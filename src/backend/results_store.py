@@ -0,0 +1,325 @@
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('padj', 'pvalue', 'abs_lfc', 'lfc', 'base_mean', 'gene')
+DIRECTIONS = ('both', 'up', 'down')
+
+
+def _nan_last_order(keys: np.ndarray, descending: bool = False) -> np.ndarray:
+    """Stable argsort that puts NaN keys last in either direction"""
+    keys = np.asarray(keys, dtype=np.float64)
+    ranked = np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+    return np.argsort(ranked, kind='stable')
+
+
+@dataclass(frozen=True)
+class ResultsTable:
+    """Differential expression results with precomputed sort orders.
+
+    Orders by padj, p-value and |log2FC| (NaN last) are built once per file
+    version, together with the sorted keys, so threshold queries are binary
+    searches and top-N queries are prefix slices.
+    """
+    genes: np.ndarray
+    base_mean: np.ndarray
+    log2_fold_change: np.ndarray
+    p_value: np.ndarray
+    adjusted_p_value: np.ndarray
+    version: Tuple[int, int]
+    has_base_mean: bool = True  # False when the results file has no baseMean column
+    _orders: Dict[str, np.ndarray] = field(default_factory=dict, repr=False, compare=False)
+    _cache: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], version: Tuple[int, int]) -> 'ResultsTable':
+        frame = pd.DataFrame.from_records(records)
+        if 'gene' not in frame.columns:
+            raise ValueError("Invalid DESeq2 results format")
+
+        def column(name: str) -> np.ndarray:
+            if name not in frame.columns:
+                return np.full(len(frame), np.nan)
+            return pd.to_numeric(frame[name], errors='coerce').to_numpy(dtype=np.float64)
+
+        table = cls(
+            genes=frame['gene'].astype(str).to_numpy(dtype=object),
+            base_mean=column('baseMean'),
+            log2_fold_change=column('log2_fold_change'),
+            p_value=column('p_value'),
+            adjusted_p_value=column('adjusted_p_value'),
+            version=version,
+            has_base_mean='baseMean' in frame.columns
+        )
+        table._build_indexes()
+        return table
+
+    def _build_indexes(self) -> None:
+        abs_lfc = np.abs(self.log2_fold_change)
+        self._orders['padj'] = _nan_last_order(self.adjusted_p_value)
+        self._orders['pvalue'] = _nan_last_order(self.p_value)
+        self._orders['abs_lfc'] = _nan_last_order(abs_lfc, descending=True)
+        # Sorted keys for binary searches; NaN sorts last in the padj keys,
+        # and -|lfc| keeps the |lfc| keys ascending
+        self._orders['padj_keys'] = self.adjusted_p_value[self._orders['padj']]
+        self._orders['neg_abs_lfc_keys'] = np.where(
+            np.isnan(abs_lfc), np.inf, -abs_lfc
+        )[self._orders['abs_lfc']]
+
+    def __len__(self) -> int:
+        return len(self.genes)
+
+    def _sort_keys(self, sort: str) -> np.ndarray:
+        if sort == 'padj':
+            return self.adjusted_p_value
+        if sort == 'pvalue':
+            return self.p_value
+        if sort == 'abs_lfc':
+            return np.abs(self.log2_fold_change)
+        if sort == 'lfc':
+            return self.log2_fold_change
+        return self.base_mean
+
+    def _order(self, sort: str, descending: bool) -> np.ndarray:
+        key = f"{sort}:{descending}"
+        if key not in self._orders:
+            if sort == 'gene':
+                order = np.argsort(self.genes.astype(str), kind='stable')
+                self._orders[key] = order[::-1] if descending else order
+            else:
+                self._orders[key] = _nan_last_order(self._sort_keys(sort), descending)
+        return self._orders[key]
+
+    def _rank(self, sort: str, descending: bool) -> np.ndarray:
+        key = f"rank:{sort}:{descending}"
+        if key not in self._orders:
+            rank = np.empty(len(self), dtype=np.intp)
+            rank[self._order(sort, descending)] = np.arange(len(self))
+            self._orders[key] = rank
+        return self._orders[key]
+
+    def query(
+        self,
+        padj_max: Optional[float] = None,
+        pvalue_max: Optional[float] = None,
+        lfc_min: Optional[float] = None,
+        direction: str = 'both',
+        sort: str = 'padj',
+        descending: Optional[bool] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[np.ndarray, int]:
+        """Row positions matching the filters, sorted, and the total match count.
+
+        Filters keep genes with padj < padj_max, p-value < pvalue_max and
+        |log2FC| > lfc_min; direction restricts to up- or down-regulated
+        genes. Candidates come from the most selective precomputed order, so
+        only matching rows are touched.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("offset and limit must be non-negative")
+        if descending is None:
+            descending = sort in ('abs_lfc', 'base_mean')
+
+        candidates = None
+        if padj_max is not None:
+            stop = np.searchsorted(self._orders['padj_keys'], padj_max, side='left')
+            candidates = self._orders['padj'][:stop]
+        if lfc_min is not None:
+            stop = np.searchsorted(self._orders['neg_abs_lfc_keys'], -lfc_min, side='left')
+            if candidates is None or stop < len(candidates):
+                by_lfc = self._orders['abs_lfc'][:stop]
+                if candidates is not None:
+                    by_lfc = by_lfc[self.adjusted_p_value[by_lfc] < padj_max]
+                candidates = by_lfc
+            else:
+                candidates = candidates[np.abs(self.log2_fold_change[candidates]) > lfc_min]
+        if candidates is None:
+            candidates = self._order(sort, descending)
+            presorted = True
+        else:
+            presorted = False
+
+        if pvalue_max is not None:
+            candidates = candidates[self.p_value[candidates] < pvalue_max]
+        if direction == 'up':
+            candidates = candidates[self.log2_fold_change[candidates] > 0]
+        elif direction == 'down':
+            candidates = candidates[self.log2_fold_change[candidates] < 0]
+
+        matched = len(candidates)
+        if not presorted:
+            candidates = candidates[np.argsort(self._rank(sort, descending)[candidates], kind='stable')]
+        stop = None if limit is None else offset + limit
+        return candidates[offset:stop], matched
+
+    def neg_log10_p(self) -> np.ndarray:
+        """-log10 p-values, computed once; p = 0 is clipped to the smallest double"""
+        if 'neg_log10_p' not in self._cache:
+            self._cache['neg_log10_p'] = -np.log10(np.maximum(self.p_value, np.finfo(np.float64).tiny))
+        return self._cache['neg_log10_p']
+
+    def volcano(
+        self,
+        bins: int,
+        pvalue_max: float = 0.05,
+        lfc_min: float = 1.0,
+        labels: Optional[List[str]] = None,
+        viewport: Optional[Tuple[Optional[float], ...]] = None,
+        point_budget: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Volcano plot data at a level of detail that does not grow with the table.
+
+        Significant genes (p < pvalue_max and |log2FC| > lfc_min) and labelled
+        genes inside the viewport are returned as points. The remaining genes
+        are counted on a bins x bins grid over the viewport and only non-empty
+        cells are sent, unless no more than point_budget of them are visible,
+        in which case they are sent as points too. Zooming in therefore
+        returns finer cells and eventually the individual genes.
+        """
+        if bins < 1:
+            raise ValueError("bins must be positive")
+        x = self.log2_fold_change
+        y = self.neg_log10_p()
+        plotted = ~(np.isnan(x) | np.isnan(y))
+
+        x_min, x_max, y_min, y_max = viewport or (None, None, None, None)
+        if plotted.any():
+            x_min = float(np.min(x[plotted])) if x_min is None else x_min
+            x_max = float(np.max(x[plotted])) if x_max is None else x_max
+            y_min = float(np.min(y[plotted])) if y_min is None else y_min
+            y_max = float(np.max(y[plotted])) if y_max is None else y_max
+        else:
+            x_min, x_max, y_min, y_max = (0.0 if v is None else v for v in (x_min, x_max, y_min, y_max))
+        if x_min > x_max or y_min > y_max:
+            raise ValueError("viewport minimum must not exceed its maximum")
+        # A degenerate range still gets a non-zero cell size
+        if x_max == x_min:
+            x_min, x_max = x_min - 0.5, x_max + 0.5
+        if y_max == y_min:
+            y_min, y_max = y_min - 0.5, y_max + 0.5
+
+        visible = plotted & (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        significant = (self.p_value < pvalue_max) & (np.abs(x) > lfc_min)
+        highlighted = significant.copy()
+        if labels:
+            highlighted |= np.isin(self.genes, list(labels))
+        background = visible & ~highlighted
+        n_background = int(background.sum())
+
+        if point_budget is not None and n_background <= point_budget:
+            shown = np.flatnonzero(visible)
+            density = None
+        else:
+            shown = np.flatnonzero(visible & highlighted)
+            rows = np.flatnonzero(background)
+            dx = (x_max - x_min) / bins
+            dy = (y_max - y_min) / bins
+            # Points on the upper edge belong to the last cell
+            ix = np.minimum(((x[rows] - x_min) / dx).astype(np.int64), bins - 1)
+            iy = np.minimum(((y[rows] - y_min) / dy).astype(np.int64), bins - 1)
+            counts = np.bincount(iy * bins + ix, minlength=bins * bins)
+            cells = np.flatnonzero(counts)
+            density = {
+                'bins': bins,
+                'x0': x_min,
+                'dx': dx,
+                'y0': y_min,
+                'dy': dy,
+                'x_index': cells % bins,
+                'y_index': cells // bins,
+                'count': counts[cells]
+            }
+
+        return {
+            'total': len(self),
+            'viewport': {'x_min': x_min, 'x_max': x_max, 'y_min': y_min, 'y_max': y_max},
+            'thresholds': {'pvalue_max': pvalue_max, 'lfc_min': lfc_min},
+            'points': {
+                'gene': self.genes[shown],
+                'log2_fold_change': x[shown],
+                'neg_log10_p': y[shown],
+                'significant': significant[shown]
+            },
+            'binned': n_background if density is not None else 0,
+            'density': density
+        }
+
+    def records(self, rows: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Rows in the deseq2_results.json record schema, NaN as None.
+
+        baseMean is included only when the results file has it.
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+
+        def values(array: np.ndarray) -> List[Optional[float]]:
+            selected = array[rows]
+            return np.where(np.isnan(selected), None, selected).tolist()
+
+        columns = {
+            'gene': self.genes[rows].tolist(),
+            'baseMean': values(self.base_mean) if self.has_base_mean else None,
+            'log2_fold_change': values(self.log2_fold_change),
+            'p_value': values(self.p_value),
+            'adjusted_p_value': values(self.adjusted_p_value)
+        }
+        names = [name for name, column in columns.items() if column is not None]
+        return [dict(zip(names, row)) for row in zip(*(columns[name] for name in names))]
+
+    def records_json(self) -> bytes:
+        """The full table as a JSON array, serialised once per file version"""
+        if 'records_json' not in self._cache:
+            self._cache['records_json'] = dumps(self.records())
+        return self._cache['records_json']
+
+
+class ResultsStore:
+    """Process-wide cache of parsed results files.
+
+    Each access stats the file and re-parses it only when its mtime or size
+    changed, so views share one table instead of json.load-ing per request.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._tables: Dict[str, ResultsTable] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> ResultsTable:
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Results file not found at {path}")
+        st = os.stat(path)
+        version = (st.st_mtime_ns, st.st_size)
+        table = self._tables.get(str(path))
+        if table is not None and table.version == version:
+            return table
+
+        with self._lock:
+            table = self._tables.get(str(path))
+            if table is not None and table.version == version:
+                return table
+            with open(path, 'r') as f:
+                records = json.load(f)
+            if not isinstance(records, list):
+                raise ValueError("Invalid DESeq2 results format")
+            table = ResultsTable.from_records(records, version)
+            self._tables[str(path)] = table
+            self.logger.info(f"Indexed {len(table)} results from {path}")
+            return table
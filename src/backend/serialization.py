@@ -0,0 +1,190 @@
+import json
+import math
+import struct
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from flask import Response, request
+
+from config import JSON_FLOAT_DECIMALS, JSON_NAN_MODE
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+NAN_MODES = ('null', 'zero', 'error')
+
+JSON_MIMETYPE = 'application/json'
+FLOAT32_MIMETYPE = 'application/octet-stream'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+MATRIX_FORMATS = {'json': JSON_MIMETYPE, 'float32': FLOAT32_MIMETYPE, 'arrow': ARROW_MIMETYPE}
+
+
+def _prepare_array(values: np.ndarray, decimals: Optional[int], nan: str) -> np.ndarray:
+    """Apply rounding and NaN handling to a numeric array without leaving NumPy"""
+    values = np.asarray(values)
+    if values.dtype.kind not in 'fc':
+        return np.ascontiguousarray(values)
+
+    if nan == 'error' and not np.isfinite(values).all():
+        raise ValueError("Response contains NaN or infinite values")
+    if nan == 'zero':
+        values = np.nan_to_num(values, nan=0.0, posinf=0.0, neginf=0.0)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    return np.ascontiguousarray(values)
+
+
+def _prepare(obj: Any, decimals: Optional[int], nan: str) -> Any:
+    """Convert pandas objects to arrays and normalise every numeric array"""
+    if isinstance(obj, dict):
+        return {key: _prepare(value, decimals, nan) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_prepare(value, decimals, nan) for value in obj]
+    if isinstance(obj, pd.DataFrame):
+        obj = obj.to_numpy()
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        obj = obj.to_numpy()
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.tolist()
+        return _prepare_array(obj, decimals, nan)
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            if nan == 'error':
+                raise ValueError("Response contains NaN or infinite values")
+            return 0.0 if nan == 'zero' else None
+        return round(obj, decimals) if decimals is not None else obj
+    return obj
+
+
+def _default(obj: Any) -> Any:
+    """Fallback encoder for types the fast path does not handle natively"""
+    if isinstance(obj, np.ndarray):
+        # NaN/inf become null, matching the orjson output
+        if obj.dtype.kind == 'f' and not np.isfinite(obj).all():
+            return np.where(np.isfinite(obj), obj, None).tolist()
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(
+    payload: Any,
+    decimals: Optional[int] = JSON_FLOAT_DECIMALS,
+    nan: str = JSON_NAN_MODE
+) -> bytes:
+    """Serialise a payload that may contain NumPy arrays and pandas objects.
+
+    Arrays are encoded directly by orjson when it is installed, without
+    building intermediate Python lists. NaN/inf values are written as null,
+    replaced by zero or rejected depending on ``nan``.
+    """
+    if nan not in NAN_MODES:
+        raise ValueError(f"nan must be one of {NAN_MODES}")
+    prepared = _prepare(payload, decimals, nan)
+    if orjson is not None:
+        return orjson.dumps(
+            prepared,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(prepared, default=_default, allow_nan=False).encode()
+
+
+def json_response(
+    payload: Any,
+    status: int = 200,
+    decimals: Optional[int] = JSON_FLOAT_DECIMALS,
+    nan: str = JSON_NAN_MODE
+) -> Response:
+    """Build a JSON response through the fast serialisation path"""
+    return Response(dumps(payload, decimals=decimals, nan=nan), status=status, mimetype='application/json')
+
+
+def negotiate_matrix_format() -> str:
+    """Pick json, float32 or arrow from ?format= or the Accept header"""
+    available = ['json', 'float32'] + (['arrow'] if pa is not None else [])
+    requested = request.args.get('format')
+    if requested:
+        if requested not in available:
+            raise ValueError(f"Unsupported format '{requested}'. Available: {', '.join(available)}")
+        return requested
+
+    best = request.accept_mimetypes.best_match(
+        [MATRIX_FORMATS[fmt] for fmt in available],
+        default=JSON_MIMETYPE
+    )
+    # Browsers send */*, which should keep getting JSON
+    if request.accept_mimetypes[JSON_MIMETYPE] >= request.accept_mimetypes[best]:
+        return 'json'
+    return next(fmt for fmt, mimetype in MATRIX_FORMATS.items() if mimetype == best)
+
+
+def float32_body(values: np.ndarray, header: Dict[str, Any]) -> bytes:
+    """Frame a matrix as <uint32 header length><JSON header><float32 data>.
+
+    Everything is little-endian. The header is padded with spaces to a
+    4-byte boundary so the data can be wrapped in a Float32Array in place.
+    """
+    data = np.ascontiguousarray(values, dtype='<f4')
+    header = dict(header, shape=list(data.shape), dtype='float32', byteorder='little')
+    header_bytes = dumps(header)
+    header_bytes += b' ' * (-(4 + len(header_bytes)) % 4)
+    return struct.pack('<I', len(header_bytes)) + header_bytes + data.tobytes()
+
+
+def arrow_body(values: np.ndarray, header: Dict[str, Any], row_labels) -> bytes:
+    """Encode a matrix as an Arrow IPC stream with one float32 column per sample"""
+    data = np.asarray(values, dtype=np.float32)
+    columns = [str(name) for name in header.get('samples', range(data.shape[1]))]
+    arrays = [pa.array(np.asarray(row_labels).astype(str))]
+    arrays += [pa.array(data[:, j]) for j in range(data.shape[1])]
+    schema_header = {key: value for key, value in header.items() if key != 'samples'}
+    batch = pa.RecordBatch.from_arrays(
+        arrays,
+        schema=pa.schema(
+            [pa.field('gene', pa.string())] + [pa.field(name, pa.float32()) for name in columns],
+            metadata={'header': dumps(schema_header)}
+        )
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def matrix_response(
+    payload: Dict[str, Any],
+    matrix_key: str,
+    row_key: str = 'genes',
+    decimals: Optional[int] = JSON_FLOAT_DECIMALS,
+    fmt: Optional[str] = None
+) -> Response:
+    """Return a payload holding one dense matrix in the negotiated format.
+
+    JSON responses are unchanged. The binary formats carry the matrix as
+    float32 and the remaining payload keys as a JSON header (float32) or as
+    schema metadata plus a gene column (arrow).
+    """
+    fmt = fmt or negotiate_matrix_format()
+    if fmt == 'json':
+        return json_response(payload, decimals=decimals)
+
+    values = payload[matrix_key]
+    header = _prepare({key: value for key, value in payload.items() if key != matrix_key}, None, 'null')
+    if fmt == 'float32':
+        body = float32_body(values, header)
+    else:
+        body = arrow_body(values, header, header.get(row_key, []))
+    response = Response(body, mimetype=MATRIX_FORMATS[fmt])
+    response.headers['Vary'] = 'Accept'
+    return response
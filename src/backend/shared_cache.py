@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import HTTP_BODY_CACHE_BYTES, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('hits', 'misses', 'evictions', 'bytes')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    meta TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteCache:
+    """Byte-bounded LRU of blobs in one SQLite file shared by all worker processes.
+
+    Each entry holds a value, a small JSON metadata dict and its size; the
+    total size and the hit, miss and eviction counters live in the same
+    database and are updated in the writing transaction, so every process
+    sees the same accounting. WAL mode lets readers proceed while another
+    process writes.
+    """
+
+    def __init__(
+        self,
+        path: Path = RESPONSE_CACHE_PATH,
+        max_bytes: int = HTTP_BODY_CACHE_BYTES,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread and process; sqlite3 connections are not shared"""
+        connection = getattr(self._local, 'connection', None)
+        # A connection inherited through fork (gunicorn --preload) is not reused
+        if connection is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.executescript(SCHEMA)
+                    connection.executemany(
+                        'INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)',
+                        [(name,) for name in COUNTERS]
+                    )
+                    self._schema_ready = True
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _count(connection: sqlite3.Connection, name: str, delta: int) -> None:
+        connection.execute('UPDATE counters SET value = value + ? WHERE name = ?', (delta, name))
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """Value and metadata for a key, or None; a hit marks the entry as recently used"""
+        try:
+            connection = self._connect()
+            row = connection.execute('SELECT value, meta FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._count(connection, 'misses', 1)
+                return None
+            connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._count(connection, 'hits', 1)
+            return bytes(row[0]), json.loads(row[1])
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed: {str(e)}")
+            return None
+
+    def put(self, key: str, value: bytes, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Store a value, then evict least recently used entries past the bounds"""
+        if len(value) > self.max_bytes:
+            return
+        try:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                previous = connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                if previous is not None:
+                    self._count(connection, 'bytes', -previous[0])
+                connection.execute(
+                    'INSERT OR REPLACE INTO entries (key, value, meta, size, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, sqlite3.Binary(value), json.dumps(meta or {}), len(value), time.time())
+                )
+                self._count(connection, 'bytes', len(value))
+                self._evict(connection)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed: {str(e)}")
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        entries = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        evicted = 0
+        freed = 0
+        if total <= self.max_bytes and entries <= self.max_entries:
+            return
+        for key, size in connection.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if (total - freed <= self.max_bytes and entries - evicted <= self.max_entries) or entries - evicted <= 1:
+                break
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            evicted += 1
+            freed += size
+        self._count(connection, 'bytes', -freed)
+        self._count(connection, 'evictions', evicted)
+
+    def stats(self) -> Dict[str, int]:
+        connection = self._connect()
+        stats = dict(connection.execute('SELECT name, value FROM counters').fetchall())
+        stats['entries'] = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return stats
+
+    def clear(self) -> None:
+        """Remove every entry; the hit and miss counters are kept"""
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('DELETE FROM entries')
+        connection.execute("UPDATE counters SET value = 0 WHERE name = 'bytes'")
+        connection.execute('COMMIT')
@@ -0,0 +1,46 @@
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Wall-clock cost of each startup phase.
+
+    mark(name) closes the phase that began at the previous mark (or at
+    started), so a module can time its own imports by taking perf_counter()
+    before them.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases: List[Tuple[str, float]] = []
+        self._last = self.started
+        self.finished_at: Optional[float] = None
+
+    def mark(self, name: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.phases.append((name, elapsed))
+        self._last = now
+        return elapsed
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started
+
+    def finish(self) -> None:
+        """Log one summary line with the cost of every phase"""
+        self.finished_at = time.time()
+        phases = ', '.join(f"{name} {elapsed * 1000:.0f} ms" for name, elapsed in self.phases)
+        logger.info(f"Startup took {self.total * 1000:.0f} ms (pid {os.getpid()}): {phases}")
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'pid': os.getpid(),
+            'total_ms': round(self.total * 1000, 1),
+            'phases': [{'name': name, 'ms': round(elapsed * 1000, 1)} for name, elapsed in self.phases],
+            'finished_at': self.finished_at
+        }
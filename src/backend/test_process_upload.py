@@ -0,0 +1,77 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processor
+import gene_symbols
+import matrix_io
+from data_processor import DataProcessor
+from expression_store import ExpressionStore
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    # Small chunks so a 20-row file is read as two blocks
+    monkeypatch.setattr(data_processor, 'UPLOAD_CHUNK_ROWS', 10)
+    dp = DataProcessor()
+    dp.data_dir = tmp_path
+    dp.expression_store = ExpressionStore(tmp_path / "log_transformed_data.csv")
+    return dp
+
+
+def counts_csv(value=None, row=None):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        rng.integers(1, 100, size=(20, 4)),
+        index=[f"G{i}" for i in range(20)],
+        columns=[f"S{j}" for j in range(4)]
+    ).astype(object)
+    if row is not None:
+        df.iloc[row, 0] = value
+    return io.StringIO(df.to_csv())
+
+
+def raw_dtype(dp):
+    values, _, _, _ = matrix_io.load_arrays(dp.data_dir / "raw_counts.csv")
+    return values.dtype
+
+
+def test_integer_upload_stays_integer(processor):
+    ok, message, _ = processor.process_upload(counts_csv())
+    assert ok, message
+    assert raw_dtype(processor) == np.int64
+
+
+@pytest.mark.parametrize('row', [2, 15])
+@pytest.mark.parametrize('value', [2.5, ''])
+def test_float_or_missing_value_in_any_chunk(processor, row, value):
+    ok, message, _ = processor.process_upload(counts_csv(value, row))
+    assert ok, message
+    assert raw_dtype(processor) == np.float64
+
+    stored = matrix_io.read_matrix(processor.data_dir / "raw_counts.csv")
+    expected = pd.read_csv(counts_csv(value, row), index_col=0)
+    pd.testing.assert_frame_equal(stored, expected, check_dtype=False, check_names=False)
+    # The CSV copy matches the binary copy
+    csv = pd.read_csv(processor.data_dir / "raw_counts.csv", index_col=0)
+    pd.testing.assert_frame_equal(csv, expected, check_dtype=False, check_names=False)
+
+
+@pytest.mark.parametrize('approved_row', [1, 15])
+def test_approved_symbol_wins_over_earlier_alias(processor, monkeypatch, approved_row):
+    index = gene_symbols.SymbolIndex(['TP53', 'KRAS'], {'P53': 'TP53', 'KRAS2': 'KRAS'})
+    monkeypatch.setattr(data_processor, 'NORMALISE_GENE_SYMBOLS', True)
+    monkeypatch.setattr(gene_symbols, 'load_index', lambda: index)
+    genes = [f"G{i}" for i in range(20)]
+    # The alias comes first; TP53 follows in the same or a later chunk
+    genes[0], genes[approved_row], genes[5] = 'P53', 'TP53', 'KRAS2'
+    df = pd.DataFrame(np.arange(1, 81).reshape(20, 4), index=genes, columns=[f"S{j}" for j in range(4)])
+
+    ok, message, _ = processor.process_upload(io.StringIO(df.to_csv()))
+    assert ok, message
+    stored = matrix_io.read_matrix(processor.data_dir / "raw_counts.csv")
+    assert stored.loc['TP53'].tolist() == df.loc['TP53'].tolist()
+    assert stored.loc['P53'].tolist() == df.loc['P53'].tolist()
+    assert 'KRAS' in stored.index and 'KRAS2' not in stored.index
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from config import (
+    GENOMIC_TOOLS,
+    TOOL_CACHE_DEFAULT_TTL,
+    TOOL_CACHE_DIR,
+    TOOL_CACHE_MAX_BYTES,
+    TOOL_CACHE_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ToolResultCache:
+    """Content-addressed on-disk cache of external tool results.
+
+    Entries are keyed by a hash of the tool, the sorted gene set, the library
+    and the request parameters, and expire after the tool's cache_timeout in
+    GENOMIC_TOOLS. Files are written atomically; the least recently used
+    entries are evicted once the entry count or total size exceeds its bounds.
+    Recency is kept in the file mtimes so it survives restarts.
+
+    Several worker processes can share one directory. Each keeps its own
+    index, updated in place by its own writes and evictions, and adopts
+    entries written by other workers when it finds them on a lookup. Before
+    storing a result it compares the directory mtimes with those it last
+    saw; only when another process has added or removed files is the
+    directory rescanned, so the bounds apply to what is actually on disk.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = TOOL_CACHE_DIR,
+        max_entries: int = TOOL_CACHE_MAX_ENTRIES,
+        max_bytes: int = TOOL_CACHE_MAX_BYTES
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._index: Optional["OrderedDict[str, Tuple[Path, int]]"] = None
+        self._total_bytes = 0
+        self._dir_state: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def make_key(tool: str, genes: Iterable[str], library: Optional[str] = None, **params) -> str:
+        payload = json.dumps({
+            'tool': tool,
+            'genes': sorted(set(map(str, genes))),
+            'library': library,
+            'params': params
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def ttl(tool: str) -> float:
+        return GENOMIC_TOOLS.get(tool, {}).get('cache_timeout', TOOL_CACHE_DEFAULT_TTL)
+
+    def _path(self, tool: str, key: str) -> Path:
+        return self.cache_dir / tool / f"{key}.json"
+
+    def _directory_state(self) -> Dict[str, int]:
+        """mtimes of the cache directory and its tool directories"""
+        state = {}
+        try:
+            state[''] = self.cache_dir.stat().st_mtime_ns
+            for directory in self.cache_dir.iterdir():
+                if directory.is_dir():
+                    state[directory.name] = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+        return state
+
+    def _load_index(self, rescan: bool = False) -> "OrderedDict[str, Tuple[Path, int]]":
+        """Scan the cache directory once, oldest use first (call with the lock held)"""
+        if self._index is None or rescan:
+            # Taken before the scan, so files added during it cause another one
+            self._dir_state = self._directory_state()
+            found = []
+            for path in self.cache_dir.glob('*/*.json'):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_mtime, path.stem, path, st.st_size))
+            self._index = OrderedDict((key, (path, size)) for _, key, path, size in sorted(found))
+            self._total_bytes = sum(size for _, size in self._index.values())
+        return self._index
+
+    def _drop(self, key: str) -> None:
+        entry = self._load_index().pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+            entry[0].unlink(missing_ok=True)
+
+    def get(self, tool: str, genes: Iterable[str], library: Optional[str] = None, **params) -> Optional[Any]:
+        """Cached result, or None when missing or expired"""
+        key = self.make_key(tool, genes, library, **params)
+        with self._lock:
+            return self._get(tool, key)
+
+    def _get(self, tool: str, key: str) -> Optional[Any]:
+        index = self._load_index()
+        if key not in index:
+            # Another worker may have stored it since the directory was scanned
+            path = self._path(tool, key)
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                return None
+            index[key] = (path, size)
+            self._total_bytes += size
+        path = index[key][0]
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            # Evicted by another worker
+            self._drop(key)
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Discarding unreadable tool cache entry {path}: {str(e)}")
+            self._drop(key)
+            return None
+        if entry.get('created', 0) + self.ttl(tool) <= time.time():
+            self._drop(key)
+            return None
+        index.move_to_end(key)
+        os.utime(path)
+        return entry['result']
+
+    def put(self, tool: str, genes: Iterable[str], result: Any, library: Optional[str] = None, **params) -> Path:
+        """Store a result, evicting least recently used entries past the bounds"""
+        key = self.make_key(tool, genes, library, **params)
+        with self._lock:
+            return self._put(tool, key, result, library)
+
+    def _put(self, tool: str, key: str, result: Any, library: Optional[str]) -> Path:
+        index = self._load_index()
+        # Adding or removing an entry changes its directory's mtime; a change
+        # not made by this process means the index no longer matches the disk
+        external_change = self._directory_state() != self._dir_state
+
+        path = self._path(tool, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({'tool': tool, 'library': library, 'created': time.time(), 'result': result}, f)
+        os.replace(tmp_path, path)
+
+        if external_change:
+            index = self._load_index(rescan=True)
+        else:
+            if key in index:
+                self._total_bytes -= index[key][1]
+            size = path.stat().st_size
+            index[key] = (path, size)
+            self._total_bytes += size
+        index.move_to_end(key)
+        while len(index) > 1 and (len(index) > self.max_entries or self._total_bytes > self.max_bytes):
+            self._drop(next(iter(index)))
+        self._dir_state = self._directory_state()
+        return path
+
+    def get_or_compute(
+        self,
+        tool: str,
+        genes: Iterable[str],
+        compute: Callable[[], Any],
+        library: Optional[str] = None,
+        **params
+    ) -> Tuple[Any, bool]:
+        """Return (result, cache_hit), calling compute and storing its result on a miss"""
+        genes = list(genes)
+        key = self.make_key(tool, genes, library, **params)
+        with self._lock:
+            cached = self._get(tool, key)
+            if cached is not None:
+                return cached, True
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Concurrent requests for the same key wait for a single call
+        try:
+            with key_lock:
+                with self._lock:
+                    cached = self._get(tool, key)
+                if cached is not None:
+                    return cached, True
+                result = compute()
+                with self._lock:
+                    self._put(tool, key, result, library)
+                return result, False
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    def clear(self, tool: Optional[str] = None) -> None:
+        """Remove every cached result, or only those of one tool"""
+        with self._lock:
+            index = self._load_index()
+            for key in [k for k, (path, _) in index.items() if tool is None or path.parent.name == tool]:
+                self._drop(key)
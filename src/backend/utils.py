@@ -5,10 +5,15 @@ import numpy as np
 import requests
 from typing import Dict, Any, Optional, Tuple, List
 from flask import jsonify
-from config import DATA_DIR, TOOL_PATHS, GENOMIC_TOOLS
+from config import DATA_DIR, TOOL_PATHS, GENOMIC_TOOLS, HGNC_REST_URL
+import gene_symbols
+from tool_cache import ToolResultCache
 
 logger = logging.getLogger(__name__)
 
+# Shared cache in front of Enrichr and the submit_to_* helpers
+tool_cache = ToolResultCache()
+
 def get_data_path(filename: str) -> str:
     """Get absolute path for data files"""
     path = os.path.join(DATA_DIR, filename)
@@ -135,17 +140,21 @@ def submit_to_string(genes: List[str]) -> Dict[str, Any]:
     """Submit genes to STRING database"""
     try:
         config = GENOMIC_TOOLS["string"]
-        response = requests.post(
-            f"{config['base_url']}/network",
-            json={
-                "identifiers": "\n".join(genes),
-                "species": config["species"],
-                "required_score": config["required_score"],
-                "network_type": config["network_type"]
-            }
-        )
-        response.raise_for_status()
-        return response.json()
+        params = {
+            "species": config["species"],
+            "required_score": config["required_score"],
+            "network_type": config["network_type"]
+        }
+
+        def fetch():
+            response = requests.post(
+                f"{config['base_url']}/network",
+                json={"identifiers": "\n".join(genes), **params}
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return tool_cache.get_or_compute("string", genes, fetch, **params)[0]
     except Exception as e:
         logger.error(f"STRING submission error: {str(e)}")
         raise
@@ -154,16 +163,20 @@ def submit_to_david(genes: List[str]) -> Dict[str, Any]:
     """Submit genes to DAVID"""
     try:
         config = GENOMIC_TOOLS["david"]
-        response = requests.post(
-            config["base_url"],
-            data={
-                "list": "\n".join(genes),
-                "type": "OFFICIAL_GENE_SYMBOL",
-                "annot": ",".join(config["categories"])
-            }
-        )
-        response.raise_for_status()
-        return response.json()
+        params = {
+            "type": "OFFICIAL_GENE_SYMBOL",
+            "annot": ",".join(config["categories"])
+        }
+
+        def fetch():
+            response = requests.post(
+                config["base_url"],
+                data={"list": "\n".join(genes), **params}
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return tool_cache.get_or_compute("david", genes, fetch, **params)[0]
     except Exception as e:
         logger.error(f"DAVID submission error: {str(e)}")
         raise
@@ -172,15 +185,17 @@ def submit_to_gsea(genes: List[str]) -> Dict[str, Any]:
     """Submit genes to GSEA"""
     try:
         config = GENOMIC_TOOLS["gsea"]
-        response = requests.post(
-            f"{config['base_url']}/annotate.jsp",
-            data={
-                "genes": "\n".join(genes),
-                "collections": ",".join(config["collections"])
-            }
-        )
-        response.raise_for_status()
-        return response.json()
+        params = {"collections": ",".join(config["collections"])}
+
+        def fetch():
+            response = requests.post(
+                f"{config['base_url']}/annotate.jsp",
+                data={"genes": "\n".join(genes), **params}
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return tool_cache.get_or_compute("gsea", genes, fetch, **params)[0]
     except Exception as e:
         logger.error(f"GSEA submission error: {str(e)}")
         raise
@@ -189,67 +204,60 @@ def submit_to_genemania(genes: List[str]) -> Dict[str, Any]:
     """Submit genes to GeneMANIA"""
     try:
         config = GENOMIC_TOOLS["genemania"]
-        response = requests.get(
-            f"{config['base_url']}/data/search/{'+'.join(genes)}",
-            params={"organism": config["organism"]}
-        )
-        response.raise_for_status()
-        return response.json()
+        params = {"organism": config["organism"]}
+
+        def fetch():
+            response = requests.get(
+                f"{config['base_url']}/data/search/{'+'.join(genes)}",
+                params=params
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return tool_cache.get_or_compute("genemania", genes, fetch, **params)[0]
     except Exception as e:
         logger.error(f"GeneMANIA submission error: {str(e)}")
         raise
 
-def save_tool_results(tool: str, genes: List[str], results: Dict[str, Any]) -> str:
-    """Save tool results to file"""
+def save_tool_results(tool: str, genes: List[str], results: Dict[str, Any], **params) -> str:
+    """Save tool results to the shared tool cache"""
     try:
-        result_dir = TOOL_PATHS[f"{tool}_results"]
-        filename = f"{'-'.join(genes[:5])}_{len(genes)}_genes.json"
-        filepath = os.path.join(result_dir, filename)
-        
-        with open(filepath, 'w') as f:
-            json.dump(results, f, indent=2)
-            
-        return filepath
+        return str(tool_cache.put(tool, genes, results, **params))
     except Exception as e:
         logger.error(f"Error saving {tool} results: {str(e)}")
         raise
 
-def get_cached_results(tool: str, genes: List[str]) -> Optional[Dict[str, Any]]:
+def get_cached_results(tool: str, genes: List[str], **params) -> Optional[Dict[str, Any]]:
     """Get cached results for a tool and gene list"""
     try:
-        result_dir = TOOL_PATHS[f"{tool}_results"]
-        filename = f"{'-'.join(sorted(genes[:5]))}_{len(genes)}_genes.json"
-        filepath = os.path.join(result_dir, filename)
-        
-        if os.path.exists(filepath):
-            # Check if cache is still valid
-            if os.path.getmtime(filepath) + GENOMIC_TOOLS[tool]['cache_timeout'] > time.time():
-                with open(filepath, 'r') as f:
-                    return json.load(f)
-                    
-        return None
+        return tool_cache.get(tool, genes, **params)
     except Exception as e:
         logger.error(f"Error getting cached results for {tool}: {str(e)}")
         return None
 
 def validate_genes(genes: List[str]) -> Tuple[List[str], List[str]]:
-    """Validate gene symbols and return valid and invalid genes"""
+    """Validate gene symbols and return valid and invalid genes.
+
+    Uses the local HGNC index when a dump is installed; otherwise falls back
+    to one HGNC REST lookup per gene over a shared session.
+    """
     try:
+        index = gene_symbols.load_index()
+        if index is not None:
+            return index.validate(genes)
+
+        logger.warning("No HGNC dump installed; validating genes against the HGNC REST API")
         valid_genes = []
         invalid_genes = []
-        
-        for gene in genes:
-            # Check against HGNC database
-            response = requests.get(
-                f"https://rest.genenames.org/fetch/symbol/{gene}",
-                headers={"Accept": "application/json"}
-            )
-            
-            if response.ok and response.json()['response']['numFound'] > 0:
-                valid_genes.append(gene)
-            else:
-                invalid_genes.append(gene)
-                
+        with requests.Session() as session:
+            session.headers.update({"Accept": "application/json"})
+            for gene in genes:
+                response = session.get(f"{HGNC_REST_URL}/{gene}")
+                if response.ok and response.json()['response']['numFound'] > 0:
+                    valid_genes.append(gene)
+                else:
+                    invalid_genes.append(gene)
+
         return valid_genes, invalid_genes
     except Exception as e:
         logger.error(f"Error validating genes: {str(e)}")
@@ -3,11 +3,45 @@ import * as d3 from 'd3';
 
 const API_BASE_URL = 'http://127.0.0.1:5000/api';
 
+const CANVAS_WIDTH = 1600;
+const CANVAS_HEIGHT = 1000;
+const margin = { top: 120, right: 40, bottom: 20, left: 200 };
+
+// Enhanced color scale with better contrast
+const colorScale = d3.scaleSequential(d3.interpolateRdBu).domain([2, -2]);
+
+// Render a tile's values into an offscreen canvas, one pixel per cell
+const tileImage = (values) => {
+  const rows = values.length;
+  const cols = rows ? values[0].length : 0;
+  const canvas = document.createElement('canvas');
+  canvas.width = Math.max(cols, 1);
+  canvas.height = Math.max(rows, 1);
+  const context = canvas.getContext('2d');
+  const image = context.createImageData(canvas.width, canvas.height);
+  values.forEach((row, i) => {
+    row.forEach((value, j) => {
+      const offset = (i * cols + j) * 4;
+      const color = d3.rgb(value === null ? '#f3f4f6' : colorScale(value));
+      image.data[offset] = color.r;
+      image.data[offset + 1] = color.g;
+      image.data[offset + 2] = color.b;
+      image.data[offset + 3] = 255;
+    });
+  });
+  context.putImageData(image, 0, 0);
+  return canvas;
+};
+
 const HeatmapWithClustering = () => {
-  const [data, setData] = useState(null);
+  const [meta, setMeta] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-  const heatmapRef = useRef();
+  const [hover, setHover] = useState(null);
+  const canvasRef = useRef();
+  const legendRef = useRef();
+  const tilesRef = useRef(new Map());
+  const transformRef = useRef(d3.zoomIdentity);
 
   useEffect(() => {
     fetchData();
@@ -16,13 +50,14 @@ const HeatmapWithClustering = () => {
   const fetchData = async () => {
     setLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/clustering`);
+      const response = await fetch(`${API_BASE_URL}/clustering/tiles`);
       if (!response.ok) {
         const errorData = await response.json();
         throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
       }
       const result = await response.json();
-      setData(result);
+      tilesRef.current.clear();
+      setMeta(result);
     } catch (err) {
       console.error("Error fetching clustering data:", err);
       setError(err.message);
@@ -31,198 +66,183 @@ const HeatmapWithClustering = () => {
     }
   };
 
-  const drawHeatmap = () => {
-    if (!data || !data.expression_data || !data.genes || !data.samples) {
-      console.error("Heatmap data is missing or incomplete:", data);
-      return;
+  const plotWidth = CANVAS_WIDTH - margin.left - margin.right;
+  const plotHeight = CANVAS_HEIGHT - margin.top - margin.bottom;
+
+  // Fetch a tile once; redraw when it arrives
+  const requestTile = (level, row, col) => {
+    const key = `${level}/${row}/${col}`;
+    if (tilesRef.current.has(key)) return tilesRef.current.get(key);
+    tilesRef.current.set(key, null);
+    fetch(`${API_BASE_URL}/clustering/tiles/${key}`)
+      .then((response) => {
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        return response.json();
+      })
+      .then((tile) => {
+        tilesRef.current.set(key, { ...tile, image: tileImage(tile.values) });
+        draw();
+      })
+      .catch((err) => {
+        console.error(`Error fetching heatmap tile ${key}:`, err);
+        tilesRef.current.delete(key);
+      });
+    return null;
+  };
+
+  // Finest level whose rows are still at least one pixel high
+  const levelFor = (scale) => {
+    const genesPerPixel = meta.genes.length / (plotHeight * scale);
+    const samplesPerPixel = meta.samples.length / (plotWidth * scale);
+    const level = meta.levels.find(
+      (l) => l.genes_per_row <= Math.max(genesPerPixel, 1) && l.samples_per_column <= Math.max(samplesPerPixel, 1)
+    );
+    return level || meta.levels[meta.levels.length - 1];
+  };
+
+  // Tiles of a level that intersect the visible gene and sample ranges
+  const visibleTiles = (level, genes, samples) => {
+    const rowSpan = meta.tile_size * level.genes_per_row;
+    const colSpan = meta.tile_size * level.samples_per_column;
+    const tiles = [];
+    const lastRow = Math.min(Math.floor((genes[1] - 1) / rowSpan), level.tiles[0] - 1);
+    const lastCol = Math.min(Math.floor((samples[1] - 1) / colSpan), level.tiles[1] - 1);
+    for (let row = Math.max(Math.floor(genes[0] / rowSpan), 0); row <= lastRow; row++) {
+      for (let col = Math.max(Math.floor(samples[0] / colSpan), 0); col <= lastCol; col++) {
+        tiles.push([level.level, row, col]);
+      }
     }
+    return tiles;
+  };
 
-    // Clear previous SVG elements
-    d3.select(heatmapRef.current).selectAll('*').remove();
-
-    const margin = {
-      top: 200,     
-      right: 100,  
-      bottom: 80,  
-      left: 250     
-    };
-    
-    const width = 2400 - margin.left - margin.right;   
-    const height = 1800 - margin.top - margin.bottom;   
-    
-    const numGenes = data.genes.length;
-    const numSamples = data.samples.length;
-
-    const cellWidth = Math.max(12, width / numSamples);    
-    const cellHeight = Math.max(12, height / numGenes);   
-
-    // Create SVG with larger viewBox
-    const svg = d3.select(heatmapRef.current)
-      .append('svg')
-      .attr('viewBox', `0 0 ${width + margin.left + margin.right} ${height + margin.top + margin.bottom}`)
-      .attr('width', '100%')
-      .attr('height', '100%')
-      .attr('preserveAspectRatio', 'xMidYMid meet')
-      .append('g')
-      .attr('transform', `translate(${margin.left},${margin.top})`);
+  const draw = () => {
+    const canvas = canvasRef.current;
+    if (!canvas || !meta) return;
+    const context = canvas.getContext('2d');
+    const t = transformRef.current;
+    const numGenes = meta.genes.length;
+    const numSamples = meta.samples.length;
+    const cellWidth = (plotWidth / numSamples) * t.k;
+    const cellHeight = (plotHeight / numGenes) * t.k;
 
-    // Add zoom behavior with adjusted boundaries
+    context.clearRect(0, 0, CANVAS_WIDTH, CANVAS_HEIGHT);
+    context.save();
+    context.beginPath();
+    context.rect(margin.left, margin.top, plotWidth, plotHeight);
+    context.clip();
+    context.imageSmoothingEnabled = false;
+
+    // Visible leaf ranges in matrix coordinates
+    const genes = [(-t.y) / cellHeight, (plotHeight - t.y) / cellHeight];
+    const samples = [(-t.x) / cellWidth, (plotWidth - t.x) / cellWidth];
+
+    // The overview underneath keeps the view filled while finer tiles load
+    const target = levelFor(t.k);
+    [meta.levels[0], target].forEach((level, pass) => {
+      if (pass === 1 && level.level === 0) return;
+      visibleTiles(level, genes, samples).forEach(([l, row, col]) => {
+        const tile = requestTile(l, row, col);
+        if (!tile) return;
+        context.drawImage(
+          tile.image,
+          margin.left + t.x + tile.sample_start * cellWidth,
+          margin.top + t.y + tile.gene_start * cellHeight,
+          (tile.sample_stop - tile.sample_start) * cellWidth,
+          (tile.gene_stop - tile.gene_start) * cellHeight
+        );
+      });
+    });
+    context.restore();
+
+    // Labels once rows and columns are large enough to read
+    context.fillStyle = '#111827';
+    context.font = '12px Arial, sans-serif';
+    if (cellHeight >= 10) {
+      context.textAlign = 'end';
+      context.textBaseline = 'middle';
+      for (let i = Math.max(Math.floor(genes[0]), 0); i < Math.min(Math.ceil(genes[1]), numGenes); i++) {
+        context.fillText(meta.genes[i], margin.left - 8, margin.top + t.y + (i + 0.5) * cellHeight);
+      }
+    }
+    if (cellWidth >= 10) {
+      context.textAlign = 'start';
+      for (let j = Math.max(Math.floor(samples[0]), 0); j < Math.min(Math.ceil(samples[1]), numSamples); j++) {
+        context.save();
+        context.translate(margin.left + t.x + (j + 0.5) * cellWidth, margin.top - 8);
+        context.rotate(-Math.PI / 4);
+        context.fillText(meta.samples[j], 0, 0);
+        context.restore();
+      }
+    }
+  };
+
+  const handleMouseMove = (event) => {
+    if (!meta) return;
+    const rect = canvasRef.current.getBoundingClientRect();
+    const x = ((event.clientX - rect.left) * CANVAS_WIDTH) / rect.width - margin.left;
+    const y = ((event.clientY - rect.top) * CANVAS_HEIGHT) / rect.height - margin.top;
+    const t = transformRef.current;
+    const gene = Math.floor((y - t.y) / ((plotHeight / meta.genes.length) * t.k));
+    const sample = Math.floor((x - t.x) / ((plotWidth / meta.samples.length) * t.k));
+    if (x < 0 || y < 0 || gene < 0 || sample < 0 || gene >= meta.genes.length || sample >= meta.samples.length) {
+      setHover(null);
+      return;
+    }
+    setHover({ gene: meta.genes[gene], sample: meta.samples[sample], left: event.pageX + 15, top: event.pageY - 15 });
+  };
+
+  useEffect(() => {
+    if (!meta) return;
     const zoom = d3.zoom()
-      .scaleExtent([0.5, 20])
+      .scaleExtent([1, Math.max(meta.genes.length / 20, 20)])
+      .translateExtent([[0, 0], [plotWidth, plotHeight]])
+      .extent([[0, 0], [plotWidth, plotHeight]])
       .on('zoom', (event) => {
-        svg.attr('transform', event.transform);
+        transformRef.current = event.transform;
+        draw();
       });
+    d3.select(canvasRef.current).call(zoom);
+    draw();
+    drawLegend();
+  }, [meta]);
 
-    d3.select(heatmapRef.current).select('svg')
-      .call(zoom)
-      .call(zoom.transform, d3.zoomIdentity.translate(margin.left, margin.top));
-
-    const { expression_data, genes, samples } = data;
-
-    // Enhanced color scale with better contrast
-    const colorScale = d3.scaleSequential(d3.interpolateRdBu)
-      .domain([2, -2]);
-
-    // Enhanced tooltip
-    const tooltip = d3.select("body").append("div")
-      .attr("class", "tooltip")
-      .style("opacity", 0)
-      .style("position", "absolute")
-      .style("background-color", "white")
-      .style("border", "solid 1px #ccc")
-      .style("border-radius", "6px")
-      .style("padding", "12px")
-      .style("pointer-events", "none")
-      .style("box-shadow", "0 4px 8px rgba(0,0,0,0.1)")
-      .style("font-size", "14px")
-      .style("line-height", "1.5");
-
-    // Draw heatmap cells
-    svg.selectAll('rect')
-      .data(expression_data.flat().map((value, i) => ({
-        row: Math.floor(i / samples.length),
-        col: i % samples.length,
-        value,
-        gene: genes[Math.floor(i / samples.length)],
-        sample: samples[i % samples.length]
-      })))
-      .enter().append('rect')
-      .attr('x', d => d.col * cellWidth)
-      .attr('y', d => d.row * cellHeight)
-      .attr('width', cellWidth)
-      .attr('height', cellHeight)
-      .style('fill', d => colorScale(d.value))
-      .style('stroke-width', 0.5)
-      .style('stroke', '#fff')
-      .on('mouseover', (event, d) => {
-        tooltip.transition().duration(200).style("opacity", 0.9);
-        tooltip.html(`
-          <div style="font-weight: bold; margin-bottom: 4px;">
-            Gene: ${d.gene}
-          </div>
-          <div style="margin-bottom: 4px;">
-            Sample: ${d.sample}
-          </div>
-          <div>
-            Value: ${d.value.toFixed(2)}
-          </div>
-        `)
-          .style("left", `${event.pageX + 15}px`)
-          .style("top", `${event.pageY - 15}px`);
-      })
-      .on('mouseout', () => {
-        tooltip.transition().duration(500).style("opacity", 0);
-      });
+  // Add color scale legend
+  const drawLegend = () => {
+    d3.select(legendRef.current).selectAll('*').remove();
+    const legendWidth = 300;
+    const legendHeight = 20;
+    const svg = d3.select(legendRef.current)
+      .append('svg')
+      .attr('width', legendWidth + 20)
+      .attr('height', legendHeight + 50)
+      .append('g')
+      .attr('transform', 'translate(10, 20)');
 
-    // Add gene labels with improved visibility
-    svg.selectAll('.geneLabel')
-      .data(genes)
-      .enter().append('text')
-      .attr('class', 'geneLabel')
-      .attr('x', -10)
-      .attr('y', (d, i) => i * cellHeight + cellHeight / 2)
-      .style('text-anchor', 'end')
-      .style('dominant-baseline', 'middle')
-      .style('font-size', `${Math.min(cellHeight * 0.9, 14)}px`)
-      .style('font-family', 'Arial, sans-serif')
-      .style('font-weight', '500')
-      .text(d => d);
-
-    // Add sample labels with improved visibility
-    svg.selectAll('.sampleLabel')
-      .data(samples)
-      .enter().append('text')
-      .attr('class', 'sampleLabel')
-      .attr('x', 0)
-      .attr('y', 0)
-      .style('text-anchor', 'start')
-      .style('font-size', `${Math.min(cellWidth * 0.9, 14)}px`)
-      .style('font-family', 'Arial, sans-serif')
-      .style('font-weight', '500')
-      .attr('transform', (d, i) => {
-        const x = i * cellWidth + cellWidth / 2;
-        return `translate(${x}, -10) rotate(-45)`;
-      })
-      .text(d => d);
-
-    // Add color scale legend with larger dimensions
-    const legendWidth = 300;  
-    const legendHeight = 30;  
-    
-    const legendScale = d3.scaleLinear()
-      .domain([-2, 2])
-      .range([0, legendWidth]);
-    
-    const legendAxis = d3.axisBottom(legendScale)
-      .ticks(5)
-      .tickFormat(d3.format(".1f"));
-    
-    const legend = svg.append('g')
-      .attr('class', 'legend')
-      .attr('transform', `translate(${width - legendWidth - 50}, ${-margin.top/2})`);
-    
-    const legendGradient = legend.append('defs')
+    const legendGradient = svg.append('defs')
       .append('linearGradient')
-      .attr('id', 'legend-gradient')
-      .attr('x1', '0%')
-      .attr('x2', '100%')
-      .attr('y1', '0%')
-      .attr('y2', '0%');
-    
+      .attr('id', 'legend-gradient');
     legendGradient.selectAll('stop')
       .data(d3.range(-2, 2.1, 0.1))
       .enter().append('stop')
       .attr('offset', (d, i) => `${(i / 40) * 100}%`)
       .attr('stop-color', d => colorScale(d));
-    
-    legend.append('rect')
+
+    svg.append('rect')
       .attr('width', legendWidth)
       .attr('height', legendHeight)
       .style('fill', 'url(#legend-gradient)')
-      .style('stroke', '#ccc')
-      .style('stroke-width', '1px');
-    
-    legend.append('g')
+      .style('stroke', '#ccc');
+    svg.append('g')
       .attr('transform', `translate(0, ${legendHeight})`)
-      .call(legendAxis)
-      .selectAll('text')
-      .style('font-size', '12px');
-    
-    legend.append('text')
+      .call(d3.axisBottom(d3.scaleLinear().domain([-2, 2]).range([0, legendWidth])).ticks(5).tickFormat(d3.format(".1f")));
+    svg.append('text')
       .attr('x', legendWidth / 2)
-      .attr('y', -10)
+      .attr('y', -6)
       .style('text-anchor', 'middle')
       .style('font-size', '14px')
-      .style('font-weight', '500')
       .text('Expression Z-score');
   };
 
-  useEffect(() => {
-    if (data) {
-      drawHeatmap();
-    }
-  }, [data]);
-
   return (
     <div className="w-full min-h-screen p-8">
       <h2 className="text-3xl font-semibold mb-8">Heatmap with Clustering</h2>
@@ -236,19 +256,28 @@ const HeatmapWithClustering = () => {
           Error: {error}
         </div>
       )}
-      <div 
-        ref={heatmapRef} 
-        className="w-full border border-gray-200 rounded-lg shadow-lg bg-white p-8"
-        style={{
-          height: '1200px',
-          minHeight: '1200px',
-          maxWidth: '100%',
-          margin: '0 auto',
-          overflow: 'hidden'
-        }}
-      />
+      <div ref={legendRef} className="mb-4" />
+      <div className="w-full border border-gray-200 rounded-lg shadow-lg bg-white p-8">
+        <canvas
+          ref={canvasRef}
+          width={CANVAS_WIDTH}
+          height={CANVAS_HEIGHT}
+          style={{ width: '100%', height: 'auto' }}
+          onMouseMove={handleMouseMove}
+          onMouseLeave={() => setHover(null)}
+        />
+      </div>
+      {hover && (
+        <div
+          className="absolute bg-white border border-gray-300 rounded-md p-3 shadow pointer-events-none text-sm"
+          style={{ left: hover.left, top: hover.top }}
+        >
+          <div className="font-bold mb-1">Gene: {hover.gene}</div>
+          <div>Sample: {hover.sample}</div>
+        </div>
+      )}
     </div>
   );
 };
 
-export default HeatmapWithClustering;
\ No newline at end of file
+export default HeatmapWithClustering;
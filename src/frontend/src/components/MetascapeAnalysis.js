@@ -17,6 +17,7 @@ const CONFIG = {
   },
   api: {
     enrichr: 'http://127.0.0.1:5000/api/enrichr_full_analysis', // Updated to backend running on port 5000
+    enrichrBatch: 'http://127.0.0.1:5000/api/enrichr/batch',
   },
   ui: {
     maxDisplayedPathways: 15,
@@ -34,18 +35,21 @@ const GeneExpressionAnalysis = () => {
   const [sortConfig, setSortConfig] = useState({ key: 'combined_score', direction: 'desc' });
   const [selectedLibrary, setSelectedLibrary] = useState(CONFIG.libraries[0].id);
 
+  // Results of every library, fetched together from one gene list upload
+  const [batch, setBatch] = useState(null);
+
   // Fetch data from the backend
-  const fetchData = async (library) => {
+  const fetchData = async (libraries) => {
     try {
       setAnalysisState((prev) => ({ ...prev, status: 'loading' }));
 
-      const response = await fetch(CONFIG.api.enrichr, {
+      const response = await fetch(CONFIG.api.enrichrBatch, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          library: library,
+          libraries: libraries,
         }),
       });
 
@@ -57,7 +61,6 @@ const GeneExpressionAnalysis = () => {
       }
 
       const textResponse = await response.text();
-      console.log('Raw response:', textResponse);
 
       let data;
       try {
@@ -73,12 +76,7 @@ const GeneExpressionAnalysis = () => {
         throw new Error('Server response is missing required data.');
       }
 
-      setAnalysisState({
-        status: 'complete',
-        results: data.enrichment_results,
-        metadata: data.metadata,
-        error: null,
-      });
+      setBatch(data);
     } catch (error) {
       console.error('Full error details:', error);
       setAnalysisState({
@@ -90,10 +88,21 @@ const GeneExpressionAnalysis = () => {
     }
   };
 
-  // Fetch data when the selected library changes
+  // Fetch all libraries once; switching libraries reads from the batch
   useEffect(() => {
-    fetchData(selectedLibrary);
-  }, [selectedLibrary]);
+    fetchData(CONFIG.libraries.map((lib) => lib.id));
+  }, []);
+
+  useEffect(() => {
+    if (!batch) return;
+    const error = batch.errors?.[selectedLibrary];
+    setAnalysisState({
+      status: error ? 'error' : 'complete',
+      results: error ? null : batch.enrichment_results[selectedLibrary] || [],
+      metadata: { ...batch.metadata, library_used: selectedLibrary },
+      error: error || null,
+    });
+  }, [batch, selectedLibrary]);
 
   // Sort the enrichment results
   const handleSort = (key) => {
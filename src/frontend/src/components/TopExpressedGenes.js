@@ -7,19 +7,46 @@ const TopExpressedGenes = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [numGenes, setNumGenes] = useState(10);
+  const [jobStage, setJobStage] = useState(null);
 
   useEffect(() => {
     fetchTopExpressed();
   }, [numGenes]);
 
+  // DESeq2 runs in the background; poll its job until it finishes
+  const waitForJob = async (job) => {
+    let current = job;
+    while (current.status === 'queued' || current.status === 'running') {
+      setJobStage(`${current.stage} (${current.progress}%)`);
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const response = await fetch(`http://127.0.0.1:5000/api/jobs/${current.id}`);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      current = await response.json();
+    }
+    setJobStage(null);
+    if (current.status !== 'succeeded') {
+      throw new Error(current.error || `DESeq2 job ${current.status}`);
+    }
+  };
+
   const fetchTopExpressed = async () => {
     setLoading(true);
     setError(null);
     try {
-      const response = await fetch(`http://127.0.0.1:5000/api/top-expressed?top_n=${numGenes}`, {
+      let response = await fetch(`http://127.0.0.1:5000/api/top-expressed?top_n=${numGenes}`, {
         method: 'GET'
       });
 
+      if (response.status === 202) {
+        const { job } = await response.json();
+        await waitForJob(job);
+        response = await fetch(`http://127.0.0.1:5000/api/top-expressed?top_n=${numGenes}`, {
+          method: 'GET'
+        });
+      }
+
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
@@ -29,6 +56,7 @@ const TopExpressedGenes = () => {
       console.error("Error fetching top expressed genes:", error);
       setError(`Error fetching top expressed genes: ${error.message}`);
     } finally {
+      setJobStage(null);
       setLoading(false);
     }
   };
@@ -69,8 +97,9 @@ const TopExpressedGenes = () => {
         )}
 
         {loading ? (
-          <div className="flex items-center justify-center h-64">
+          <div className="flex flex-col items-center justify-center h-64 gap-3">
             <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-purple-600"></div>
+            {jobStage && <p className="text-sm text-gray-500">{jobStage}</p>}
           </div>
         ) : topExpressed ? (
           <div className="overflow-x-auto">
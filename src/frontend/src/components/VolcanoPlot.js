@@ -2,6 +2,16 @@ import React, { useState, useEffect } from 'react';
 import Plot from 'react-plotly.js';
 
 const API_BASE_URL = 'http://127.0.0.1:5000/api';
+const DENSITY_BINS = 150;
+
+// Expand the sparse density cells into the z grid of a Plotly heatmap
+const densityGrid = (density) => {
+  const z = Array.from({ length: density.bins }, () => new Array(density.bins).fill(null));
+  density.count.forEach((count, i) => {
+    z[density.y_index[i]][density.x_index[i]] = count;
+  });
+  return z;
+};
 
 const VolcanoPlot = () => {
   const [plotData, setPlotData] = useState(null);
@@ -13,27 +23,35 @@ const VolcanoPlot = () => {
     fetchVolcanoData();
   }, []);
 
-  const fetchVolcanoData = async () => {
-    setLoading(true);
+  // Significant genes come back as points, the rest as density cells over
+  // the viewport; zooming re-queries for finer cells
+  const fetchVolcanoData = async (viewport = null) => {
+    if (!viewport) setLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/deseq2`);
+      const params = new URLSearchParams({ mode: 'lod', bins: DENSITY_BINS });
+      if (viewport) {
+        Object.entries(viewport).forEach(([key, value]) => params.set(key, value));
+      }
+      const response = await fetch(`${API_BASE_URL}/volcano_plot?${params}`);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data = await response.json();
       
       // Transform the data for the volcano plot
+      const { points } = data;
       const transformedData = {
-        x: data.map(d => d.log2_fold_change),
-        y: data.map(d => -Math.log10(d.p_value)),
-        genes: data.map(d => d.gene),
-        colors: data.map(d => {
-          const isSignificant = d.p_value < 0.05 && Math.abs(d.log2_fold_change) > 1;
+        x: points.log2_fold_change,
+        y: points.neg_log10_p,
+        genes: points.gene,
+        colors: points.significant.map((isSignificant, i) => {
           if (isSignificant) {
-            return d.log2_fold_change > 0 ? '#ff0000' : '#0000ff';
+            return points.log2_fold_change[i] > 0 ? '#ff0000' : '#0000ff';
           }
           return '#808080';
-        })
+        }),
+        density: data.density,
+        viewport: data.viewport
       };
 
       setPlotData(transformedData);
@@ -45,6 +63,24 @@ const VolcanoPlot = () => {
     }
   };
 
+  const handleRelayout = (event) => {
+    if (event['xaxis.autorange'] || event['yaxis.autorange']) {
+      fetchVolcanoData();
+      return;
+    }
+    const range = (axis) => [event[`${axis}.range[0]`], event[`${axis}.range[1]`]];
+    const [xMin, xMax] = range('xaxis');
+    const [yMin, yMax] = range('yaxis');
+    if (xMin === undefined && yMin === undefined) return;
+    const current = plotData.viewport;
+    fetchVolcanoData({
+      x_min: xMin ?? current.x_min,
+      x_max: xMax ?? current.x_max,
+      y_min: Math.max(yMin ?? current.y_min, 0),
+      y_max: yMax ?? current.y_max,
+    });
+  };
+
   if (loading) {
     return (
       <div className="flex items-center justify-center h-64">
@@ -69,11 +105,11 @@ const VolcanoPlot = () => {
     );
   }
 
-  const plotlyData = [{
+  const pointsTrace = {
     x: plotData.x,
     y: plotData.y,
     mode: 'markers',
-    type: 'scatter',
+    type: 'scattergl',
     text: plotData.genes,
     marker: {
       color: plotData.colors,
@@ -85,7 +121,25 @@ const VolcanoPlot = () => {
       '<b>Log2 Fold Change:</b> %{x:.2f}<br>' +
       '<b>-Log10 P-value:</b> %{y:.2f}<br>' +
       '<extra></extra>'
-  }];
+  };
+
+  const plotlyData = [pointsTrace];
+  if (plotData.density) {
+    const { density } = plotData;
+    plotlyData.unshift({
+      type: 'heatmap',
+      z: densityGrid(density),
+      x0: density.x0 + density.dx / 2,
+      dx: density.dx,
+      y0: density.y0 + density.dy / 2,
+      dy: density.dy,
+      colorscale: [[0, '#e5e5e5'], [1, '#404040']],
+      showscale: false,
+      hovertemplate: '%{z} non-significant genes<extra></extra>'
+    });
+  }
+
+  const { viewport } = plotData;
 
   const layout = {
     title: {
@@ -109,6 +163,8 @@ const VolcanoPlot = () => {
       gridcolor: '#f0f0f0',
     },
     hovermode: 'closest',
+    // Keep the user's zoom when re-queried data arrives
+    uirevision: 'volcano',
     shapes: [
       // Add threshold lines
       {
@@ -116,7 +172,7 @@ const VolcanoPlot = () => {
         x0: -1,
         x1: -1,
         y0: 0,
-        y1: Math.max(...plotData.y),
+        y1: viewport.y_max,
         line: {
           color: 'grey',
           width: 1,
@@ -128,7 +184,7 @@ const VolcanoPlot = () => {
         x0: 1,
         x1: 1,
         y0: 0,
-        y1: Math.max(...plotData.y),
+        y1: viewport.y_max,
         line: {
           color: 'grey',
           width: 1,
@@ -137,8 +193,8 @@ const VolcanoPlot = () => {
       },
       {
         type: 'line',
-        x0: Math.min(...plotData.x),
-        x1: Math.max(...plotData.x),
+        x0: viewport.x_min,
+        x1: viewport.x_max,
         y0: -Math.log10(0.05),
         y1: -Math.log10(0.05),
         line: {
@@ -184,9 +240,11 @@ const VolcanoPlot = () => {
           data={plotlyData}
           layout={layout}
           config={config}
+          onRelayout={handleRelayout}
           onSelected={(eventData) => {
             if (eventData?.points) {
-              setSelectedPoints(eventData.points.map(point => ({
+              const genePoints = eventData.points.filter(point => point.data.type === 'scattergl');
+              setSelectedPoints(genePoints.map(point => ({
                 gene: plotData.genes[point.pointIndex],
                 log2FC: plotData.x[point.pointIndex],
                 pValue: plotData.y[point.pointIndex]